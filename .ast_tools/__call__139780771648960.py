@@ -0,0 +1,5 @@
+def __call__(self, inst: Const(RRInst.OP), r0: Word, r1: Word) -> Word:
+    _cond_0 = inst == RRInst.OP.mul
+    __0_return_0 = r0 * r1
+    __0_return_1 = r0 + r1
+    return __phi(_cond_0, __0_return_0, __0_return_1)
@@ -0,0 +1,22 @@
+@name_outputs(out=isa.Word, out_bit=isa.Bit)
+def __call__(self, inst: Const(isa.Inst), in0: isa.Word, in1: isa.Word, in2: isa.Word, in3: family.Bit) -> (isa.Word, isa.Bit):
+    is_bitop_0 = ~inst[isa.ArithOp].match
+    _cond_2 = ~is_bitop_0
+    arithOp_0 = inst[isa.ArithOp].value
+    op_0 = arithOp_0[0]
+    offset_0 = arithOp_0[1]
+    _cond_0 = op_0 == isa.Op.A
+    __0_return_0 = in0 + in1 + offset_0, in3
+    __0_return_1 = in0 - in1 + offset_0, in3
+    # bit op
+    bitOp_0 = inst[isa.BitOp].value
+    #op = bitOp.op
+    #neg = bitOp.neg
+    op_1 = bitOp_0[0]
+    neg_0 = bitOp_0[1]
+    _cond_1 = op_1 == isa.Op.A
+    res_0 = in0 & in1
+    res_1 = in0 | in1
+    res_2 = __phi(_cond_1, res_0, res_1)
+    __0_return_2 = neg_0.ite(~res_2, res_2), in3
+    return __phi(_cond_2 & _cond_0, __0_return_0, __phi(_cond_2, __0_return_1, __0_return_2))
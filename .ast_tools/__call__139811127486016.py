@@ -0,0 +1,3 @@
+def __call__(self, c: Const(Word)) -> Word:
+    __0_return_0 = c
+    return __0_return_0
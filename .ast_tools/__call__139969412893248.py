@@ -0,0 +1,3 @@
+def __call__(self, a: Word, b: Word) -> Word:
+    __0_return_0 = a + b
+    return __0_return_0
@@ -0,0 +1,3 @@
+def __call__(self, a: Word) -> Word:
+    __0_return_0 = a + 1
+    return __0_return_0
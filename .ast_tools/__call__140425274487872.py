@@ -0,0 +1,137 @@
+def __call__(self, inst: isa.BitInst, val: isa.Word) -> isa.Word:
+    _cond_13 = inst == isa.BitInst.POPCNT
+    cnt_0 = Word(0)
+    cnt_1 = cnt_0 + ((val & (1 << 0)) >> 0)
+    cnt_2 = cnt_1 + ((val & (1 << 1)) >> 1)
+    cnt_3 = cnt_2 + ((val & (1 << 2)) >> 2)
+    cnt_4 = cnt_3 + ((val & (1 << 3)) >> 3)
+    cnt_5 = cnt_4 + ((val & (1 << 4)) >> 4)
+    cnt_6 = cnt_5 + ((val & (1 << 5)) >> 5)
+    cnt_7 = cnt_6 + ((val & (1 << 6)) >> 6)
+    cnt_8 = cnt_7 + ((val & (1 << 7)) >> 7)
+    cnt_9 = cnt_8 + ((val & (1 << 8)) >> 8)
+    cnt_10 = cnt_9 + ((val & (1 << 9)) >> 9)
+    cnt_11 = cnt_10 + ((val & (1 << 10)) >> 10)
+    cnt_12 = cnt_11 + ((val & (1 << 11)) >> 11)
+    cnt_13 = cnt_12 + ((val & (1 << 12)) >> 12)
+    cnt_14 = cnt_13 + ((val & (1 << 13)) >> 13)
+    cnt_15 = cnt_14 + ((val & (1 << 14)) >> 14)
+    cnt_16 = cnt_15 + ((val & (1 << 15)) >> 15)
+    cnt_17 = cnt_16 + ((val & (1 << 16)) >> 16)
+    cnt_18 = cnt_17 + ((val & (1 << 17)) >> 17)
+    cnt_19 = cnt_18 + ((val & (1 << 18)) >> 18)
+    cnt_20 = cnt_19 + ((val & (1 << 19)) >> 19)
+    cnt_21 = cnt_20 + ((val & (1 << 20)) >> 20)
+    cnt_22 = cnt_21 + ((val & (1 << 21)) >> 21)
+    cnt_23 = cnt_22 + ((val & (1 << 22)) >> 22)
+    cnt_24 = cnt_23 + ((val & (1 << 23)) >> 23)
+    cnt_25 = cnt_24 + ((val & (1 << 24)) >> 24)
+    cnt_26 = cnt_25 + ((val & (1 << 25)) >> 25)
+    cnt_27 = cnt_26 + ((val & (1 << 26)) >> 26)
+    cnt_28 = cnt_27 + ((val & (1 << 27)) >> 27)
+    cnt_29 = cnt_28 + ((val & (1 << 28)) >> 28)
+    cnt_30 = cnt_29 + ((val & (1 << 29)) >> 29)
+    cnt_31 = cnt_30 + ((val & (1 << 30)) >> 30)
+    cnt_32 = cnt_31 + ((val & (1 << 31)) >> 31)
+    __0_return_0 = cnt_32
+    _cond_12 = inst == isa.BitInst.CNTLZ
+    _cond_0 = val == 0
+    __0_return_1 = Word(32)
+
+    mask_0 = Word(-1)
+    shft_0 = Word(16)
+    cnt_33 = Word(0)
+    mask_1 = mask_0 << shft_0
+    _cond_1 = (val & mask_1) == 0
+    cnt_34 = cnt_33 + shft_0
+    val_0 = val << shft_0
+    cnt_35 = __phi(_cond_1, cnt_34, cnt_33)
+    val_1 = __phi(_cond_1, val_0, val)
+
+    shft_1 = shft_0 >> 1
+    mask_2 = mask_1 << shft_1
+    _cond_2 = (val_1 & mask_2) == 0
+    cnt_36 = cnt_35 + shft_1
+    val_2 = val_1 << shft_1
+    cnt_37 = __phi(_cond_2, cnt_36, cnt_35)
+    val_3 = __phi(_cond_2, val_2, val_1)
+
+    shft_2 = shft_1 >> 1
+    mask_3 = mask_2 << shft_2
+    _cond_3 = (val_3 & mask_3) == 0
+    cnt_38 = cnt_37 + shft_2
+    val_4 = val_3 << shft_2
+    cnt_39 = __phi(_cond_3, cnt_38, cnt_37)
+    val_5 = __phi(_cond_3, val_4, val_3)
+
+    shft_3 = shft_2 >> 1
+    mask_4 = mask_3 << shft_3
+    _cond_4 = (val_5 & mask_4) == 0
+    cnt_40 = cnt_39 + shft_3
+    val_6 = val_5 << shft_3
+    cnt_41 = __phi(_cond_4, cnt_40, cnt_39)
+    val_7 = __phi(_cond_4, val_6, val_5)
+
+    shft_4 = shft_3 >> 1
+    mask_5 = mask_4 << shft_4
+    _cond_5 = (val_7 & mask_5) == 0
+    cnt_42 = cnt_41 + shft_4
+    val_8 = val_7 << shft_4
+    cnt_43 = __phi(_cond_5, cnt_42, cnt_41)
+    val_9 = __phi(_cond_5, val_8, val_7)
+
+    shft_5 = shft_4 >> 1
+
+    pass
+    __0_return_2 = cnt_43
+    pass
+    _cond_6 = val == 0
+    __0_return_3 = Word(32)
+
+    mask_6 = Word(-1)
+    shft_6 = Word(16)
+    cnt_44 = Word(0)
+    mask_7 = mask_6 >> shft_6
+    _cond_7 = (val & mask_7) == 0
+    cnt_45 = cnt_44 + shft_6
+    val_10 = val >> shft_6
+    cnt_46 = __phi(_cond_7, cnt_45, cnt_44)
+    val_11 = __phi(_cond_7, val_10, val)
+
+    shft_7 = shft_6 >> 1
+    mask_8 = mask_7 >> shft_7
+    _cond_8 = (val_11 & mask_8) == 0
+    cnt_47 = cnt_46 + shft_7
+    val_12 = val_11 >> shft_7
+    cnt_48 = __phi(_cond_8, cnt_47, cnt_46)
+    val_13 = __phi(_cond_8, val_12, val_11)
+
+    shft_8 = shft_7 >> 1
+    mask_9 = mask_8 >> shft_8
+    _cond_9 = (val_13 & mask_9) == 0
+    cnt_49 = cnt_48 + shft_8
+    val_14 = val_13 >> shft_8
+    cnt_50 = __phi(_cond_9, cnt_49, cnt_48)
+    val_15 = __phi(_cond_9, val_14, val_13)
+
+    shft_9 = shft_8 >> 1
+    mask_10 = mask_9 >> shft_9
+    _cond_10 = (val_15 & mask_10) == 0
+    cnt_51 = cnt_50 + shft_9
+    val_16 = val_15 >> shft_9
+    cnt_52 = __phi(_cond_10, cnt_51, cnt_50)
+    val_17 = __phi(_cond_10, val_16, val_15)
+
+    shft_10 = shft_9 >> 1
+    mask_11 = mask_10 >> shft_10
+    _cond_11 = (val_17 & mask_11) == 0
+    cnt_53 = cnt_52 + shft_10
+    val_18 = val_17 >> shft_10
+    cnt_54 = __phi(_cond_11, cnt_53, cnt_52)
+    val_19 = __phi(_cond_11, val_18, val_17)
+
+    shft_11 = shft_10 >> 1
+
+    pass
+    __0_return_4 = cnt_54
+    return __phi(_cond_13, __0_return_0, __phi(_cond_12 & _cond_0, __0_return_1, __phi(_cond_12, __0_return_2, __phi(_cond_6, __0_return_3, __0_return_4))))
@@ -0,0 +1,5 @@
+def __call__(self, lut: isa.LUT_t, bit0: isa.Bit, bit1: isa.Bit, bit2: isa.Bit) -> isa.Bit:
+    i_0 = isa.IDX_t([bit0, bit1, bit2])
+    i_1 = i_0.zext(5)
+    __0_return_0 = ((lut >> i_1) & 1)[0]
+    return __0_return_0
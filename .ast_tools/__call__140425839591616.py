@@ -0,0 +1,4 @@
+@name_outputs(out=Data)
+def __call__(self, in_: Data):
+    __0_return_0 = in_
+    return __0_return_0
@@ -0,0 +1,12 @@
+def __call__(self, inst: Const(Inst), a: Data, b: Data) -> Data:
+    _cond_0 = inst.use_imm
+    b_0 = inst.imm
+    b_1 = __phi(_cond_0, b_0, b)
+    alu_out_0 = self.ALU(inst.op.alu.value, a, b_1)
+    fpu_out_0 = self.FPU(inst.op.fpu.value, a, b_1)
+    _cond_1 = inst.op.alu.match
+    ret_0 = alu_out_0
+    ret_1 = fpu_out_0
+    ret_2 = __phi(_cond_1, ret_0, ret_1)
+    __0_return_0 = ret_2
+    return __0_return_0
@@ -0,0 +1,4 @@
+@name_outputs(out=Data)
+def __call__(self, in0 : Data, in1 : Data):
+    __0_return_0 = in0 + in1
+    return __0_return_0
@@ -0,0 +1,5 @@
+def __call__(self, inst : Const(Inst), in0 : Data, in1 : Data) -> Data:
+    _cond_0 = inst.op == Op.add
+    __0_return_0 = in0 + in1
+    __0_return_1 = inst.imm
+    return __phi(_cond_0, __0_return_0, __0_return_1)
@@ -0,0 +1,6 @@
+def __call__(self, in_: Data) -> Data:
+    in_float_0 = cast(in_)
+    out_float_0 = getattr(in_float_0, op_name)()
+    out_0 = out_float_0.reinterpret_as_bv()
+    __0_return_0 = out_0
+    return __0_return_0
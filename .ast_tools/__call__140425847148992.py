@@ -0,0 +1,3 @@
+def __call__(self, a: Word, b: Word, c: Word) -> Word:
+    __0_return_0 = (a + b) * c
+    return __0_return_0
@@ -0,0 +1,8 @@
+def __call__(self, in0: Bit, in1: Bit) -> (T, Bit):
+    tup_0 = Tc(~in1, in0)
+    _cond_0 = in0
+    res_bit_0 = tup_0[0]
+    res_bit_1 = tup_0[1]
+    res_bit_2 = __phi(_cond_0, res_bit_0, res_bit_1)
+    __0_return_0 = tup_0, res_bit_2
+    return __0_return_0
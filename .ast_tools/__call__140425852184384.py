@@ -0,0 +1,8 @@
+def __call__(self, in0: Bit, in1: Bit) -> S:
+    _cond_0 = in0
+    tup_0 = Tc(~in1, in0)
+    s_0 = Sc(T, tup_0)
+    s_1 = Sc(E, Ec(E.a))
+    s_2 = __phi(_cond_0, s_0, s_1)
+    __0_return_0 = s_2
+    return __0_return_0
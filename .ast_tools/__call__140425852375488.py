@@ -0,0 +1,16 @@
+def __call__(self, op : ALU_op, a : Data, b : Data) -> Data:
+    _cond_3 = op == ALU_op.Add
+    res_0 = a + b
+    _cond_2 = op == ALU_op.Sub
+    res_1 = a-b
+    _cond_1 = op == ALU_op.And
+    res_2 = a & b
+    _cond_0 = op == ALU_op.Or
+    res_3 = a | b
+    res_4 = a ^ b
+    res_5 = __phi(_cond_0, res_3, res_4)
+    res_6 = __phi(_cond_1, res_2, res_5)
+    res_7 = __phi(_cond_2, res_1, res_6)
+    res_8 = __phi(_cond_3, res_0, res_7)
+    __0_return_0 = res_8
+    return __0_return_0
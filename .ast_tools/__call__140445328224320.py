@@ -0,0 +1,19 @@
+@name_outputs(alu_res=Data)
+def __call__(self, inst: Const(Inst), a: Data, b: Data) -> Data:
+    op_0 = inst.alu_op
+    _cond_3 = op_0 == ALUOP.Add
+    res_0 = a + b
+    _cond_2 = op_0 == ALUOP.Sub
+    res_1 = a - b
+    _cond_1 = op_0 == ALUOP.And
+    res_2 = a & b
+    _cond_0 = op_0 == ALUOP.Or
+    res_3 = a | b
+    #ALUOP.XOr, the only other op
+    res_4 = a ^ b
+    res_5 = __phi(_cond_0, res_3, res_4)
+    res_6 = __phi(_cond_1, res_2, res_5)
+    res_7 = __phi(_cond_2, res_1, res_6)
+    res_8 = __phi(_cond_3, res_0, res_7)
+    __0_return_0 = res_8
+    return __0_return_0
@@ -0,0 +1,9 @@
+def __call__(self, inst : Const(Inst), a: Data, b: Data) -> (Data, Data):
+    _cond_0 = inst.Op == Inst.Op.add
+    ret_0 = a + b
+    ret_1 = a - b
+    ret_2 = __phi(_cond_0, ret_0, ret_1)
+    _cond_1 = inst.sel
+    __0_return_0 = ret_2, ret_2
+    __0_return_1 = ~ret_2, ~ret_2
+    return __phi(_cond_1, __0_return_0, __0_return_1)
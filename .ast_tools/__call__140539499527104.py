@@ -0,0 +1,11 @@
+def __call__(self, in0: Bit, in1: Bit) -> (P, T, Bit):
+    tup_0 = Tc(~in1, in0)
+    _cond_0 = tup_0[0]
+    b_0 = BV[3](3)
+    b_1 = BV[3](1)
+    b_2 = __phi(_cond_0, b_0, b_1)
+    p_0 = Pc(a=tup_0, b=b_2)
+    _cond_1 = p_0.b[2]
+    __0_return_0 = p_0, p_0.a, in0
+    __0_return_1 = p_0, tup_0, in1
+    return __phi(_cond_1, __0_return_0, __0_return_1)
@@ -0,0 +1,3 @@
+def __call__(self, bv: Const(BV[2]), bit: Const(Bit)) -> Bit:
+    __0_return_0 = Bit(1)
+    return __0_return_0
@@ -0,0 +1,5 @@
+def __call__(self, sel: Bit) -> E:
+    _cond_0 = sel
+    __0_return_0 = Ec(E.a)
+    __0_return_1 = Ec(E.b)
+    return __phi(_cond_0, __0_return_0, __0_return_1)
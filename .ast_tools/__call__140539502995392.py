@@ -0,0 +1,3 @@
+def __call__(self, in0: Data, in1: Data) -> Data:
+    __0_return_0 = in0 + in1
+    return __0_return_0
@@ -0,0 +1,10 @@
+def __call__(self, op: FPU_op, a: Data, b: Data) -> Data:
+    add_out_0 = self.add(a, b)
+    mul_out_0 = self.mul(a, b)
+    sqrt_out_0 = self.sqrt(a)
+    _cond_1 = op == FPU_op.FPAdd
+    __0_return_0 = add_out_0
+    _cond_0 = op == FPU_op.FPMul
+    __0_return_1 = mul_out_0
+    __0_return_2 = sqrt_out_0
+    return __phi(_cond_1, __0_return_0, __phi(_cond_0, __0_return_1, __0_return_2))
@@ -0,0 +1,3 @@
+def __call__(self, x: Data) -> Data:
+    __0_return_0 = family.BitVector[8](0)
+    return __0_return_0
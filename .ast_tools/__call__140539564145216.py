@@ -0,0 +1,14 @@
+def __call__(self, alu_inst: isa.AluInst, a: isa.Data, b: isa.Data, d: isa.Bit) -> isa.Data:
+
+    a_0 = isa.SData(a)
+    b_0 = isa.SData(b)
+    op_0 = alu_inst.op
+    _cond_1 = op_0 == OP.imm
+    res_0 = isa.SData(alu_inst.imm)
+    _cond_0 = op_0 == OP.Add
+    res_1 = a_0 + b_0
+    res_2 = d.ite(a_0, b_0)
+    res_3 = __phi0(_cond_0, res_1, res_2)
+    res_4 = __phi0(_cond_1, res_0, res_3)
+    __0_return_0 = res_4
+    return __0_return_0
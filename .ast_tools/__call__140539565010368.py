@@ -0,0 +1,286 @@
+@name_outputs(pc_next=isa.Word)
+def __call__(self,
+             inst: isa.Inst,
+             pc: isa.Word) -> isa.Word:
+    # Decode
+    # Inputs:
+    #   inst, pc
+    # Outputs:
+    #   a, b, exec_inst, rd
+    #   lsb_mask, is_branch, is_jump
+    #   branch_offset, cmp_zero, invert,
+    lsb_mask_0 = Word(-1)
+    is_branch_0 = Bit(0)
+    is_jump_0 = Bit(0)
+    branch_offset_0 = Word(0)
+    cmp_zero_0 = Bit(0)
+    invert_0 = Bit(0)
+
+    # Note rd != 0 is implicit enable
+    rd_0 = Idx(0)
+    _cond_10 = inst[isa.OP].match
+    op_inst_0 = inst[isa.OP].value
+    a_0 = self.register_file.load1(op_inst_0.data.rs1)
+    b_0 = self.register_file.load2(op_inst_0.data.rs2)
+    exec_inst_0 = op_inst_0.tag
+    rd_1 = op_inst_0.data.rd
+    _cond_9 = inst[isa.OP_IMM].match
+    op_imm_inst_0 = inst[isa.OP_IMM].value
+    _cond_0 = op_imm_inst_0.arith.match
+    op_imm_arith_inst_0 = op_imm_inst_0.arith.value
+    # Will need to manual add this to the constraints
+    # for mapping there is no SUBI because but can always
+    # do ADDI -imm.  However blocking in the ISA would
+    # radically increase its complexity.
+    pass
+    a_1 = self.register_file.load1(op_imm_arith_inst_0.data.rs1)
+    b_1 = op_imm_arith_inst_0.data.imm.sext(20)
+    exec_inst_1 = ExecInst(arith=op_imm_arith_inst_0.tag)
+    rd_2 = op_imm_arith_inst_0.data.rd
+    pass
+    op_imm_shift_inst_0 = op_imm_inst_0.shift.value
+    a_2 = self.register_file.load1(op_imm_shift_inst_0.data.rs1)
+    b_2 = op_imm_shift_inst_0.data.imm.zext(27)
+    exec_inst_2 = ExecInst(shift=op_imm_shift_inst_0.tag)
+    rd_3 = op_imm_shift_inst_0.data.rd
+    a_3 = __phi(_cond_0, a_1, a_2)
+    b_3 = __phi(_cond_0, b_1, b_2)
+    exec_inst_3 = __phi(_cond_0, exec_inst_1, exec_inst_2)
+    rd_4 = __phi(_cond_0, rd_2, rd_3)
+    _cond_8 = inst[isa.LUI].match
+    lui_inst_0 = inst[isa.LUI].value.data
+    a_4 = Word(0)
+    b_4 = lui_inst_0.imm.sext(12) << 12
+    rd_5 = lui_inst_0.rd
+    exec_inst_4 = ExecInst(arith=isa.ArithInst.ADD)
+    _cond_7 = inst[isa.AUIPC].match
+    auipc_inst_0 = inst[isa.AUIPC].value.data
+    a_5 = pc
+    b_5 = auipc_inst_0.imm.sext(12) << 12
+    rd_6 = auipc_inst_0.rd
+    exec_inst_5 = ExecInst(arith=isa.ArithInst.ADD)
+    _cond_6 = inst[isa.JAL].match
+    is_jump_1 = Bit(1)
+    jal_inst_0 = inst[isa.JAL].value.data
+    a_6 = pc
+    b_6 = jal_inst_0.imm.sext(12) << 1
+    rd_7 = jal_inst_0.rd
+    exec_inst_6 = ExecInst(arith=isa.ArithInst.ADD)
+    _cond_5 = inst[isa.JALR].match
+    is_jump_2 = Bit(1)
+    lsb_mask_1 = ~Word(1)
+    jalr_inst_0 = inst[isa.JALR].value.data
+    a_7 = self.register_file.load1(jalr_inst_0.rs1)
+    b_7 = jalr_inst_0.imm.sext(20)
+    rd_8 = jalr_inst_0.rd
+    exec_inst_7 = ExecInst(arith=isa.ArithInst.ADD)
+    _cond_4 = inst[isa.Branch].match
+    is_branch_1 = Bit(1)
+    branch_inst_0 = inst[isa.Branch].value
+    a_8 = self.register_file.load1(branch_inst_0.data.rs1)
+    b_8 = self.register_file.load2(branch_inst_0.data.rs2)
+    branch_offset_1 = branch_inst_0.data.imm.sext(20) << 1
+
+    # hand coded common sub-expr elimin
+    is_eq_0 = branch_inst_0.tag == isa.BranchInst.BEQ
+    is_ne_0 = branch_inst_0.tag == isa.BranchInst.BNE
+    is_bge_0 = branch_inst_0.tag == isa.BranchInst.BGE
+    is_signed_0 = is_bge_0 | (branch_inst_0.tag == isa.BranchInst.BLT)
+    cmp_ge_0 = is_bge_0 | (branch_inst_0.tag == isa.BranchInst.BGEU)
+    _cond_2 = (is_eq_0 | is_ne_0)
+    # for equality comparisons we use an xor
+    exec_inst_8 = ExecInst(arith=isa.ArithInst.XOR)
+    # compare the output to 0
+    cmp_zero_1 = Bit(1)
+    # invert the result for ne
+    invert_1 = is_ne_0
+    _cond_1 = is_signed_0
+    exec_inst_9 = ExecInst(arith=isa.ArithInst.SLT)
+    exec_inst_10 = ExecInst(arith=isa.ArithInst.SLTU)
+    exec_inst_11 = __phi(_cond_1, exec_inst_9, exec_inst_10)
+    # invert if we are doing a greater than
+    invert_2 = cmp_ge_0
+    cmp_zero_2 = __phi(_cond_2, cmp_zero_1, cmp_zero_0)
+    exec_inst_12 = __phi(_cond_2, exec_inst_8, exec_inst_11)
+    invert_3 = __phi(_cond_2, invert_1, invert_2)
+    _cond_3 = inst[isa.Load].match
+    a_9 = Word(0)
+    b_9 = Word(0)
+    exec_inst_13 = ExecInst(arith=isa.ArithInst.ADD)
+    pass
+    a_10 = Word(0)
+    b_10 = Word(0)
+    exec_inst_14 = ExecInst(arith=isa.ArithInst.ADD)
+    a_11 = __phi(_cond_3, a_9, a_10)
+    b_11 = __phi(_cond_3, b_9, b_10)
+    exec_inst_15 = __phi(_cond_3, exec_inst_13, exec_inst_14)
+    a_12 = __phi(_cond_4, a_8, a_11)
+    b_12 = __phi(_cond_4, b_8, b_11)
+    branch_offset_2 = __phi(_cond_4, branch_offset_1, branch_offset_0)
+    cmp_zero_3 = __phi(_cond_4, cmp_zero_2, cmp_zero_0)
+    exec_inst_16 = __phi(_cond_4, exec_inst_12, exec_inst_15)
+    invert_4 = __phi(_cond_4, invert_3, invert_0)
+    is_branch_2 = __phi(_cond_4, is_branch_1, is_branch_0)
+    a_13 = __phi(_cond_5, a_7, a_12)
+    b_13 = __phi(_cond_5, b_7, b_12)
+    branch_offset_3 = __phi(_cond_5, branch_offset_0, branch_offset_2)
+    cmp_zero_4 = __phi(_cond_5, cmp_zero_0, cmp_zero_3)
+    exec_inst_17 = __phi(_cond_5, exec_inst_7, exec_inst_16)
+    invert_5 = __phi(_cond_5, invert_0, invert_4)
+    is_branch_3 = __phi(_cond_5, is_branch_0, is_branch_2)
+    is_jump_3 = __phi(_cond_5, is_jump_2, is_jump_0)
+    lsb_mask_2 = __phi(_cond_5, lsb_mask_1, lsb_mask_0)
+    rd_9 = __phi(_cond_5, rd_8, rd_0)
+    a_14 = __phi(_cond_6, a_6, a_13)
+    b_14 = __phi(_cond_6, b_6, b_13)
+    branch_offset_4 = __phi(_cond_6, branch_offset_0, branch_offset_3)
+    cmp_zero_5 = __phi(_cond_6, cmp_zero_0, cmp_zero_4)
+    exec_inst_18 = __phi(_cond_6, exec_inst_6, exec_inst_17)
+    invert_6 = __phi(_cond_6, invert_0, invert_5)
+    is_branch_4 = __phi(_cond_6, is_branch_0, is_branch_3)
+    is_jump_4 = __phi(_cond_6, is_jump_1, is_jump_3)
+    lsb_mask_3 = __phi(_cond_6, lsb_mask_0, lsb_mask_2)
+    rd_10 = __phi(_cond_6, rd_7, rd_9)
+    a_15 = __phi(_cond_7, a_5, a_14)
+    b_15 = __phi(_cond_7, b_5, b_14)
+    branch_offset_5 = __phi(_cond_7, branch_offset_0, branch_offset_4)
+    cmp_zero_6 = __phi(_cond_7, cmp_zero_0, cmp_zero_5)
+    exec_inst_19 = __phi(_cond_7, exec_inst_5, exec_inst_18)
+    invert_7 = __phi(_cond_7, invert_0, invert_6)
+    is_branch_5 = __phi(_cond_7, is_branch_0, is_branch_4)
+    is_jump_5 = __phi(_cond_7, is_jump_0, is_jump_4)
+    lsb_mask_4 = __phi(_cond_7, lsb_mask_0, lsb_mask_3)
+    rd_11 = __phi(_cond_7, rd_6, rd_10)
+    a_16 = __phi(_cond_8, a_4, a_15)
+    b_16 = __phi(_cond_8, b_4, b_15)
+    branch_offset_6 = __phi(_cond_8, branch_offset_0, branch_offset_5)
+    cmp_zero_7 = __phi(_cond_8, cmp_zero_0, cmp_zero_6)
+    exec_inst_20 = __phi(_cond_8, exec_inst_4, exec_inst_19)
+    invert_8 = __phi(_cond_8, invert_0, invert_7)
+    is_branch_6 = __phi(_cond_8, is_branch_0, is_branch_5)
+    is_jump_6 = __phi(_cond_8, is_jump_0, is_jump_5)
+    lsb_mask_5 = __phi(_cond_8, lsb_mask_0, lsb_mask_4)
+    rd_12 = __phi(_cond_8, rd_5, rd_11)
+    a_17 = __phi(_cond_9, a_3, a_16)
+    b_17 = __phi(_cond_9, b_3, b_16)
+    branch_offset_7 = __phi(_cond_9, branch_offset_0, branch_offset_6)
+    cmp_zero_8 = __phi(_cond_9, cmp_zero_0, cmp_zero_7)
+    exec_inst_21 = __phi(_cond_9, exec_inst_3, exec_inst_20)
+    invert_9 = __phi(_cond_9, invert_0, invert_8)
+    is_branch_7 = __phi(_cond_9, is_branch_0, is_branch_6)
+    is_jump_7 = __phi(_cond_9, is_jump_0, is_jump_6)
+    lsb_mask_6 = __phi(_cond_9, lsb_mask_0, lsb_mask_5)
+    rd_13 = __phi(_cond_9, rd_4, rd_12)
+    a_18 = __phi(_cond_10, a_0, a_17)
+    b_18 = __phi(_cond_10, b_0, b_17)
+    branch_offset_8 = __phi(_cond_10, branch_offset_0, branch_offset_7)
+    cmp_zero_9 = __phi(_cond_10, cmp_zero_0, cmp_zero_8)
+    exec_inst_22 = __phi(_cond_10, exec_inst_0, exec_inst_21)
+    invert_10 = __phi(_cond_10, invert_0, invert_9)
+    is_branch_8 = __phi(_cond_10, is_branch_0, is_branch_7)
+    is_jump_8 = __phi(_cond_10, is_jump_0, is_jump_7)
+    lsb_mask_7 = __phi(_cond_10, lsb_mask_0, lsb_mask_6)
+    rd_14 = __phi(_cond_10, rd_1, rd_13)
+
+    # Execute
+    # Inputs:
+    #   a, b, exec_inst, lsb_mask, branch_offset
+    # Outputs:
+    #  c, branch_target
+    branch_target_0 = pc + branch_offset_8
+    _cond_27 = exec_inst_22.arith.match
+    arith_inst_0 = exec_inst_22.arith.value
+    _cond_16 = arith_inst_0 == isa.ArithInst.ADD
+    c_0 = a_18 + b_18
+    _cond_15 = arith_inst_0 == isa.ArithInst.SUB
+    c_1 = a_18 - b_18
+    _cond_14 = arith_inst_0 == isa.ArithInst.SLT
+    c_2 = Word(a_18.bvslt(b_18))
+    _cond_13 = arith_inst_0 == isa.ArithInst.SLTU
+    c_3 = Word(a_18.bvult(b_18))
+    _cond_12 = arith_inst_0 == isa.ArithInst.AND
+    c_4 = a_18 & b_18
+    _cond_11 = arith_inst_0 == isa.ArithInst.OR
+    c_5 = a_18 | b_18
+    pass
+    c_6 = a_18 ^ b_18
+    c_7 = __phi(_cond_11, c_5, c_6)
+    c_8 = __phi(_cond_12, c_4, c_7)
+    c_9 = __phi(_cond_13, c_3, c_8)
+    c_10 = __phi(_cond_14, c_2, c_9)
+    c_11 = __phi(_cond_15, c_1, c_10)
+    c_12 = __phi(_cond_16, c_0, c_11)
+    _cond_26 = exec_inst_22.shift.match
+    shift_inst_0 = exec_inst_22.shift.value
+    _cond_18 = shift_inst_0 == isa.ShiftInst.SLL
+    c_13 = a_18.bvshl(b_18)
+    _cond_17 = shift_inst_0 == isa.ShiftInst.SRL
+    c_14 = a_18.bvlshr(b_18)
+    pass
+    c_15 = a_18.bvashr(b_18)
+    c_16 = __phi(_cond_17, c_14, c_15)
+    c_17 = __phi(_cond_18, c_13, c_16)
+    pass
+    muldiv_inst_0 =  exec_inst_22.muldiv.value
+    _cond_25 = muldiv_inst_0 == isa.MulDivInst.MUL
+    c_18 = a_18 * b_18
+    _cond_24 = muldiv_inst_0 == isa.MulDivInst.MULH
+    c_19 = (a_18.sext(Word.size) * b_18.sext(Word.size))[Word.size:]
+    _cond_23 = muldiv_inst_0 == isa.MulDivInst.MULHU
+    c_20 = (a_18.zext(Word.size) * b_18.zext(Word.size))[Word.size:]
+    _cond_22 = muldiv_inst_0 == isa.MulDivInst.MULHSU
+    c_21 = (a_18.sext(Word.size) * b_18.zext(Word.size))[Word.size:]
+    _cond_21 = muldiv_inst_0 == isa.MulDivInst.DIV
+    c_22 = a_18.bvsdiv(b_18)
+    _cond_20 = muldiv_inst_0 == isa.MulDivInst.DIVU
+    c_23 = a_18.bvudiv(b_18)
+    _cond_19 = muldiv_inst_0 == isa.MulDivInst.REM
+    c_24 = a_18.bvsrem(b_18)
+    pass
+    c_25 = a_18.bvurem(b_18)
+    c_26 = __phi(_cond_19, c_24, c_25)
+    c_27 = __phi(_cond_20, c_23, c_26)
+    c_28 = __phi(_cond_21, c_22, c_27)
+    c_29 = __phi(_cond_22, c_21, c_28)
+    c_30 = __phi(_cond_23, c_20, c_29)
+    c_31 = __phi(_cond_24, c_19, c_30)
+    c_32 = __phi(_cond_25, c_18, c_31)
+    c_33 = __phi(_cond_26, c_17, c_32)
+    c_34 = __phi(_cond_27, c_12, c_33)
+
+
+
+    c_35 = c_34 & lsb_mask_7 # clear bottom bit for jalr
+
+    # Commit
+    # Inputs:
+    #   pc, rd, c, is_branch, is_jump
+    #   branch_target, cmp_zero, invert
+    # Outputs:
+    #   pc_next
+    pass
+    pc_next_0 = pc+4
+    _cond_31 = is_branch_8
+    out_0 = Word(0)
+    _cond_28 = cmp_zero_9
+    cond_0 = (c_35 == 0)
+    cond_1 = c_35[0]
+    cond_2 = __phi(_cond_28, cond_0, cond_1)
+
+    cond_3 = cond_2 ^ invert_10
+    _cond_29 = cond_3
+    pc_next_1 = branch_target_0
+    pc_next_2 = __phi(_cond_29, pc_next_1, pc_next_0)
+    _cond_30 = is_jump_8
+    out_1 = pc_next_0
+    pc_next_3 = c_35
+    out_2 = c_35
+    out_3 = __phi(_cond_30, out_1, out_2)
+    pc_next_4 = __phi(_cond_30, pc_next_3, pc_next_0)
+    out_4 = __phi(_cond_31, out_0, out_3)
+    pc_next_5 = __phi(_cond_31, pc_next_2, pc_next_4)
+
+
+    self.register_file.store(rd_14, out_4)
+    __0_return_0 = pc_next_5
+    return __0_return_0
@@ -0,0 +1,5 @@
+def __call__(self, inst: Const(isa.Inst), d0: isa.Data, d1: isa.Data, b0: isa.Bit, b1: isa.Bit, b2: isa.Bit) -> (isa.Data, isa.Bit):
+    alu_out_0 = self.alu(inst.alu_inst, d0, d1, b0)
+    lut_out_0 = self.lut(inst.lut, b0, b1, b2)
+    __0_return_0 = alu_out_0, lut_out_0
+    return __0_return_0
@@ -0,0 +1,9 @@
+def __call__(self, op: Const(Op), a: Word, b: Word, c: Word) -> Word:
+    _cond_2 = op == Op.add
+    __0_return_0 = a + b
+    _cond_1 = op == Op.sub
+    __0_return_1 = a - b
+    _cond_0 = op == Op.mul
+    __0_return_2 = a * b
+    __0_return_3 = a * b + c
+    return __phi(_cond_2, __0_return_0, __phi(_cond_1, __0_return_1, __phi(_cond_0, __0_return_2, __0_return_3)))
@@ -0,0 +1,3 @@
+def __call__(self, a: Word, imm: Const(Word)) -> Word:
+    __0_return_0 = a + imm
+    return __0_return_0
@@ -0,0 +1,10 @@
+def __call__(self, op: Const(Op), a: Word, b: Word) -> Word:
+    _cond_1 = op == Op.add
+    res_0 = a + b
+    _cond_0 = op == Op.and_
+    res_1 = a & b
+    res_2 = ~(a ^ b)
+    res_3 = __phi(_cond_0, res_1, res_2)
+    res_4 = __phi(_cond_1, res_0, res_3)
+    __0_return_0 = res_4
+    return __0_return_0
@@ -0,0 +1,24 @@
+def __call__(self, inst: isa.Inst) -> None:
+    _cond_2 = inst.b.match
+    binst_0 = inst.b.value
+    a_0 = self.register_file.load1(binst_0.rs1)
+    b_0 = self.register_file.load2(binst_0.rs2)
+    rd_0 = binst_0.rd
+    _cond_0 = binst_0.op == isa.BOp.Add
+    c_0 = a_0 + b_0
+    pass
+    c_1 = ~(a_0 | b_0)
+    c_2 = __phi(_cond_0, c_0, c_1)
+    uinst_0 = inst.u.value
+    a_1 = self.register_file.load1(uinst_0.rs1)
+    rd_1 = uinst_0.rd
+    _cond_1 = uinst_0.op == isa.UOp.Inv
+    c_3 = ~a_1
+    pass
+    c_4 = a_1
+    c_5 = __phi(_cond_1, c_3, c_4)
+    a_2 = __phi(_cond_2, a_0, a_1)
+    c_6 = __phi(_cond_2, c_2, c_5)
+    rd_2 = __phi(_cond_2, rd_0, rd_1)
+
+    self.register_file.store(rd_2, c_6)
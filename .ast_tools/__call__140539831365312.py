@@ -0,0 +1,14 @@
+@name_outputs(rd=Word)
+def __call__(self,
+             inst: Const(isa.Inst),
+             rs1: Word,
+             rs2: Word,
+             rd: Initial(Word),
+             ) -> Word:
+
+    self._set_rs1_(rs1)
+    self._set_rs2_(rs2)
+    self._set_rd_(rd)
+    self.reg_pe(inst)
+    __0_return_0 = self.reg_pe.register_file.rd
+    return __0_return_0
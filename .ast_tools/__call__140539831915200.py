@@ -0,0 +1,3 @@
+def __call__(self, in0: BitVector[32], in1: BitVector[32]) -> BitVector[32]:
+    __0_return_0 = in0 + in1
+    return __0_return_0
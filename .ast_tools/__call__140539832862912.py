@@ -0,0 +1,4 @@
+@name_outputs(out=Bit)
+def __call__(self, in_ : Data):
+    __0_return_0 = in_[0]
+    return __0_return_0
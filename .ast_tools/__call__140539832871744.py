@@ -0,0 +1,3 @@
+def __call__(self, const_value : Const(Data)) -> Data:
+    __0_return_0 = const_value
+    return __0_return_0
@@ -0,0 +1,4 @@
+@name_outputs(out=Data)
+def __call__(self, const_value : Const(Data)):
+    __0_return_0 = const_value
+    return __0_return_0
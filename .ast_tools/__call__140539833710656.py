@@ -0,0 +1,5 @@
+def __call__(self, inst: Const(Inst), a: Data, b: Data) -> Data:
+    _cond_0 = inst.Op == Inst.Op.add
+    __0_return_0 = a + b
+    __0_return_1 = ~a
+    return __phi(_cond_0, __0_return_0, __0_return_1)
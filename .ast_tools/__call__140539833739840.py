@@ -0,0 +1,12 @@
+def __call__(self, inst: Const(Inst), r0: Word, r1: Word) -> (Word, Word):
+    _cond_2 = inst.RR.match
+    rr_inst_0 = inst.RR.value
+    _cond_0 = rr_inst_0.OP == RRInst.OP.mul
+    __0_return_0 = r0 * r1, r0
+    __0_return_1 = r0 + r1, r0
+    ri_inst_0 = inst.RI.value
+    imm_0 = ri_inst_0.imm1
+    _cond_1 = ri_inst_0.OP == RIInst.OP.ld_imm
+    __0_return_2 = imm_0, r0
+    __0_return_3 = r0 + imm_0, r0
+    return __phi(_cond_2 & _cond_0, __0_return_0, __phi(_cond_2, __0_return_1, __phi(_cond_1, __0_return_2, __0_return_3)))
@@ -0,0 +1,16 @@
+@name_outputs(pc_next=PC(isa.Word), rd=isa.Word)
+def __call__(self,
+             inst: Const(isa.Inst),
+             pc: PC(isa.Word),
+             rs1: isa.Word,
+             rs2: isa.Word,
+             rd: Initial(isa.Word),
+             ) -> (PC(isa.Word), isa.Word):
+    #pc = Word(0)
+    #rd = Word(0)
+    self._set_rs1_(rs1)
+    self._set_rs2_(rs2)
+    self._set_rd_(rd)
+    pc_next_0 = self.riscv(inst, pc)
+    __0_return_0 = pc_next_0, self.riscv.register_file.rd
+    return __0_return_0
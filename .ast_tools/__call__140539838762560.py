@@ -0,0 +1,12 @@
+def __call__(self, instr: Const(BitVector[2]), in_: Data) -> Data:
+    b1_0 = self.BB1(in_)
+    b2_0 = self.BB2(~in_)
+    b3_0 = ~(self.BB3(in_))
+    _cond_2 = instr == 0
+    __0_return_0 = in_ + 5
+    _cond_1 = instr == 1
+    __0_return_1 = b1_0
+    _cond_0 = instr == 2
+    __0_return_2 = b2_0
+    __0_return_3 = b3_0
+    return __phi(_cond_2, __0_return_0, __phi(_cond_1, __0_return_1, __phi(_cond_0, __0_return_2, __0_return_3)))
@@ -0,0 +1,3 @@
+def __init__(self):
+    self.lut: modules.LUT = modules.LUT()
+    self.alu: modules.ALU = modules.ALU()
@@ -0,0 +1,3 @@
+def __init__(self):
+    self._input_vals = None
+    self._output_vals = None
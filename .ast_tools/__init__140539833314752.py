@@ -0,0 +1,3 @@
+def __init__(self):
+    self.fpadd: Add = Add()
+    self.fpmul: Mul = Mul()
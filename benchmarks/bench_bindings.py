@@ -0,0 +1,82 @@
+"""
+Compares binding enumeration of peak.mapper.utils.create_bindings with the
+original implementation (a filtered itertools.product which was materialized
+for every arch type).
+
+    python -m benchmarks.bench_bindings [--arch 8] [--ir 3] [--width 16]
+"""
+import argparse
+from collections import OrderedDict
+import itertools as it
+import time
+import tracemalloc
+
+from hwtypes import SMTBitVector as SBV, SMTBit as SBit
+
+from peak.mapper.utils import Unbound, _sort_by_t, create_bindings
+
+
+# The implementation of create_bindings before bindings were generated lazily
+def create_bindings_product(arch_flat: dict, ir_flat: dict):
+    arch_by_t = _sort_by_t(arch_flat)
+    ir_by_t = _sort_by_t(ir_flat)
+    if not all((ir_type in arch_by_t) for ir_type in ir_by_t):
+        return []
+
+    possible_matching = OrderedDict()
+    for arch_type, arch_paths in arch_by_t.items():
+        ir_paths = ir_by_t.setdefault(arch_type, [])
+        ir_poss = tuple(ir_paths) + (Unbound,)
+        def filt(poss):
+            ret = True
+            for ir_path in ir_paths:
+                num_ir = poss.count(ir_path)
+                ret = ret and (num_ir==1)
+                if ret is False:
+                    return False
+            return ret
+        type_bindings = []
+        for ir_match in filter(filt, it.product(*[ir_poss for _ in range(len(arch_paths))])):
+            type_bindings.append(list(zip(ir_match, arch_paths)))
+        possible_matching[arch_type] = type_bindings
+    bindings = []
+    for l in it.product(*possible_matching.values()):
+        bindings.append(list(it.chain(*l)))
+    return bindings
+
+
+def measure(f):
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = sum(1 for _ in f())
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, elapsed, peak
+
+
+def run(num_arch, num_ir, width):
+    Data = SBV[width]
+    arch_flat = {**{(f"data{i}",): Data for i in range(num_arch)}, ("bit0",): SBit, ("bit1",): SBit}
+    ir_flat = {**{(f"in{i}",): Data for i in range(num_ir)}, ("bit",): SBit}
+    group = [tuple((f"data{i}",) for i in range(num_arch))]
+
+    results = [
+        ("product", lambda: create_bindings_product(arch_flat, ir_flat)),
+        ("lazy", lambda: create_bindings(arch_flat, ir_flat)),
+        ("lazy+interchangeable", lambda: create_bindings(arch_flat, ir_flat, group)),
+    ]
+    print(f"{num_arch} Data arch inputs, {num_ir} Data ir inputs")
+    print(f"{'method':<24}{'bindings':>10}{'time (ms)':>12}{'peak mem (KiB)':>16}")
+    for name, f in results:
+        count, elapsed, peak = measure(f)
+        print(f"{name:<24}{count:>10}{elapsed*1e3:>12.2f}{peak/1024:>16.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--arch", type=int, default=8)
+    parser.add_argument("--ir", type=int, default=3)
+    parser.add_argument("--width", type=int, default=16)
+    args = parser.parse_args()
+    run(args.arch, args.ir, args.width)
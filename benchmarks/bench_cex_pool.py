@@ -0,0 +1,65 @@
+"""
+Compares the CEGIS iterations (and wall time) of mapping every
+examples/smallir instruction onto an arch with and without the
+counterexample pool shared across the instructions of one ArchMapper.
+
+    python -m benchmarks.bench_cex_pool [--arch sum_pe tagged_pe PE_lut] [--size 32]
+
+The quantifier expansion for narrow forall variables is disabled so every
+instruction is solved with the external loop.
+"""
+import argparse
+import time
+
+from peak.mapper import ArchMapper, MapperStats
+from peak.mapper.mapper import LoopException
+from examples.smallir import gen_SmallIR
+
+from .bench_mapper import ARCHS, Skip
+
+
+def run(arch_name, pool_size, solver_name, itr_limit):
+    arch_fc, kwargs, width = ARCHS[arch_name]()
+    ir = gen_SmallIR(width)
+    arch_mapper = ArchMapper(arch_fc, pool_size=pool_size, **kwargs)
+    iterations = {}
+    rules = 0
+    start = time.perf_counter()
+    for name, ir_fc in ir.instructions.items():
+        stats = MapperStats()
+        ir_mapper = arch_mapper.process_ir_instruction(ir_fc, simple_formula=True, stats=stats)
+        try:
+            rr = ir_mapper.solve(solver_name, external_loop=True, itr_limit=itr_limit)
+        except LoopException:
+            rr = None
+        rules += rr is not None
+        iterations[name] = stats.counters.get("solver_iterations", 0)
+    return iterations, rules, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--arch", nargs="+", default=["sum_pe", "tagged_pe", "PE_lut"])
+    parser.add_argument("--size", type=int, default=32, help="pool entries per sort")
+    parser.add_argument("--solver", default="z3")
+    parser.add_argument("--itr-limit", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    for arch_name in args.arch:
+        try:
+            base, base_rules, base_time = run(arch_name, 0, args.solver, args.itr_limit)
+            pooled, pooled_rules, pooled_time = run(arch_name, args.size, args.solver, args.itr_limit)
+        except Skip as e:
+            print(f"{arch_name}: skipped ({e})")
+            continue
+        print(f"{arch_name}: {base_rules}/{pooled_rules} rules without/with the pool")
+        print(f"{'instruction':<14}{'no pool':>10}{'pool':>10}")
+        for name in base:
+            print(f"{name:<14}{base[name]:>10}{pooled[name]:>10}")
+        print(f"{'total':<14}{sum(base.values()):>10}{sum(pooled.values()):>10}")
+        print(f"{'time (s)':<14}{base_time:>10.2f}{pooled_time:>10.2f}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
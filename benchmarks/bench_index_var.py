@@ -0,0 +1,112 @@
+"""
+Compares the IndexVar encodings by mapping the SmallIR instructions onto the
+bundled example PEs.
+
+    python -m benchmarks.bench_index_var [--arch sum_pe tagged_pe crossbar riscv] [--ivar onehot binary gray hybrid auto]
+
+crossbar is a PE whose operands are selected from 6 data inputs which gives
+the IR instructions many more input bindings than the other examples.
+"""
+import argparse
+import time
+
+from hwtypes import BitVector
+from hwtypes.adt import Enum
+
+from peak import Peak, family_closure, Const
+from peak.mapper import ArchMapper
+from peak.mapper.mapper import LoopException
+from peak.mapper.index_var import ENCODINGS
+from examples.smallir import gen_SmallIR
+
+
+class CrossbarOp(Enum):
+    add = 1
+    sub = 2
+    and_ = 3
+    or_ = 4
+    xor = 5
+
+Word = BitVector[8]
+
+Sel = BitVector[3]
+
+def mux(sel, data):
+    res = data[0]
+    for i in range(1, len(data)):
+        res = (sel == i).ite(data[i], res)
+    return res
+
+@family_closure
+def crossbar_fc(family):
+    @family.assemble(locals(), globals())
+    class Crossbar(Peak):
+        def __call__(self, op: Const(CrossbarOp), sel0: Const(Sel), sel1: Const(Sel), d0: Word, d1: Word, d2: Word, d3: Word, d4: Word, d5: Word) -> Word:
+            a = mux(sel0, [d0, d1, d2, d3, d4, d5])
+            b = mux(sel1, [d0, d1, d2, d3, d4, d5])
+            if op == CrossbarOp.add:
+                res = a + b
+            elif op == CrossbarOp.sub:
+                res = a - b
+            elif op == CrossbarOp.and_:
+                res = a & b
+            elif op == CrossbarOp.or_:
+                res = a | b
+            else:
+                res = a ^ b
+            return res
+    return Crossbar
+
+
+def _archs():
+    from examples.sum_pe.sim import PE_fc as sum_pe_fc
+    from examples.tagged_pe.sim import PE_fc as tagged_pe_fc
+    from examples.riscv import family as riscv_family
+    from examples.riscv.sim import R32I_mappable_fc
+    return dict(
+        sum_pe=(sum_pe_fc, {}, 8),
+        tagged_pe=(tagged_pe_fc, {}, 8),
+        crossbar=(crossbar_fc, {}, 8),
+        riscv=(R32I_mappable_fc, dict(family=riscv_family), 32),
+    )
+
+
+def run(arch_names, ivars, solver_name, itr_limit):
+    archs = _archs()
+    print(f"{'arch':<10}{'IVar':<8}{'max bi':>8}{'bi bits':>9}{'build (s)':>11}{'solve (s)':>11}{'found':>7}{'unknown':>9}")
+    for arch_name in arch_names:
+        arch_fc, kwargs, width = archs[arch_name]
+        ir = gen_SmallIR(width)
+        for IVar in ivars:
+            start = time.perf_counter()
+            arch_mapper = ArchMapper(arch_fc, IVar=IVar, **kwargs)
+            build = time.perf_counter() - start
+            solve = 0
+            found = 0
+            unknown = 0
+            num_bindings = 0
+            bits = 0
+            for ir_fc in ir.instructions.values():
+                start = time.perf_counter()
+                ir_mapper = arch_mapper.process_ir_instruction(ir_fc, simple_formula=True)
+                try:
+                    rr = ir_mapper.solve(solver_name, external_loop=True, itr_limit=itr_limit)
+                except LoopException:
+                    rr = None
+                    unknown += 1
+                solve += time.perf_counter() - start
+                found += rr is not None
+                if ir_mapper.has_bindings and ir_mapper.ib_var.num_entries > num_bindings:
+                    num_bindings = ir_mapper.ib_var.num_entries
+                    bits = ir_mapper.ib_var.var.size
+            print(f"{arch_name:<10}{IVar:<8}{num_bindings:>8}{bits:>9}{build:>11.2f}{solve:>11.2f}{found:>7}{unknown:>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--arch", nargs="+", default=["sum_pe", "tagged_pe", "crossbar"], choices=list(_archs()))
+    parser.add_argument("--ivar", nargs="+", default=[*ENCODINGS, "auto"], choices=[*ENCODINGS, "auto"])
+    parser.add_argument("--solver", default="z3")
+    parser.add_argument("--itr-limit", type=int, default=20)
+    args = parser.parse_args()
+    run(args.arch, args.ivar, args.solver, args.itr_limit)
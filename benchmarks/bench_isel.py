@@ -0,0 +1,57 @@
+"""
+Times select_instructions on random dataflow graphs of examples/smallir
+instructions covered with the rules found on examples/tagged_pe.
+
+    python -m benchmarks.bench_isel [-n 10000 100000 300000] [--seed 0]
+
+Each node is an Add, Sub, And, Or or Nor of two of the 8 nodes before it, so
+the graph mixes long chains with shared nodes.
+"""
+import argparse
+import random
+import time
+
+from peak.mapper import ArchMapper, DataflowGraph, RuleLibrary, select_instructions
+from examples.smallir import gen_SmallIR
+from examples.tagged_pe.sim import PE_fc
+
+OPS = ("Add", "Sub", "And", "Or", "Nor")
+
+
+def random_graph(num_nodes, seed, num_inputs=8):
+    rng = random.Random(seed)
+    graph = DataflowGraph()
+    for _ in range(num_inputs):
+        graph.add_input()
+    for _ in range(num_nodes):
+        n = len(graph)
+        graph.add(rng.choice(OPS), rng.randrange(max(0, n - 8), n), rng.randrange(max(0, n - 8), n))
+    graph.mark_output(len(graph) - 1)
+    return graph
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, nargs="+", default=[10000, 100000, 300000], help="graph sizes")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    ir = gen_SmallIR(8)
+    am = ArchMapper(PE_fc)
+    rules = {name: am.process_ir_instruction(ir.instructions[name]).solve('z3', external_loop=True) for name in OPS}
+    library = RuleLibrary.from_rules(rules)
+    missing = [name for name, rr in rules.items() if rr is None]
+    if missing:
+        raise SystemExit(f"No rule for {missing}")
+
+    print(f"{'nodes':>10}{'tiles':>10}{'select (s)':>12}{'us/node':>10}")
+    for n in args.n:
+        graph = random_graph(n, args.seed)
+        start = time.perf_counter()
+        selection = select_instructions(graph, library)
+        elapsed = time.perf_counter() - start
+        print(f"{n:>10}{len(selection.tiles):>10}{elapsed:>12.3f}{1e6 * elapsed / n:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
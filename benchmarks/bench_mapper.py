@@ -0,0 +1,294 @@
+"""
+Benchmark suite for peak.mapper. Reports the wall time and peak python heap
+usage (tracemalloc) of each case and optionally writes them as json so runs
+can be compared.
+
+    python -m benchmarks.bench_mapper [-k map:sum_pe verify] [--repeat 3] [--json out.json]
+
+Cases:
+    map:<arch>     maps every examples/smallir instruction onto <arch>
+    verify:<arch>  RewriteRule.verify on every rule found by map:<arch>
+    verify_all:<arch>  verify_all (one worker) on the same rules
+    multi          Multi search for a 2 instruction mapping of (a + b) * c
+
+Everything runs locally, no network access is needed.
+
+examples/pe and examples/pe1 are not family closures (they are plain python
+Peak classes) so they can not be mapped. examples/min_pe is a family closure
+but takes no Const input, so there are no encodings to search. Their cases
+are reported as skipped. examples/alu is not mappable either, the alu cases
+map a copy of it written as a family closure (alu_fc).
+"""
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from hwtypes import BitVector
+from hwtypes.adt import Enum, Product, TaggedUnion
+
+from peak import Peak, family_closure, Const, name_outputs
+from peak.mapper import ArchMapper, MapperStats, verify_all
+from peak.mapper.mapper import LoopException
+from peak.mapper.multi import Multi
+from examples.smallir import gen_SmallIR
+
+
+class Skip(Exception):
+    pass
+
+
+def _sum_pe():
+    from examples.sum_pe.sim import PE_fc
+    return PE_fc, {}, 8
+
+def _tagged_pe():
+    from examples.tagged_pe.sim import PE_fc
+    return PE_fc, {}, 8
+
+def _pe_lut():
+    from examples.PE_lut import gen_PE
+    return gen_PE(8), {}, 8
+
+def _riscv():
+    from examples.riscv import family as riscv_family
+    from examples.riscv.sim import R32I_mappable_fc
+    return R32I_mappable_fc, dict(family=riscv_family), 32
+
+#examples/alu is not mappable: gen_alu branches in a nested function, which
+#the SMT family can not rewrite, and its instruction is not Const. This is the
+#same ALU (on the examples/alu ISA) as a mappable family closure.
+@family_closure
+def alu_fc(family):
+    from examples.alu.isa import ALUOP, Inst
+    Data = family.BitVector[16]
+
+    @family.assemble(locals(), globals())
+    class ALU(Peak):
+        @name_outputs(alu_res=Data)
+        def __call__(self, inst: Const(Inst), a: Data, b: Data) -> Data:
+            op = inst.alu_op
+            if op == ALUOP.Add:
+                res = a + b
+            elif op == ALUOP.Sub:
+                res = a - b
+            elif op == ALUOP.And:
+                res = a & b
+            elif op == ALUOP.Or:
+                res = a | b
+            else:
+                #ALUOP.XOr, the only other op
+                res = a ^ b
+            return res
+    return ALU
+
+def _alu():
+    return alu_fc, {}, 16
+
+def _not_mappable(name, reason="is not a family closure"):
+    def arch():
+        raise Skip(f"examples/{name} {reason}")
+    return arch
+
+ARCHS = dict(
+    pe=_not_mappable("pe"),
+    pe1=_not_mappable("pe1"),
+    min_pe=_not_mappable("min_pe", "has no Const input"),
+    alu=_alu,
+    PE_lut=_pe_lut,
+    tagged_pe=_tagged_pe,
+    sum_pe=_sum_pe,
+    riscv=_riscv,
+)
+
+
+#Rules found by the map cases which are verified by the verify cases
+_rules = {}
+
+
+def _map(arch_name, solver_name, itr_limit):
+    arch_fc, kwargs, width = ARCHS[arch_name]()
+    ir = gen_SmallIR(width)
+    def run(stats):
+        arch_mapper = ArchMapper(arch_fc, stats=stats, **kwargs)
+        rules = {}
+        unknown = 0
+        for name, ir_fc in ir.instructions.items():
+            ir_mapper = arch_mapper.process_ir_instruction(ir_fc, simple_formula=True, stats=stats)
+            try:
+                rr = ir_mapper.solve(solver_name, external_loop=True, itr_limit=itr_limit)
+            except LoopException:
+                rr = None
+                unknown += 1
+            if rr is not None:
+                rules[name] = rr
+        _rules[arch_name] = rules
+        return dict(instructions=len(ir.instructions), rules=len(rules), unknown=unknown)
+    return run
+
+
+def _verify(arch_name, solver_name, itr_limit):
+    if arch_name not in _rules:
+        _map(arch_name, solver_name, itr_limit)(None)
+    rules = _rules[arch_name]
+    def run(stats):
+        for rr in rules.values():
+            if rr.verify(solver_name, stats=stats) is not None:
+                raise AssertionError(f"Rule for {arch_name} is not valid")
+        return dict(rules=len(rules))
+    return run
+
+
+def _verify_all(arch_name, solver_name, itr_limit):
+    if arch_name not in _rules:
+        _map(arch_name, solver_name, itr_limit)(None)
+    rules = _rules[arch_name]
+    def run(stats):
+        if any(ce is not None for ce in verify_all(list(rules.values()), workers=1, solver_name=solver_name)):
+            raise AssertionError(f"Rule for {arch_name} is not valid")
+        return dict(rules=len(rules))
+    return run
+
+
+Word = BitVector[8]
+
+#Two operand machine used by the Multi case (as in tests/test_basic_rr.py)
+class RRInst(Product):
+    class OP(Enum):
+        add = 1
+        mul = 2
+
+class RIInst(Product):
+    class OP(Enum):
+        ld_imm = 3
+        add = 4
+    imm = Word
+
+class Inst(TaggedUnion):
+    RR = RRInst
+    RI = RIInst
+
+@family_closure
+def multi_arch_fc(family):
+    @family.assemble(locals(), globals())
+    class Arch(Peak):
+        def __call__(self, inst: Const(Inst), r0: Word, r1: Word) -> (Word, Word):
+            if inst.RR.match:
+                rr_inst = inst.RR.value
+                if rr_inst.OP == RRInst.OP.mul:
+                    return r0 * r1, r0
+                else:
+                    return r0 + r1, r0
+            else:
+                ri_inst = inst.RI.value
+                if ri_inst.OP == RIInst.OP.ld_imm:
+                    return ri_inst.imm, r0
+                else:
+                    return r0 + ri_inst.imm, r0
+    return Arch
+
+@family_closure
+def multi_ir_fc(family):
+    @family.assemble(locals(), globals())
+    class IR(Peak):
+        def __call__(self, a: Word, b: Word, c: Word) -> Word:
+            return (a + b) * c
+    return IR
+
+
+def _multi(solver_name, itr_limit):
+    def run(stats):
+        solve = Multi(multi_arch_fc, multi_ir_fc, 2)
+        rr = solve(maxloops=itr_limit*15, solver_name=solver_name)
+        return dict(found=rr is not None)
+    return run
+
+
+def cases():
+    ret = {}
+    for arch_name in ARCHS:
+        ret[f"map:{arch_name}"] = lambda s, i, arch_name=arch_name: _map(arch_name, s, i)
+    for arch_name in ARCHS:
+        ret[f"verify:{arch_name}"] = lambda s, i, arch_name=arch_name: _verify(arch_name, s, i)
+    for arch_name in ARCHS:
+        ret[f"verify_all:{arch_name}"] = lambda s, i, arch_name=arch_name: _verify_all(arch_name, s, i)
+    ret["multi"] = _multi
+    return ret
+
+
+def measure(run, repeat, memory):
+    times = []
+    stats = None
+    for _ in range(repeat):
+        gc.collect()
+        stats = MapperStats()
+        start = time.perf_counter()
+        info = run(stats)
+        times.append(time.perf_counter() - start)
+    peak = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        run(None)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return dict(
+        status="ok",
+        times=times,
+        time_min=min(times),
+        time_mean=sum(times)/len(times),
+        peak_memory=peak,
+        info=info,
+        stats=stats.to_dict(),
+    )
+
+
+def run_cases(selected, solver_name="z3", itr_limit=20, repeat=1, memory=True):
+    results = {}
+    for name, case in cases().items():
+        if selected and not any(s in name for s in selected):
+            continue
+        try:
+            run = case(solver_name, itr_limit)
+            results[name] = measure(run, repeat, memory)
+        except Skip as e:
+            results[name] = dict(status="skipped", reason=str(e))
+        except Exception as e:
+            results[name] = dict(status="error", reason=f"{type(e).__name__}: {e}")
+        _report(name, results[name])
+    return results
+
+
+def _report(name, result):
+    if result["status"] != "ok":
+        print(f"{name:<20}{result['status']:>10}  {result['reason']}", flush=True)
+        return
+    peak = result["peak_memory"]
+    peak = "-" if peak is None else f"{peak/2**20:.1f}"
+    info = " ".join(f"{k}={v}" for k, v in result["info"].items())
+    print(f"{name:<20}{result['time_min']:>10.2f}{result['time_mean']:>10.2f}{peak:>16}  {info}", flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", nargs="*", default=[], help="only run the cases whose name contains one of these")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--solver", default="z3")
+    parser.add_argument("--itr-limit", type=int, default=20)
+    parser.add_argument("--no-memory", action="store_true", help="skip the (slow) tracemalloc run")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+    print(f"{'case':<20}{'min (s)':>10}{'mean (s)':>10}{'peak mem (MiB)':>16}")
+    results = run_cases(args.k, args.solver, args.itr_limit, args.repeat, not args.no_memory)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(dict(
+                python=sys.version,
+                platform=platform.platform(),
+                solver=args.solver,
+                itr_limit=args.itr_limit,
+                results=results,
+            ), f, indent=2)
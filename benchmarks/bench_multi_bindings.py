@@ -0,0 +1,79 @@
+"""
+Compares the enumeration of the multi instruction bindings of
+peak.mapper.multi.Multi: filtering itertools.product of the per instruction
+bindings (the original implementation) against valid_multi_bindings.
+
+    python -m benchmarks.bench_multi_bindings [--inputs 4] [--ir 3] [-N 1 2 3]
+
+The arch has --inputs data inputs and one data output, the ir has --ir data
+inputs. The product is only filtered when it has at most --max-product
+entries.
+"""
+import argparse
+import itertools as it
+import time
+
+from hwtypes import BitVector
+
+from peak.mapper.multi import create_bindings, valid_multi_bindings
+
+
+def filter_product(all_bindings, ir_paths):
+    def filt(x):
+        bind = [b[x[j]] for j, b in enumerate(all_bindings)]
+        found = [0 for _ in ir_paths]
+        for j, p in enumerate(ir_paths):
+            for binding in bind:
+                for input, _ in binding:
+                    if input == p:
+                        found[j] += 1
+        return all(f in (1,) for f in found)
+    return filter(filt, it.product(*[range(len(bindings)) for bindings in all_bindings]))
+
+
+# The per instruction bindings as built by Multi
+def block_bindings(num_inputs, num_ir, N):
+    Data = BitVector[16]
+    ir_inputs = {("IR_in", f"in{k}"): Data for k in range(num_ir)}
+    all_bindings = []
+    for i in range(N):
+        inputs = dict(ir_inputs)
+        for j in range(i):
+            inputs[("Arch_out", j, "out")] = Data
+        outputs = {("Arch_in", i, f"d{k}"): Data for k in range(num_inputs)}
+        all_bindings.append(create_bindings(inputs, outputs, use_unbound=True))
+    return all_bindings, list(ir_inputs)
+
+
+def measure(f):
+    start = time.perf_counter()
+    count = sum(1 for _ in f())
+    return count, time.perf_counter() - start
+
+
+def run(num_inputs, num_ir, Ns, max_product):
+    print(f"{num_inputs} arch data inputs, {num_ir} ir inputs")
+    print(f"{'N':>3}{'product':>14}{'valid':>10}{'filter (s)':>12}{'constructive (s)':>18}")
+    for N in Ns:
+        all_bindings, ir_paths = block_bindings(num_inputs, num_ir, N)
+        product = 1
+        for bindings in all_bindings:
+            product *= len(bindings)
+        count, new = measure(lambda: valid_multi_bindings(all_bindings, ir_paths))
+        if product <= max_product:
+            old_count, old = measure(lambda: filter_product(all_bindings, ir_paths))
+            assert old_count == count
+            old = f"{old:.2f}"
+        else:
+            old = "-"
+        print(f"{N:>3}{product:>14}{count:>10}{old:>12}{new:>18.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--inputs", type=int, default=4)
+    parser.add_argument("--ir", type=int, default=3)
+    parser.add_argument("-N", type=int, nargs="+", default=[1, 2, 3])
+    parser.add_argument("--max-product", type=int, default=10**7)
+    args = parser.parse_args()
+    run(args.inputs, args.ir, args.N, args.max_product)
@@ -0,0 +1,75 @@
+"""
+Compares loading a rule library stored as a json list of serialize_bindings
+dicts (parsing and building every rule) with opening a RuleDatabase and
+loading the rules of a few instructions.
+
+    python -m benchmarks.bench_rule_db [-n 5000] [--lookup 3]
+
+The library holds -n copies (under distinct names) of the rules found for
+examples/smallir on examples/tagged_pe.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from peak.mapper import ArchMapper, RuleDatabase, read_serialized_bindings, type_signature
+from examples.smallir import gen_SmallIR
+from examples.tagged_pe.sim import PE_fc
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=5000, help="rules in the library")
+    parser.add_argument("--lookup", type=int, default=3, help="instructions looked up")
+    args = parser.parse_args(argv)
+
+    ir = gen_SmallIR(8)
+    am = ArchMapper(PE_fc)
+    found = {}
+    for name, ir_fc in ir.instructions.items():
+        rr = am.process_ir_instruction(ir_fc).solve('z3', external_loop=True)
+        if rr is not None:
+            found[name] = (ir_fc, rr.serialize_bindings(portable=True))
+    base = list(found)
+    library = []
+    for k in range(args.n):
+        name = base[k % len(base)]
+        library.append((f"{name}_{k}", name))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_file = os.path.join(tmp, "rules.json")
+        with open(json_file, "w") as f:
+            json.dump([dict(name=name, rule=found[base_name][1]) for name, base_name in library], f)
+        start = time.perf_counter()
+        with RuleDatabase(os.path.join(tmp, "db")) as db:
+            for name, base_name in library:
+                ir_fc, serialized = found[base_name]
+                db.append_serialized(name, type_signature(ir_fc), serialized)
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with open(json_file) as f:
+            entries = json.load(f)
+        base_of = dict(library)
+        rules = {e["name"]: read_serialized_bindings(e["rule"], found[base_of[e["name"]]][0], PE_fc) for e in entries}
+        json_time = time.perf_counter() - start
+
+        lookup = [name for name, _ in library[:args.lookup]]
+        start = time.perf_counter()
+        with RuleDatabase(os.path.join(tmp, "db"), readonly=True) as db:
+            open_time = time.perf_counter() - start
+            db_rules = {name: db.rules(name, found[base_of[name]][0], PE_fc) for name in lookup}
+        db_time = time.perf_counter() - start
+        assert all(len(rs) == 1 for rs in db_rules.values())
+
+    print(f"{args.n} rules, {len(base)} distinct")
+    print(f"{'json: load every rule':<36}{json_time:>10.3f} s ({len(rules)} rules)")
+    print(f"{'db: build (append)':<36}{build_time:>10.3f} s")
+    print(f"{'db: open':<36}{open_time:>10.3f} s")
+    print(f"{f'db: open + load {len(lookup)} instructions':<36}{db_time:>10.3f} s")
+
+
+if __name__ == "__main__":
+    main()
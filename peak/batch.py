@@ -0,0 +1,588 @@
+'''
+Bit and BitVector types whose values are numpy arrays of lanes, so that one
+call of a peak object in the BatchPyFamily evaluates a whole batch of inputs.
+
+A value holds either one lane (a constant, which broadcasts) or n lanes.
+Lists of ints and arrays are read as lanes while lists of Bits are read as
+bits (least significant first) like hwtypes does. The semantics of every
+operation match hwtypes.BitVector lane by lane.
+BitVectors up to 64 bits are stored as uint64 and wider ones as python
+ints (object arrays).
+'''
+import functools
+import typing as tp
+
+import numpy as np
+
+import hwtypes
+from hwtypes import AbstractBit, AbstractBitVector, TypeFamily
+from hwtypes.bit_vector_abc import InconsistentSizeError
+from hwtypes.bit_vector_util import build_ite
+from hwtypes.modifiers import strip_modifiers
+
+
+def _lanes(value):
+    return np.atleast_1d(value)
+
+def _dtype(size):
+    return np.uint64 if size <= 64 else object
+
+def _mask(size):
+    return (1 << size) - 1
+
+#An int in the storage of a BitVector of size
+def _const(value, size):
+    return np.uint64(value) if size <= 64 else value
+
+#Casts an array of non negative ints to the storage of a BitVector of size
+def _cast(value, size):
+    dtype = _dtype(size)
+    if value.dtype == dtype:
+        return value
+    if dtype is object:
+        return np.array([int(v) for v in value.ravel()], dtype=object).reshape(value.shape)
+    return value.astype(np.uint64)
+
+#Lanes of value (in the storage of size) wrapped into [0, 2**size)
+def _from_lanes(value, size):
+    value = _lanes(np.asarray(value))
+    mask = _mask(size)
+    if value.dtype == object or size > 64:
+        #Negative ints wrap like hwtypes
+        value = np.array([int(v) & mask for v in value.ravel()], dtype=object).reshape(value.shape)
+        return _cast(value, size)
+    if value.dtype.kind == 'b':
+        return value.astype(np.uint64)
+    if value.dtype.kind == 'u':
+        return value.astype(np.uint64) & np.uint64(mask)
+    if value.dtype.kind == 'i':
+        return value.astype(np.int64).astype(np.uint64) & np.uint64(mask)
+    raise TypeError(f'Cannot construct BatchBitVector[{size}] from {value.dtype}')
+
+#The lanes of a hwtypes value, list of values or array
+def _as_array(value):
+    if isinstance(value, (hwtypes.Bit, hwtypes.BitVector)):
+        return np.array([int(value)], dtype=object)
+    if isinstance(value, (list, tuple)):
+        return np.array([int(v) for v in value], dtype=object)
+    return value
+
+
+def _bit_cast(fn):
+    @functools.wraps(fn)
+    def wrapped(self, other):
+        if not isinstance(other, BatchBit):
+            try:
+                other = BatchBit(other)
+            except (TypeError, ValueError):
+                return NotImplemented
+        return fn(self, other)
+    return wrapped
+
+
+class BatchBit(AbstractBit):
+    @staticmethod
+    def get_family() -> TypeFamily:
+        return _Family_
+
+    def __init__(self, value):
+        if isinstance(value, BatchBit):
+            self._value = value._value
+            return
+        value = np.asarray(_as_array(value))
+        if value.dtype.kind == 'b':
+            value = _lanes(value)
+        elif value.dtype.kind in 'iuO':
+            value = _lanes(value)
+            if not np.all((value == 0) | (value == 1)):
+                raise ValueError('BatchBit lanes must be 0 or 1')
+            value = value.astype(bool)
+        else:
+            raise TypeError(f"Can't coerce {value.dtype} to BatchBit")
+        self._value = value
+
+    @property
+    def value(self) -> np.ndarray:
+        return self._value
+
+    def __len__(self):
+        return len(self._value)
+
+    def __invert__(self):
+        return type(self)(~self._value)
+
+    @_bit_cast
+    def __eq__(self, other):
+        return type(self)(self._value == other._value)
+
+    @_bit_cast
+    def __ne__(self, other):
+        return type(self)(self._value != other._value)
+
+    @_bit_cast
+    def __and__(self, other):
+        return type(self)(self._value & other._value)
+
+    @_bit_cast
+    def __or__(self, other):
+        return type(self)(self._value | other._value)
+
+    @_bit_cast
+    def __xor__(self, other):
+        return type(self)(self._value ^ other._value)
+
+    __rand__ = __and__
+    __ror__ = __or__
+    __rxor__ = __xor__
+
+    def ite(self, t_branch, f_branch):
+        def _ite(select, t_branch, f_branch):
+            if isinstance(t_branch, BatchBit):
+                return np.where(select._value, t_branch._value, f_branch._value)
+            size = t_branch.size
+            return np.where(select._value, _cast(t_branch._value, size), _cast(f_branch._value, size))
+
+        return build_ite(_ite, self, t_branch, f_branch)
+
+    #Only a single lane has a python truth value
+    def __bool__(self) -> bool:
+        if len(self._value) != 1:
+            raise TypeError('A BatchBit with several lanes cannot be converted to bool')
+        return bool(self._value[0])
+
+    def __int__(self) -> int:
+        return int(bool(self))
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self._value.astype(int).tolist()})'
+
+    def __hash__(self) -> int:
+        return hash((type(self), self._value.tobytes()))
+
+    def lanes(self) -> tp.List[hwtypes.Bit]:
+        return [hwtypes.Bit(bool(v)) for v in self._value]
+
+
+def _coerce(T, val):
+    if not isinstance(val, BatchBitVector):
+        return T(val)
+    elif val.size != T.size:
+        raise InconsistentSizeError('Inconsistent size')
+    else:
+        return val
+
+def _bv_cast(fn):
+    @functools.wraps(fn)
+    def wrapped(self, other):
+        other = _coerce(type(self), other)
+        return fn(self, other)
+    return wrapped
+
+#Defines a python operator from a bv method like hwtypes.BitVector does
+def _operator(method):
+    def op(self, other):
+        try:
+            return getattr(self, method)(other)
+        except InconsistentSizeError as e:
+            raise e from None
+        except (TypeError, ValueError):
+            return NotImplemented
+    return op
+
+
+class BatchBitVector(AbstractBitVector):
+    @staticmethod
+    def get_family() -> TypeFamily:
+        return _Family_
+
+    def __init__(self, value=0):
+        size = self.size
+        if isinstance(value, BatchBitVector):
+            value = _from_lanes(value._value, size)
+        elif isinstance(value, BatchBit):
+            value = _cast(value._value.astype(np.uint64), size)
+        elif isinstance(value, int):
+            value = _from_lanes(np.array([value], dtype=object), size)
+        elif isinstance(value, (list, tuple)) and value and all(isinstance(v, AbstractBit) for v in value):
+            if len(value) > size:
+                raise ValueError(f'Too many bits for {type(self)}')
+            value = functools.reduce(BatchBitVector.concat, (BatchBitVector[1](BatchBit(v)) for v in value))
+            value = _cast(value._value, size)
+        else:
+            value = _from_lanes(_as_array(value), size)
+        self._value = value
+
+    @classmethod
+    def make_constant(cls, value, size=None):
+        if size is None:
+            return cls(value)
+        else:
+            return cls.unsized_t[size](value)
+
+    @property
+    def value(self) -> np.ndarray:
+        return self._value
+
+    def lanes(self) -> tp.List[hwtypes.BitVector]:
+        T = hwtypes.BitVector[self.size]
+        return [T(int(v)) for v in self._value]
+
+    def __hash__(self):
+        return hash((type(self), tuple(int(v) for v in self._value)))
+
+    def __repr__(self):
+        return f'{type(self).__name__}({[int(v) for v in self._value]})'
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def num_bits(self):
+        return self.size
+
+    #Wraps the ints in value into a BitVector of size (default self.size)
+    def _wrap(self, value, size=None):
+        T = type(self) if size is None else type(self).unsized_t[size]
+        ret = T.__new__(T)
+        ret._value = _from_lanes(value, T.size)
+        return ret
+
+    #value is already in [0, 2**size) and in the storage of self.size
+    def _new(self, value):
+        ret = type(self).__new__(type(self))
+        ret._value = _lanes(value)
+        return ret
+
+    def as_uint(self) -> np.ndarray:
+        return self._value
+
+    def as_sint(self) -> np.ndarray:
+        size = self.size
+        if size <= 64:
+            v = self._value
+            if size == 64:
+                return v.view(np.int64)
+            v = v.astype(np.int64)
+            return v - (((v >> (size - 1)) & 1) << size)
+        return np.array([int(v) - (1 << size) if (int(v) >> (size - 1)) & 1 else int(v) for v in self._value], dtype=object)
+
+    as_int = as_sint
+
+    #Wraps signed results back into [0, 2**size)
+    def _from_sint(self, value):
+        if self.size <= 64:
+            return self._new(value.astype(np.uint64) & np.uint64(_mask(self.size)))
+        return self._wrap(value)
+
+    def _shift(self, other):
+        #Shift amounts saturate at size (which shifts every bit out)
+        size = self.size
+        s = other._value
+        if size > 64:
+            s = np.array([min(int(v), size) for v in s], dtype=object)
+            return s, s >= size
+        big = s >= size
+        return np.minimum(s, np.uint64(size - 1)), big
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.size)
+            if step != 1:
+                raise NotImplementedError('Slices with a step')
+            width = max(stop - start, 0)
+            return self._wrap(self._value >> _const(start, self.size), width)
+        elif isinstance(index, int):
+            if index < 0:
+                index = self.size + index
+            if not (0 <= index < self.size):
+                raise IndexError()
+            return BatchBit((self._value >> _const(index, self.size)) & 1)
+        else:
+            raise TypeError()
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            raise NotImplementedError()
+        if index < 0:
+            index = self.size + index
+        if not (0 <= index < self.size):
+            raise IndexError()
+        mask = type(self)(1 << index)
+        self._value = BatchBit(value).ite(self | mask, self & ~mask)._value
+
+    def concat(self, other):
+        T = type(self).unsized_t
+        if not isinstance(other, T):
+            raise TypeError(f'value must of type {T}')
+        size = self.size + other.size
+        lo = _cast(self._value, size)
+        hi = _cast(other._value, size)
+        return T[size](lo | (hi << _const(self.size, size)))
+
+    def bvnot(self):
+        return self._new(~self._value & _const(_mask(self.size), self.size))
+
+    @_bv_cast
+    def bvand(self, other):
+        return self._new(self._value & other._value)
+
+    @_bv_cast
+    def bvor(self, other):
+        return self._new(self._value | other._value)
+
+    @_bv_cast
+    def bvxor(self, other):
+        return self._new(self._value ^ other._value)
+
+    @_bv_cast
+    def bvshl(self, other):
+        s, big = self._shift(other)
+        return self._wrap(np.where(big, 0, self._value << s))
+
+    @_bv_cast
+    def bvlshr(self, other):
+        s, big = self._shift(other)
+        return self._new(np.where(big, 0, self._value >> s))
+
+    @_bv_cast
+    def bvashr(self, other):
+        s, _ = self._shift(other)
+        if self.size <= 64:
+            s = s.astype(np.int64)
+        return self._from_sint(self.as_sint() >> s)
+
+    @_bv_cast
+    def bvrol(self, other):
+        size = self.size
+        r = type(self)(other._value % _const(size, size))
+        return self.bvshl(r) | self.bvlshr(type(self)(size) - r)
+
+    @_bv_cast
+    def bvror(self, other):
+        size = self.size
+        r = type(self)(other._value % _const(size, size))
+        return self.bvlshr(r) | self.bvshl(type(self)(size) - r)
+
+    @_bv_cast
+    def bvcomp(self, other):
+        return type(self).unsized_t[1](self._value == other._value)
+
+    @_bv_cast
+    def bveq(self, other):
+        return BatchBit(self._value == other._value)
+
+    @_bv_cast
+    def bvult(self, other):
+        return BatchBit(self._value < other._value)
+
+    @_bv_cast
+    def bvslt(self, other):
+        return BatchBit(self.as_sint() < other.as_sint())
+
+    def bvneg(self):
+        return self._new((~self._value + 1) & _const(_mask(self.size), self.size))
+
+    def adc(self, other, carry):
+        T = type(self)
+        other = _coerce(T, other)
+        carry = _coerce(T.unsized_t[1], carry)
+
+        a = self.zext(1)
+        b = other.zext(1)
+        c = carry.zext(T.size)
+
+        res = a + b + c
+        return res[0:-1], res[-1]
+
+    def ite(self, t_branch, f_branch):
+        return self.bvne(0).ite(t_branch, f_branch)
+
+    @_bv_cast
+    def bvadd(self, other):
+        return self._wrap(self._value + other._value)
+
+    @_bv_cast
+    def bvsub(self, other):
+        if self.size <= 64:
+            return self._new((self._value - other._value) & np.uint64(_mask(self.size)))
+        return self._wrap(self._value - other._value)
+
+    @_bv_cast
+    def bvmul(self, other):
+        if self.size <= 64:
+            return self._new((self._value * other._value) & np.uint64(_mask(self.size)))
+        return self._wrap(self._value * other._value)
+
+    @_bv_cast
+    def bvudiv(self, other):
+        a, b = np.broadcast_arrays(self._value, other._value)
+        zero = b == 0
+        safe = np.where(zero, 1, b).astype(b.dtype)
+        return self._new(np.where(zero, _mask(self.size), a // safe).astype(a.dtype))
+
+    @_bv_cast
+    def bvurem(self, other):
+        a, b = np.broadcast_arrays(self._value, other._value)
+        zero = b == 0
+        safe = np.where(zero, 1, b).astype(b.dtype)
+        return self._new(np.where(zero, a, a % safe).astype(a.dtype))
+
+    #Like hwtypes, signed division rounds towards negative infinity
+    @_bv_cast
+    def bvsdiv(self, other):
+        a, b = np.broadcast_arrays(self.as_sint(), other.as_sint())
+        zero = b == 0
+        safe = np.where(zero, 1, b).astype(b.dtype)
+        with np.errstate(over='ignore'):
+            q = self._from_sint(a // safe)
+        return self._new(np.where(zero, _const(_mask(self.size), self.size), q._value))
+
+    @_bv_cast
+    def bvsrem(self, other):
+        a, b = np.broadcast_arrays(self.as_sint(), other.as_sint())
+        zero = b == 0
+        safe = np.where(zero, 1, b).astype(b.dtype)
+        return self._from_sint(np.where(zero, a, a % safe))
+
+    def __invert__(self): return self.bvnot()
+    def __neg__(self): return self.bvneg()
+
+    __and__ = _operator('bvand')
+    __or__ = _operator('bvor')
+    __xor__ = _operator('bvxor')
+    __lshift__ = _operator('bvshl')
+    __rshift__ = _operator('bvlshr')
+    __add__ = _operator('bvadd')
+    __sub__ = _operator('bvsub')
+    __mul__ = _operator('bvmul')
+    __floordiv__ = _operator('bvudiv')
+    __mod__ = _operator('bvurem')
+    __eq__ = _operator('bveq')
+    __ne__ = _operator('bvne')
+    __ge__ = _operator('bvuge')
+    __gt__ = _operator('bvugt')
+    __le__ = _operator('bvule')
+    __lt__ = _operator('bvult')
+
+    #Only a single lane has a python int value
+    def __int__(self):
+        if len(self._value) != 1:
+            raise TypeError('A BatchBitVector with several lanes cannot be converted to int')
+        return int(self.as_uint()[0])
+
+    def __bool__(self):
+        return bool(int(self))
+
+    def repeat(self, r):
+        r = int(r)
+        if r <= 0:
+            raise ValueError()
+        ret = self
+        for _ in range(r - 1):
+            ret = ret.concat(self)
+        return ret
+
+    def sext(self, ext):
+        ext = int(ext)
+        if ext < 0:
+            raise ValueError()
+        if ext == 0:
+            return self
+        T = type(self).unsized_t
+        return self.concat(T[1](self[-1]).repeat(ext))
+
+    def ext(self, ext):
+        return self.zext(ext)
+
+    def zext(self, ext):
+        ext = int(ext)
+        if ext < 0:
+            raise ValueError()
+        T = type(self).unsized_t
+        return T[self.size + ext](_cast(self._value, self.size + ext))
+
+
+class BatchNumVector(BatchBitVector):
+    __hash__ = BatchBitVector.__hash__
+
+
+class BatchUIntVector(BatchNumVector):
+    __hash__ = BatchNumVector.__hash__
+
+
+class BatchSIntVector(BatchNumVector):
+    __hash__ = BatchNumVector.__hash__
+
+    def __int__(self):
+        if len(self._value) != 1:
+            raise TypeError('A BatchSIntVector with several lanes cannot be converted to int')
+        return int(self.as_sint()[0])
+
+    __rshift__ = _operator('bvashr')
+    __floordiv__ = _operator('bvsdiv')
+    __mod__ = _operator('bvsrem')
+    __ge__ = _operator('bvsge')
+    __gt__ = _operator('bvsgt')
+    __lt__ = _operator('bvslt')
+    __le__ = _operator('bvsle')
+
+    def ext(self, other):
+        return self.sext(other)
+
+
+_Family_ = TypeFamily(BatchBit, BatchBitVector, BatchUIntVector, BatchSIntVector)
+
+
+#Array of the ints in [0, 2**size) of values
+def _pack(values, size, num):
+    if size <= 64:
+        return np.fromiter(values, dtype=np.uint64, count=num)
+    return np.array(list(values), dtype=object)
+
+def batch(T, values: tp.Sequence) -> tp.Union[BatchBit, BatchBitVector, 'AssembledADT']:
+    '''
+    Packs values (python family values of type T, eg hwtypes.BitVector or adt
+    values) into the batched value of the BatchPyFamily with one lane per
+    value. Adt values are assembled into a batch of opcodes, which is
+    dominated by the assembler for large batches; opcodes which are already
+    known can be passed as an array to AssembledADT directly.
+    '''
+    from .family import BatchPyFamily
+    from .assembler import Assembler
+    T = strip_modifiers(T)
+    if issubclass(T, hwtypes.AbstractBit):
+        return BatchBit(np.array([bool(v) for v in values]))
+    if issubclass(T, hwtypes.AbstractBitVector):
+        ret = BatchBitVector[T.size](_pack((int(v) for v in values), T.size, len(values)))
+        if issubclass(T, hwtypes.SIntVector):
+            ret = BatchSIntVector[T.size](ret)
+        elif issubclass(T, hwtypes.UIntVector):
+            ret = BatchUIntVector[T.size](ret)
+        return ret
+    assembler = Assembler(T)
+    codes = {}
+    def asm(v):
+        if v not in codes:
+            codes[v] = assembler._asm(v)
+        return codes[v]
+    opcodes = _pack(map(asm, values), assembler.width, len(values))
+    return BatchPyFamily().get_adt_t(T)(BatchBitVector[assembler.width](opcodes))
+
+def unbatch(T, value, num: tp.Optional[int] = None) -> tp.List:
+    '''
+    Inverse of batch: the python family values of type T of the lanes of
+    value. Constant (single lane) values are repeated num times.
+    '''
+    from .assembler import Assembler
+    T = strip_modifiers(T)
+    if hasattr(value, '_to_bitvector_'):
+        value = value._to_bitvector_()
+    lanes = value.value
+    if num is not None and len(lanes) == 1:
+        lanes = np.repeat(lanes, num)
+    if issubclass(T, hwtypes.AbstractBit):
+        return [hwtypes.Bit(bool(v)) for v in lanes]
+    if issubclass(T, hwtypes.AbstractBitVector):
+        return [T(int(v)) for v in lanes]
+    assembler = Assembler(T)
+    return [assembler.disassemble(hwtypes.BitVector[assembler.width](int(v))) for v in lanes]
@@ -16,7 +16,7 @@ from .black_box import BlackBox
 
 logger = logging.getLogger(__name__)
 
-__ALL__ = ['PyFamily', 'SMTFamily', 'MagmaFamily']
+__ALL__ = ['PyFamily', 'SMTFamily', 'MagmaFamily', 'BatchPyFamily']
 
 def _compose(f, g):
     def wrapped(*args, **kwargs):
@@ -318,6 +318,34 @@ class _StdMix(_AsmFamily, _RewriterFamily):
 class PyXFamily(_StdMix, PyFamily): pass
 
 
+class BatchPyFamily(_StdMix, _RegFamily):
+    '''
+    Python family whose Bit/BitVectors are numpy arrays of lanes (see
+    peak.batch). Like SMTFamily __call__ is rewritten so that if statements
+    become lane-wise ites and adts are assembled, so one call evaluates a
+    batch of inputs (including batches of opcodes).
+    '''
+    @property
+    def Bit(self):
+        from .batch import BatchBit
+        return BatchBit
+
+    @property
+    def BitVector(self):
+        from .batch import BatchBitVector
+        return BatchBitVector
+
+    @property
+    def Signed(self):
+        from .batch import BatchSIntVector
+        return BatchSIntVector
+
+    @property
+    def Unsigned(self):
+        from .batch import BatchUIntVector
+        return BatchUIntVector
+
+
 # Put _BBFamily first so it switchs out the __call__ after its been ssa'd
 class SMTFamily(_BBFamily, _StdMix, _RegFamily):
     @property
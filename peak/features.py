@@ -130,6 +130,10 @@ class family_closure:
     def PyX(self):
         return self(self.family.PyXFamily())
 
+    @property
+    def BatchPy(self):
+        return self(self.family.BatchPyFamily())
+
 
     def __call__(self, *args, **kwargs):
         if not self.is_bound:
@@ -1,2 +1,12 @@
 from .mapper import *
 from .oldmapper import gen_mapping
+from .parallel import map_ir, IRMapping, PortfolioResult, default_portfolio, verify_all
+from .cache import RuleCache, CacheStats, fingerprint
+from .stats import MapperStats, PhaseStats
+from .reduced_width import map_reduced_width, lift_rule
+from .arch_cache import save_arch_mapper, load_arch_mapper, cached_arch_mapper
+from .smtlib import export_query, import_model, read_model
+from .enumerative import enumerative_solve
+from .cex_pool import CounterexamplePool
+from .rule_db import RuleDatabase, RuleEntry, type_signature
+from .isel import DataflowGraph, RuleLibrary, TileRule, Tile, Selection, select_instructions
@@ -0,0 +1,173 @@
+import io
+import json
+import os
+import sys
+import typing as tp
+
+import pysmt.shortcuts as smt
+from pysmt.smtlib.parser import SmtLibParser
+from pysmt.smtlib.script import smtlibscript_from_formula
+from hwtypes import SMTBit, SMTBitVector
+
+from peak import family as peak_family
+from .cache import fingerprint, library_versions
+from .mapper import ArchMapper
+from .stats import phase, count
+from .utils import SMTForms
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+# An ArchMapper is saved as a directory holding
+#   forms.smt2: one assertion which defines, for every input form, a symbol
+#               for the (assembled) output value and one for each const valid
+#               condition in terms of canonically named input variables
+#   index.json: the fingerprint of the arch, the path of each input variable
+#               and the key of each input form
+# Input forms are identified by their sum decisions (path_dict) and input
+# variables by their path since neither the form order nor the variable names
+# are stable across processes.
+_VERSION = 1
+_FORMS = "forms.smt2"
+_INDEX = "index.json"
+
+
+#Identifies the arch only. path_constraints are not part of the key: they
+#do not change the evaluation of an input form, and constraints on Sums only
+#drop input forms, so the forms saved for some path_constraints can be loaded
+#for any path_constraints which keep a subset of them (see load_arch_mapper).
+def arch_key(arch_fc, family=peak_family) -> str:
+    return fingerprint(
+        sys.version_info[:2],
+        library_versions(),
+        "ArchMapper",
+        _VERSION,
+        arch_fc,
+        getattr(family, "__name__", repr(family)),
+    )
+
+def _form_key(form):
+    return repr(sorted((repr(path), repr(field)) for path, field in form.path_dict.items()))
+
+#path -> input variable (leaves and sum tags)
+def _input_vars(am):
+    ret = {}
+    for path, v in am.input_varmap.items():
+        if isinstance(v, (SMTBit, SMTBitVector)) and v.value.is_symbol():
+            ret[repr(path)] = v.value
+    return ret
+
+def _write(fname, write):
+    tmp = f"{fname}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        write(f)
+    os.replace(tmp, fname)
+
+
+def save_arch_mapper(am: ArchMapper, path):
+    '''
+    Evaluates every input form of am and writes the results to the directory
+    path.
+    '''
+    if len(am.bb_outputs) > 0:
+        raise NotImplementedError("Saving an ArchMapper with black boxes")
+    key = arch_key(am.peak_fc, am.family)
+    prefix = f"peak.{key[:16]}"
+    inputs = sorted(_input_vars(am).items())
+    canonical = {v: smt.Symbol(f"{prefix}.in.{k}", v.symbol_type()) for k, (_, v) in enumerate(inputs)}
+
+    forms = []
+    defs = []
+    for fi, form in enumerate(am.input_forms):
+        conds, output_forms = am.evaluated_forms[fi]
+        output = output_forms[0].value._value_.value
+        out = smt.Symbol(f"{prefix}.out.{fi}", output.get_type())
+        defs.append(smt.Equals(out, output))
+        for j, cond in enumerate(conds):
+            c = smt.Symbol(f"{prefix}.cond.{fi}.{j}", smt.BOOL)
+            defs.append(smt.Iff(c, cond.value))
+        forms.append(_form_key(form))
+    formula = smt.substitute(smt.And(defs), canonical)
+
+    os.makedirs(path, exist_ok=True)
+    script = smtlibscript_from_formula(formula)
+    _write(os.path.join(path, _FORMS), lambda f: script.serialize(f, daggify=True))
+    index = dict(
+        version=_VERSION,
+        key=key,
+        prefix=prefix,
+        inputs=[p for p, _ in inputs],
+        forms=forms,
+        num_conds=len(am.const_fields),
+    )
+    _write(os.path.join(path, _INDEX), lambda f: json.dump(index, f))
+
+
+def load_arch_mapper(path, arch_fc, **kwargs) -> ArchMapper:
+    '''
+    Builds ArchMapper(arch_fc, **kwargs) with the results of every input form
+    read from path (written by save_arch_mapper), so the peak object is not
+    run on any input form. The path_constraints in kwargs may differ from the
+    ones path was saved with as long as the input forms they keep were saved.
+    Raises ValueError if path was written for a different arch or lacks some
+    of the input forms.
+    '''
+    family = kwargs.get("family", peak_family)
+    stats = kwargs.get("stats")
+    with open(os.path.join(path, _INDEX)) as f:
+        index = json.load(f)
+    if index.get("version") != _VERSION or index["key"] != arch_key(arch_fc, family):
+        raise ValueError(f"{path} does not hold the forms of {arch_fc}")
+
+    am = ArchMapper(arch_fc, **kwargs)
+    with phase(stats, "arch_cache_load"):
+        inputs = _input_vars(am)
+        form_idx = {_form_key(form): fi for fi, form in enumerate(am.input_forms)}
+        #Constrained Sums (see ArchMapper) only keep some of the saved forms
+        if sorted(inputs) != index["inputs"] or not set(form_idx).issubset(index["forms"]):
+            raise ValueError(f"{path} does not match the input forms of {arch_fc}")
+        with open(os.path.join(path, _FORMS)) as f:
+            formula = SmtLibParser().get_script(f).get_last_formula()
+        prefix = index["prefix"]
+        canonical = {smt.Symbol(f"{prefix}.in.{k}", inputs[p].symbol_type()): inputs[p] for k, p in enumerate(index["inputs"])}
+        formula = smt.substitute(formula, canonical)
+        defs = {}
+        for d in formula.args() if formula.is_and() else (formula,):
+            lhs, rhs = d.args()
+            defs[lhs.symbol_name()] = rhs
+
+        output_aadt_t = am.output_aadt_t
+        for k, form_key in enumerate(index["forms"]):
+            if form_key not in form_idx:
+                continue
+            fi = form_idx[form_key]
+            output = defs[f"{prefix}.out.{k}"]
+            output_value = output_aadt_t(SMTBitVector[output.bv_width()](output))
+            forms, _, _ = SMTForms()(output_aadt_t, value=output_value)
+            conds = [SMTBit(defs[f"{prefix}.cond.{k}.{j}"]) for j in range(index["num_conds"])]
+            am.evaluated_forms.prime(fi, (conds, forms))
+    count(stats, "cached_input_forms", am.num_input_forms)
+    return am
+
+
+def cached_arch_mapper(arch_fc, cache_dir, **kwargs) -> ArchMapper:
+    '''
+    Returns ArchMapper(arch_fc, **kwargs) loaded from cache_dir if it holds
+    arch_fc, otherwise builds it and saves it there. Arches with black boxes
+    are never cached.
+    There is one entry per arch: if the saved forms do not cover the input
+    forms kept by path_constraints, the entry is rebuilt with the forms of
+    this call.
+    '''
+    family = kwargs.get("family", peak_family)
+    path = os.path.join(os.fspath(cache_dir), arch_key(arch_fc, family))
+    if os.path.exists(os.path.join(path, _INDEX)):
+        try:
+            return load_arch_mapper(path, arch_fc, **kwargs)
+        except (ValueError, KeyError) as e:
+            logger.debug(f"Rebuilding stale ArchMapper cache {path}: {e}")
+    am = ArchMapper(arch_fc, **kwargs)
+    if len(am.bb_outputs) == 0:
+        save_arch_mapper(am, path)
+    return am
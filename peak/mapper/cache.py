@@ -0,0 +1,331 @@
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+import types
+import typing as tp
+
+from hwtypes.adt_meta import BoundMeta, EnumMeta
+
+from peak.features import family_closure
+from .mapper import RewriteRule, read_serialized_bindings
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+# Bumped whenever a change to peak changes the rules found for (or the
+# symbolic results of) an unchanged arch and IR, eg a fix to the assembler.
+CACHE_FORMAT_VERSION = 2
+
+_VERSIONED_PACKAGES = ("peak", "hwtypes", "pysmt")
+
+def library_versions() -> tp.Tuple:
+    '''
+    The installed versions of the libraries whose behaviour is not hashed
+    (see _LIBRARY_MODULES) together with CACHE_FORMAT_VERSION. They are part
+    of every cache key.
+    '''
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+    except ImportError:
+        #python < 3.8
+        import pkg_resources
+        def version(name):
+            return pkg_resources.get_distribution(name).version
+        PackageNotFoundError = pkg_resources.DistributionNotFound
+    versions = []
+    for name in _VERSIONED_PACKAGES:
+        try:
+            versions.append((name, version(name)))
+        except PackageNotFoundError:
+            versions.append((name, None))
+    return (CACHE_FORMAT_VERSION, tuple(versions))
+
+
+# Objects from these modules are identified by name only, their behaviour is
+# covered by library_versions (which is part of every key) instead of being
+# hashed. peak.ir is hashed as it holds IR definitions.
+_LIBRARY_MODULES = ("builtins", "hwtypes", "peak", "pysmt", "magma", "ast_tools", "typing", "types", "abc", "collections", "functools")
+
+_ADDRESS = re.compile(" at 0x[0-9a-fA-F]+")
+
+def _is_library(obj):
+    module = getattr(obj, "__module__", None) or ""
+    return module.split(".")[0] in _LIBRARY_MODULES and not module.startswith("peak.ir")
+
+
+class _Fingerprinter:
+    '''
+    Builds a content hash of (possibly nested) python objects.
+
+    Functions are hashed by their code objects (ignoring line numbers) together
+    with every global, closure cell and default they reference, so the hash of
+    a family_closure transitively covers the ISA types it builds. This also
+    works for family closures created with exec (eg IR.add_peak_instruction)
+    where no source is available.
+    '''
+    def __init__(self):
+        self._hash = hashlib.sha256()
+        self._seen = {}
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def _write(self, *tokens):
+        for token in tokens:
+            self._hash.update(str(token).encode())
+            self._hash.update(b"\0")
+
+    def update(self, obj):
+        if isinstance(obj, (type(None), bool, int, float, str, bytes)):
+            self._write(type(obj).__name__, repr(obj))
+            return
+        if isinstance(obj, (tuple, list, frozenset, set)):
+            items = list(obj)
+            if isinstance(obj, (set, frozenset)):
+                items = sorted(items, key=repr)
+            self._write(type(obj).__name__, len(items))
+            for item in items:
+                self.update(item)
+            return
+        if isinstance(obj, dict):
+            self._write("dict", len(obj))
+            for k, v in sorted(obj.items(), key=lambda kv: repr(kv[0])):
+                self.update(k)
+                self.update(v)
+            return
+
+        # Everything else can be recursive
+        if id(obj) in self._seen:
+            self._write("ref", self._seen[id(obj)])
+            return
+        self._seen[id(obj)] = len(self._seen)
+
+        if isinstance(obj, family_closure):
+            self._write("family_closure")
+            self.update(obj.fc if obj.is_bound else None)
+        elif isinstance(obj, types.ModuleType):
+            self._write("module", obj.__name__)
+        elif isinstance(obj, types.CodeType):
+            self._code(obj)
+        elif isinstance(obj, types.FunctionType):
+            self._function(obj)
+        elif isinstance(obj, (types.MethodType, staticmethod, classmethod)):
+            self.update(obj.__func__)
+        elif isinstance(obj, property):
+            self._write("property")
+            self.update((obj.fget, obj.fset))
+        elif isinstance(obj, type):
+            self._class(obj)
+        elif hasattr(obj, "__dict__"):
+            self._write("object")
+            self.update(type(obj))
+            self.update(vars(obj))
+        else:
+            self._write("object")
+            self.update(type(obj))
+            self._write(_ADDRESS.sub("", repr(obj)))
+
+    def _code(self, code):
+        self._write("code", code.co_name, code.co_argcount, code.co_kwonlyargcount)
+        self._hash.update(code.co_code)
+        self.update(code.co_names)
+        self.update(code.co_varnames)
+        for const in code.co_consts:
+            self.update(const)
+
+    def _function(self, fn):
+        self._write("function", fn.__qualname__)
+        self._code(fn.__code__)
+        self.update(fn.__defaults__)
+        self.update(fn.__kwdefaults__)
+        if fn.__closure__ is not None:
+            for name, cell in zip(fn.__code__.co_freevars, fn.__closure__):
+                self._write(name)
+                try:
+                    self.update(cell.cell_contents)
+                except ValueError:
+                    self._write("empty cell")
+        for name in _referenced_names(fn.__code__):
+            if name in fn.__globals__:
+                self._write(name)
+                self.update(fn.__globals__[name])
+
+    def _class(self, cls):
+        self._write("class", cls.__module__, cls.__qualname__)
+        if isinstance(cls, EnumMeta) and not _is_library(cls):
+            self.update({name: getattr(cls, name)._value_ for name in cls.field_dict})
+            return
+        if isinstance(cls, BoundMeta):
+            self._write(repr(cls))
+            if cls.is_bound:
+                fields = [(repr(k), v) for k, v in cls.field_dict.items()]
+                if not cls.ORDERED:
+                    fields = sorted(fields, key=lambda kv: kv[0])
+                self.update(fields)
+            return
+        if _is_library(cls):
+            self._write(repr(cls))
+            return
+        self.update([b for b in cls.__bases__])
+        for name, attr in cls.__dict__.items():
+            if name in ("__dict__", "__weakref__", "__doc__", "__module__", "__qualname__"):
+                continue
+            self._write(name)
+            self.update(attr)
+
+
+def _referenced_names(code):
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names.update(_referenced_names(const))
+    return sorted(names)
+
+
+def fingerprint(*objs) -> str:
+    f = _Fingerprinter()
+    for obj in objs:
+        f.update(obj)
+    return f.hexdigest()
+
+
+def rule_key(irmapper, solver_name: str) -> str:
+    '''
+    Computes the cache key for solving irmapper with solver_name.
+    '''
+    am = irmapper.archmapper
+    constraints = sorted(
+        ((repr(path), repr(c)) for path, c in [*am.path_constraints.items(), *am.tag_constraints.items()]),
+    )
+    return fingerprint(
+        sys.version_info[:2],
+        library_versions(),
+        am.peak_fc,
+        irmapper.peak_fc,
+        constraints,
+        [[repr(path) for path in group] for group in am.interchangeable],
+        irmapper.IVar,
+        irmapper.simple_formula,
+        solver_name,
+        getattr(am.family, "__name__", repr(am.family)),
+    )
+
+
+# File systems often use coarse timestamps so the access time is set
+# explicitly with full resolution
+def _touch(fname):
+    t = time.time_ns()
+    os.utime(fname, ns=(t, t))
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def as_dict(self):
+        return dict(hits=self.hits, misses=self.misses, stores=self.stores, evictions=self.evictions)
+
+    def __repr__(self):
+        return f"CacheStats({', '.join(f'{k}={v}' for k, v in self.as_dict().items())})"
+
+
+class RuleCache:
+    '''
+    On disk cache of solved rewrite rules.
+
+    Each entry is one json file named by its key. Entries are evicted least
+    recently used first (by file mtime, which is refreshed on every hit) once
+    the cache holds more than max_entries entries or max_bytes bytes.
+    Negative results (no rewrite rule exists) are cached as well.
+    '''
+    _SUFFIX = ".json"
+
+    def __init__(self, path, max_entries: tp.Optional[int] = None, max_bytes: tp.Optional[int] = None):
+        self.path = os.fspath(path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        os.makedirs(self.path, exist_ok=True)
+
+    def key(self, irmapper, solver_name: str) -> str:
+        return rule_key(irmapper, solver_name)
+
+    def _file(self, key):
+        return os.path.join(self.path, key + self._SUFFIX)
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith(self._SUFFIX):
+                continue
+            try:
+                st = os.stat(os.path.join(self.path, name))
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime_ns, st.st_size, name))
+        return entries
+
+    def __len__(self):
+        return len(self._entries())
+
+    def __contains__(self, key):
+        return os.path.exists(self._file(key))
+
+    @property
+    def size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    # Returns (found, RewriteRule | None)
+    def get(self, key, ir_fc, arch_fc) -> tp.Tuple[bool, tp.Optional[RewriteRule]]:
+        fname = self._file(key)
+        try:
+            with open(fname) as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.stats.misses += 1
+            return False, None
+        _touch(fname)
+        self.stats.hits += 1
+        if entry["rule"] is None:
+            return True, None
+        return True, read_serialized_bindings(entry["rule"], ir_fc, arch_fc)
+
+    def put(self, key, rr: tp.Optional[RewriteRule]):
+        entry = dict(rule=None if rr is None else rr.serialize_bindings(portable=True))
+        fname = self._file(key)
+        tmp = f"{fname}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp, fname)
+        _touch(fname)
+        self.stats.stores += 1
+        self._evict()
+
+    def _evict(self):
+        if self.max_entries is None and self.max_bytes is None:
+            return
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        while entries and (
+            (self.max_entries is not None and len(entries) > self.max_entries) or
+            (self.max_bytes is not None and total > self.max_bytes)
+        ):
+            _, size, name = entries.pop(0)
+            try:
+                os.remove(os.path.join(self.path, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.stats.evictions += 1
+            logger.debug(f"Evicted {name} from rule cache")
+
+    def clear(self):
+        for _, _, name in self._entries():
+            os.remove(os.path.join(self.path, name))
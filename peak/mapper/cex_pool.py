@@ -0,0 +1,124 @@
+import itertools
+import typing as tp
+
+import pysmt.shortcuts as smt
+
+
+def _sort_key(sort):
+    if sort.is_bv_type():
+        return ("BV", sort.width)
+    assert sort.is_bool_type()
+    return ("Bool",)
+
+def _to_pysmt(x, key):
+    if key[0] == "BV":
+        return smt.BV(x, key[1])
+    return smt.Bool(bool(x))
+
+#The vars of y grouped by sort key, each group in a stable (name) order
+def _group(y):
+    groups = {}
+    for v in sorted(y, key=lambda v: v.symbol_name()):
+        groups.setdefault(_sort_key(v.get_type()), []).append(v)
+    return groups
+
+
+class _Entry:
+    __slots__ = ("hits", "last")
+    def __init__(self, last):
+        self.hits = 0
+        self.last = last
+
+
+class CounterexamplePool:
+    '''
+    Counterexamples shared by every CEGIS run (IRMapper.solve and
+    enumerate_rules with external_loop) of one ArchMapper. Enabled with
+    ArchMapper(pool_size=...).
+
+    The counterexamples of an instruction are rarely specific to it, the same
+    edge cases (zero, overflow, the sign bit, ...) tend to refute the
+    candidates of the next instruction. The forall variables of different
+    instructions differ, so a counterexample is split by the sort (type and
+    width) of its variables: for each sort the tuple of values of its
+    variables (ordered by name) is one entry.
+
+    seeds(y) builds up to max_seeds assignments to y from the most useful
+    entries of each sort of y. A seed only adds phi[seed] to the synthesis
+    query, which every solution satisfies, so seeding is always sound.
+
+    Each sort holds at most size entries. An entry is more useful the more
+    often it has been found as a counterexample, when a sort is full the
+    least useful entry (the least recently found on ties) is evicted.
+    '''
+    DEFAULT_SIZE = 32
+
+    def __init__(self, size: int = DEFAULT_SIZE, max_seeds: int = 8):
+        if size < 1:
+            raise ValueError("size needs to be at least 1")
+        self.size = size
+        self.max_seeds = max_seeds
+        #sort key -> values -> _Entry
+        self.entries: tp.Dict[tuple, tp.Dict[tuple, _Entry]] = {}
+        self.clear()
+
+    def __len__(self):
+        return sum(len(entries) for entries in self.entries.values())
+
+    def record(self, sigma: tp.Mapping):
+        '''
+        Adds the counterexample sigma (forall var -> pysmt constant)
+        '''
+        self.num_recorded += 1
+        tick = next(self._tick)
+        for key, vs in _group(sigma).items():
+            values = tuple(sigma[v].constant_value() for v in vs)
+            entries = self.entries.setdefault(key, {})
+            entry = entries.get(values)
+            if entry is None:
+                if len(entries) >= self.size:
+                    self._evict(entries)
+                entry = entries[values] = _Entry(tick)
+            entry.hits += 1
+            entry.last = tick
+
+    def _evict(self, entries):
+        victim = min(entries, key=lambda values: (entries[values].hits, entries[values].last))
+        del entries[victim]
+        self.num_evicted += 1
+
+    #Values of the sort key, most useful first
+    def ranked(self, key) -> tp.List[tuple]:
+        entries = self.entries.get(key, {})
+        return sorted(entries, key=lambda values: (-entries[values].hits, -entries[values].last))
+
+    def seeds(self, y) -> tp.List[tp.Dict]:
+        '''
+        Returns assignments to the vars y built from the pool. Seed i assigns
+        the vars of each sort the values of its i-th most useful entry
+        (repeated if the entry has fewer values, 0 if the sort has no
+        entries).
+        '''
+        groups = _group(y)
+        ranked = {key: self.ranked(key)[:self.max_seeds] for key in groups}
+        num = max((len(r) for r in ranked.values()), default=0)
+        seeds = []
+        for i in range(num):
+            seed = {}
+            for key, vs in groups.items():
+                r = ranked[key]
+                values = r[i % len(r)] if r else (0,)
+                for j, v in enumerate(vs):
+                    seed[v] = _to_pysmt(values[j % len(values)], key)
+            seeds.append(seed)
+        self.num_seeded += len(seeds)
+        return seeds
+
+    #Drops every entry and resets the totals
+    def clear(self):
+        self.entries.clear()
+        self._tick = itertools.count()
+        #Totals since the pool was created or last cleared
+        self.num_recorded = 0
+        self.num_seeded = 0
+        self.num_evicted = 0
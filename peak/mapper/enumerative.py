@@ -0,0 +1,175 @@
+import itertools
+import random
+import typing as tp
+
+from hwtypes import Bit, BitVector
+from hwtypes.modifiers import strip_modifiers
+from peak.assembler import Assembler
+from peak.black_box import get_black_boxes
+from .mapper import IRMapper, RewriteRule, rr_from_selection
+from .prefilter import _simulate, _vector_values
+from .stats import phase, count
+from .utils import Unbound
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+#Const spaces larger than this are left to the solver
+MAX_OPCODES = 1 << 16
+
+
+#Every valid encoding of a Const leaf of type T as (value, encoding) pairs.
+#value is what the Py family simulates and encoding what the rule binds.
+def _encodings(T):
+    T = strip_modifiers(T)
+    if issubclass(T, Bit):
+        return [(Bit(v), Bit(v)) for v in (0, 1)]
+    if issubclass(T, BitVector):
+        return [(T(v), T(v)) for v in range(1 << T.size)]
+    assembler = Assembler(T)
+    #Opcodes which only differ in unused bits are the same value
+    ret = {}
+    for v in range(1 << assembler.width):
+        opcode = BitVector[assembler.width](v)
+        if assembler.is_valid(opcode):
+            ret.setdefault(assembler.disassemble(opcode), opcode)
+    return list(ret.items())
+
+def _space_size(T):
+    T = strip_modifiers(T)
+    if issubclass(T, Bit):
+        return 2
+    if issubclass(T, BitVector):
+        return 1 << T.size
+    return 1 << Assembler(T).width
+
+#The unbound Const arch paths of ibinding
+def _const_paths(am, ibinding):
+    return [arch_path for ir_path, arch_path in ibinding if ir_path is Unbound and arch_path in am.const_paths]
+
+
+def enumerative_solve(
+    irmapper: IRMapper,
+    solver_name: str = 'z3',
+    max_opcodes: int = MAX_OPCODES,
+    num_vectors: int = 8,
+    seed: int = 0,
+    **solve_kwargs,
+) -> tp.Optional[RewriteRule]:
+    '''
+    Finds a rule of irmapper by trying every valid encoding of the unbound
+    Const arch inputs of each input binding instead of solving the
+    exists/forall query.
+
+    Each encoding is screened by simulating the ir and arch in the Py family
+    on num_vectors corner case and random inputs. The (encoding, output
+    binding) pairs which pass are confirmed with RewriteRule.verify, a
+    quantifier free query, and the first one which verifies is returned.
+
+    Falls back to irmapper.solve(solver_name, **solve_kwargs) when the
+    encodings of some input binding exceed max_opcodes, when the peak
+    objects have black boxes or path constraints, or when a form can not be
+    simulated and no rule is found on the others.
+    '''
+    am = irmapper.archmapper
+    stats = irmapper.stats
+    if not irmapper.has_bindings:
+        return None
+
+    def fallback(reason):
+        logger.debug(f"Enumerative search falls back to the solver: {reason}")
+        count(stats, "enumerative_fallbacks")
+        return irmapper.solve(solver_name, **solve_kwargs)
+
+    if get_black_boxes(am.peak_obj) or get_black_boxes(irmapper.peak_obj) or am.path_constraints:
+        return fallback("black boxes or path constraints")
+    arch_path_types = am.path_to_adt(input=True, strip=True)
+    for bindings in irmapper.input_bindings:
+        for ibinding in bindings:
+            size = 1
+            for path in _const_paths(am, ibinding):
+                size *= _space_size(arch_path_types[path])
+            if size > max_opcodes:
+                return fallback(f"{size} Const encodings")
+
+    with phase(stats, "enumerative"):
+        rr, unsimulatable = _enumerate(irmapper, solver_name, num_vectors, seed)
+    if rr is None and unsimulatable:
+        return fallback(f"forms {sorted(unsimulatable)} can not be simulated")
+    return rr
+
+def _enumerate(irmapper, solver_name, num_vectors, seed):
+    am = irmapper.archmapper
+    stats = irmapper.stats
+    rng = random.Random(seed)
+    ir_cls = irmapper.py_peak_cls()
+    arch_cls = am.py_peak_cls()
+    ir_path_types = irmapper.path_to_adt(input=True, strip=True)
+    arch_path_types = am.path_to_adt(input=True, strip=True)
+
+    ir_vectors = {path: _vector_values(T, rng, num_vectors) for path, T in sorted(ir_path_types.items(), key=repr)}
+    ir_outputs = []
+    try:
+        for k in range(num_vectors):
+            ir_outputs.append(_simulate(ir_cls, {path: vs[k] for path, vs in ir_vectors.items()}))
+    except Exception as e:
+        logger.debug(f"Can not simulate the ir: {e}")
+        return None, {None}
+
+    output_bindings = irmapper.output_bindings
+    compared = [
+        [(ir_path, arch_path) for ir_path, arch_path in obinding if ir_path is not Unbound]
+        for obinding in output_bindings
+    ]
+    encodings = {}
+    unsimulatable = set()
+    for fi, bindings in enumerate(irmapper.input_bindings):
+        for ibinding in bindings:
+            const_paths = _const_paths(am, ibinding)
+            for path in const_paths:
+                if path not in encodings:
+                    encodings[path] = _encodings(arch_path_types[path])
+            vectors = [{} for _ in range(num_vectors)]
+            for ir_path, arch_path in ibinding:
+                if arch_path in const_paths:
+                    continue
+                if ir_path is Unbound:
+                    values = _vector_values(arch_path_types[arch_path], rng, num_vectors)
+                else:
+                    values = ir_vectors[ir_path]
+                for k in range(num_vectors):
+                    vectors[k][arch_path] = values[k]
+
+            for const in itertools.product(*(encodings[path] for path in const_paths)):
+                count(stats, "enumerated_opcodes")
+                const_values = {path: value for path, (value, _) in zip(const_paths, const)}
+                alive = range(len(output_bindings))
+                try:
+                    for vector, ir_output in zip(vectors, ir_outputs):
+                        arch_output = _simulate(arch_cls, {**vector, **const_values})
+                        alive = [bo for bo in alive if all(ir_output[i] == arch_output[a] for i, a in compared[bo])]
+                        if not alive:
+                            break
+                except Exception as e:
+                    #Some peak objects only run in the SMT family (eg reading
+                    #the value of an unmatched Sum)
+                    logger.debug(f"Can not simulate the arch: {e}")
+                    unsimulatable.add(fi)
+                    break
+                const_encodings = {path: encoding for path, (_, encoding) in zip(const_paths, const)}
+                for bo in alive:
+                    count(stats, "enumerative_verifies")
+                    rr = rr_from_selection(
+                        ibinding,
+                        output_bindings[bo],
+                        set(const_paths),
+                        const_encodings.__getitem__,
+                        irmapper.peak_fc,
+                        am.peak_fc,
+                    )
+                    if rr.verify(solver_name) is None:
+                        return rr, unsimulatable
+            if fi in unsimulatable:
+                break
+    return None, unsimulatable
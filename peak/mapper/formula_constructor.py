@@ -1,11 +1,58 @@
 import operator
-from functools import partial, reduce, lru_cache
+import weakref
+from functools import partial
 
-or_reduce = partial(reduce, operator.or_)
-and_reduce = partial(reduce, operator.and_)
+import pysmt.shortcuts as smt
+from hwtypes import SMTBit
+
+#Reduces values with op as a balanced tree (depth log2(len(values))) instead
+#of the left-deep chain produced by functools.reduce
+def balanced_reduce(op, values):
+    values = list(values)
+    if len(values) == 0:
+        raise TypeError("balanced_reduce() of empty sequence")
+    while len(values) > 1:
+        reduced = [op(values[i], values[i+1]) for i in range(0, len(values)-1, 2)]
+        if len(values) % 2:
+            reduced.append(values[-1])
+        values = reduced
+    return values[0]
+
+or_reduce = partial(balanced_reduce, operator.or_)
+and_reduce = partial(balanced_reduce, operator.and_)
 
 class FormulaConstructor:
-    pass
+    '''
+    Nodes are hash-consed: constructing a node with the same operands as a
+    live node returns that node. So structurally equal subformulas are shared
+    and each is lowered by to_hwtypes only once.
+    '''
+    #(cls, operand keys) -> node
+    _nodes = weakref.WeakValueDictionary()
+
+    @classmethod
+    def _cons(cls, values):
+        key = (cls, tuple(_key(v) for v in values))
+        node = FormulaConstructor._nodes.get(key)
+        if node is None:
+            node = object.__new__(cls)
+            node._init(values)
+            FormulaConstructor._nodes[key] = node
+        return node
+
+    def _init(self, values):
+        self._hw = None
+
+    def to_hwtypes(self):
+        if self._hw is None:
+            self._hw = self._lower()
+        return self._hw
+
+#Leaves are keyed by their pysmt node (which pysmt already hash-conses)
+def _key(v):
+    if isinstance(v, FormulaConstructor):
+        return v
+    return v.value
 
 def _to_hwtypes(v):
     if isinstance(v, FormulaConstructor):
@@ -25,41 +72,83 @@ def _op_to_str(vs, opname, ts, indent):
         ",\n".join([_value_to_str(v, new_ts, indent) for v in vs]),
         f"{ts})"
     ])
-from hwtypes import SMTBit
+
 def _check(vs):
     assert len(vs) > 0
     for v in vs:
         assert isinstance(v, FormulaConstructor) or isinstance(v, SMTBit)
-class And(FormulaConstructor):
-    def __init__(self, values: list):
-        self.values = list(values)
-        _check(self.values)
 
-    def serialize(self, ts="", indent="|   "):
-        return _op_to_str(self.values, "And", ts, indent)
+def _is_const(v, b: bool):
+    if isinstance(v, FormulaConstructor):
+        return v._const is b
+    return v.value.is_bool_constant(b)
 
-    def to_hwtypes(self):
-        return and_reduce(_to_hwtypes(v) for v in self.values)
+class _NAry(FormulaConstructor):
+    #Value which is dropped from the operands (True for And)
+    _unit = None
+    _name = None
+    _smt_op = None
 
-class Or(FormulaConstructor):
-    def __init__(self, values: list):
-        self.values = list(values)
-        _check(self.values)
+    def __new__(cls, values: list):
+        values = list(values)
+        _check(values)
+        #Flatten nested nodes of the same kind, drop duplicate and unit
+        #operands and short circuit on the absorbing constant
+        flat = {}
+        stack = values[::-1]
+        while stack:
+            v = stack.pop()
+            if type(v) is cls:
+                stack.extend(v.values[::-1])
+            elif _is_const(v, not cls._unit):
+                return cls._cons([SMTBit(not cls._unit)])
+            elif not _is_const(v, cls._unit):
+                flat.setdefault(_key(v), v)
+        if len(flat) == 0:
+            return cls._cons([SMTBit(cls._unit)])
+        return cls._cons(list(flat.values()))
+
+    def _init(self, values):
+        super()._init(values)
+        self.values = values
+        if len(values) == 1 and not isinstance(values[0], FormulaConstructor) and values[0].value.is_bool_constant():
+            self._const = values[0].value.is_true()
+        else:
+            self._const = None
 
     def serialize(self, ts="", indent="|   "):
-        return _op_to_str(self.values, "Or", ts, indent)
+        return _op_to_str(self.values, self._name, ts, indent)
 
-    def to_hwtypes(self):
-        return or_reduce(_to_hwtypes(v) for v in self.values)
+    def _lower(self):
+        values = [_to_hwtypes(v).value for v in self.values]
+        if len(values) == 1:
+            return SMTBit(values[0])
+        #Lower to a single n-ary pysmt node
+        return SMTBit(type(self)._smt_op(values))
+
+class And(_NAry):
+    _unit = True
+    _name = "And"
+    _smt_op = staticmethod(smt.And)
+
+class Or(_NAry):
+    _unit = False
+    _name = "Or"
+    _smt_op = staticmethod(smt.Or)
 
 class Implies(FormulaConstructor):
-    def __init__(self, p, q):
-        self.p = p
-        self.q = q
+    _const = None
+
+    def __new__(cls, p, q):
         _check([p, q])
+        return cls._cons([p, q])
+
+    def _init(self, values):
+        super()._init(values)
+        self.p, self.q = values
 
     def serialize(self, ts="", indent="|   "):
         return _op_to_str((self.p, self.q), "Implies", ts, indent)
 
-    def to_hwtypes(self):
+    def _lower(self):
         return (~_to_hwtypes(self.p)) | _to_hwtypes(self.q)
@@ -1,4 +1,5 @@
 import abc
+import typing as tp
 from hwtypes import TypeFamily
 from .formula_constructor import And, Or
 from peak.family import SMTFamily
@@ -8,11 +9,15 @@ class IndexVar:
         self.num_entries = num_entries
         self.var = SMT.BitVector[self.var_len(num_entries)](prefix=name)
         self.SMT = SMT
+        self._matches = {}
 
     def match_index(self, i: int):
         if i not in range(self.num_entries):
             raise ValueError(f"Index {i} out of bounds")
-        return (self.var == self.translate_index(self.num_entries, i))
+        #The same match is used in many conditions of the formula
+        if i not in self._matches:
+            self._matches[i] = (self.var == self.translate_index(self.num_entries, i))
+        return self._matches[i]
 
     def decode(self, v: int):
         for i in range(self.num_entries):
@@ -66,3 +71,101 @@ class Binary(IndexVar):
         else:
             return self.var < self.num_entries
 
+
+class Gray(IndexVar):
+    @staticmethod
+    def var_len(num_entries: int):
+        return Binary.var_len(num_entries)
+
+    @staticmethod
+    def translate_index(num_entries: int, i: int):
+        return i ^ (i >> 1)
+
+    def is_valid(self):
+        width = self.var_len(self.num_entries)
+        if self.num_entries == 2**width:
+            return self.SMT.Bit(True)
+        #Convert back to binary then do a range check
+        b = self.var
+        shift = 1
+        while shift < width:
+            b = b ^ (b >> shift)
+            shift *= 2
+        return b < self.num_entries
+
+#Mixed radix encoding where each of the DIGITS digits is a small one-hot group.
+#Uses DIGITS*ceil(num_entries**(1/DIGITS)) bits instead of num_entries.
+class HybridOneHot(IndexVar):
+    DIGITS = 2
+
+    @classmethod
+    def radix(cls, num_entries: int):
+        k = 1
+        while k**cls.DIGITS < num_entries:
+            k += 1
+        return k
+
+    @classmethod
+    def var_len(cls, num_entries: int):
+        return cls.DIGITS*cls.radix(num_entries)
+
+    @classmethod
+    def translate_index(cls, num_entries: int, i: int):
+        k = cls.radix(num_entries)
+        val = 0
+        for d in range(cls.DIGITS):
+            i, digit = divmod(i, k)
+            val |= 2**(d*k + digit)
+        return val
+
+    def is_valid(self):
+        k = self.radix(self.num_entries)
+        BV = self.SMT.BitVector
+        index_len = Binary.var_len(k**self.DIGITS) + 1
+        valid = self.SMT.Bit(True)
+        index = BV[index_len](0)
+        for d in reversed(range(self.DIGITS)):
+            group = self.var[d*k:(d+1)*k]
+            valid &= ((group & (group-1))==0) & (group!=0)
+            digit = BV[index_len](0)
+            for b in range(1, k):
+                digit = group[b].ite(BV[index_len](b), digit)
+            index = index*k + digit
+        return valid & (index < self.num_entries)
+
+#Encodings selectable by name
+ENCODINGS = dict(
+    onehot=OneHot,
+    binary=Binary,
+    gray=Gray,
+    hybrid=HybridOneHot,
+)
+
+#Entry counts up to which each encoding is used by Auto
+AUTO_ONEHOT_MAX = 16
+AUTO_HYBRID_MAX = 256
+
+def auto_encoding(num_entries: int) -> tp.Type[IndexVar]:
+    if num_entries <= AUTO_ONEHOT_MAX:
+        return OneHot
+    elif num_entries <= AUTO_HYBRID_MAX:
+        return HybridOneHot
+    return Binary
+
+#Chooses the encoding based on the number of entries
+class Auto(IndexVar):
+    def __new__(cls, num_entries: int, name: str, SMT=SMTFamily()):
+        return auto_encoding(num_entries)(num_entries, name, SMT)
+
+#Resolves an IVar argument which is either an IndexVar class or the name of
+#an encoding ('auto' chooses the encoding for each index variable separately)
+def get_index_var(IVar: tp.Union[str, tp.Type[IndexVar]]) -> tp.Type[IndexVar]:
+    if isinstance(IVar, str):
+        if IVar == "auto":
+            return Auto
+        if IVar not in ENCODINGS:
+            raise ValueError(f"Unknown IndexVar encoding {IVar}, expected one of {['auto', *ENCODINGS]}")
+        return ENCODINGS[IVar]
+    if not (isinstance(IVar, type) and issubclass(IVar, IndexVar)):
+        raise TypeError(f"Expected an IndexVar, got {IVar}")
+    return IVar
@@ -0,0 +1,295 @@
+import typing as tp
+
+from hwtypes.modifiers import strip_modifiers
+
+from peak import Const
+from peak.assembler import Assembler, AssembledADT
+from .mapper import RewriteRule, _create_path_to_adt
+
+#A pattern is a tree of IR instruction names. An int leaf is a hole: the
+#pattern input (IR instruction input field) of that index.
+#eg ("Add", ("Mul", 0, 1), 2) for an instruction computing in0*in1 + in2
+Pattern = tp.Union[int, tuple]
+
+
+class DataflowGraph:
+    '''
+    DAG of IR instructions with a single output each. Nodes are numbered in
+    the order they are added and operands have to be added before their
+    users, so the numbering is a topological order.
+    '''
+    def __init__(self):
+        #op of each node (IR instruction name, None for graph inputs)
+        self.ops: tp.List[tp.Optional[str]] = []
+        self.operands: tp.List[tp.Tuple[int, ...]] = []
+        self.outputs: tp.List[int] = []
+        self.input_names: tp.Dict[int, str] = {}
+
+    def __len__(self):
+        return len(self.ops)
+
+    def add_input(self, name: tp.Optional[str] = None) -> int:
+        node = len(self.ops)
+        self.ops.append(None)
+        self.operands.append(())
+        self.input_names[node] = f"in{node}" if name is None else name
+        return node
+
+    def add(self, op: str, *operands: int) -> int:
+        node = len(self.ops)
+        for o in operands:
+            if not 0 <= o < node:
+                raise ValueError(f"Operand {o} of {op} is not a node")
+        self.ops.append(op)
+        self.operands.append(tuple(operands))
+        return node
+
+    def mark_output(self, node: int):
+        if not 0 <= node < len(self.ops):
+            raise ValueError(f"{node} is not a node")
+        self.outputs.append(node)
+
+
+def _holes(pattern, holes):
+    if isinstance(pattern, int):
+        holes.add(pattern)
+    else:
+        for child in pattern[1:]:
+            _holes(child, holes)
+    return holes
+
+
+class TileRule:
+    '''
+    A rewrite rule as a tile: covering the nodes which match pattern with the
+    arch instruction of rule costs cost.
+    The Const arch inputs of the rule are built (and assembled) on first use.
+    They have to be the same for every tile, so rules binding an IR input
+    (eg an IR Const immediate) into a Const arch input are rejected: the
+    nodes of a DataflowGraph do not carry constants.
+    '''
+    def __init__(self, name: str, rule: RewriteRule, pattern: Pattern, cost: float = 1):
+        self.name = name
+        self.rule = rule
+        self.pattern = pattern
+        self.cost = cost
+
+        ir_cls = rule.ir_fc.Py
+        input_fields = list(ir_cls.input_t.field_dict)
+        output_fields = list(ir_cls.output_t.field_dict)
+        if len(output_fields) != 1:
+            raise ValueError(f"IR instruction of {name} needs exactly one output")
+        if isinstance(pattern, int) or _holes(pattern, set()) != set(range(len(input_fields))):
+            raise ValueError(f"Pattern {pattern} needs one hole for each of the {len(input_fields)} inputs of {name}")
+
+        arch_fields = rule.arch_fc.Py.input_t.field_dict
+        for ir_path, arch_path in rule.ibinding:
+            if isinstance(ir_path, tuple) and issubclass(arch_fields[arch_path[0]], Const):
+                raise ValueError(f"{name} binds the IR input {ir_path} into the Const arch input {arch_path}")
+
+        #(hole, ir path, arch path) of the bound IR inputs
+        self.inputs = tuple(
+            (input_fields.index(ir_path[0]), ir_path, arch_path)
+            for ir_path, arch_path in rule.ibinding if isinstance(ir_path, tuple)
+        )
+        [self.output] = [arch_path for ir_path, arch_path in rule.obinding if ir_path == (output_fields[0],)]
+        self._instruction = None
+
+    #Const arch input field -> (assembled opcode, instruction value)
+    def instruction(self) -> tp.Dict[str, tp.Tuple]:
+        if self._instruction is None:
+            rule = self.rule
+            family = rule.family.PyFamily()
+            ir_paths, arch_paths = rule.get_input_paths()
+            ir_types = _create_path_to_adt(strip_modifiers(rule.ir_fc.Py.input_t))
+            arch_types = _create_path_to_adt(strip_modifiers(rule.arch_fc.Py.input_t))
+            _, arch_inputs = rule.build_inputs(
+                {p: _zero(ir_types[p]) for p in ir_paths},
+                {p: _zero(arch_types[p]) for p in arch_paths},
+                family,
+            )
+            field_dict = rule.arch_fc.Py.input_t.field_dict
+            instruction = {}
+            for field, value in arch_inputs.items():
+                if isinstance(value, AssembledADT):
+                    opcode = value._value_
+                    T = strip_modifiers(field_dict[field])
+                    instruction[field] = (opcode, Assembler(T).disassemble(opcode))
+            self._instruction = instruction
+        return self._instruction
+
+    def __repr__(self):
+        return f"TileRule({self.name}, {self.pattern}, cost={self.cost})"
+
+#Unbound arch inputs do not change the instruction
+def _zero(T):
+    T = strip_modifiers(T)
+    try:
+        return T(0)
+    except TypeError:
+        return Assembler(T).disassemble(0)
+
+
+class RuleLibrary:
+    '''
+    The tiles available to select_instructions, indexed by the IR
+    instruction at the root of their pattern.
+    '''
+    def __init__(self):
+        self.by_root: tp.Dict[str, tp.List[TileRule]] = {}
+
+    def add(self, name: str, rule: RewriteRule, pattern: tp.Optional[Pattern] = None, cost: float = 1) -> TileRule:
+        '''
+        Adds rule (whose IR instruction is name). Without a pattern the rule
+        covers a single node: (name, 0, 1, ...)
+        '''
+        if pattern is None:
+            pattern = (name, *range(len(rule.ir_fc.Py.input_t.field_dict)))
+        tile = TileRule(name, rule, pattern, cost)
+        self.by_root.setdefault(pattern[0], []).append(tile)
+        return tile
+
+    def __len__(self):
+        return sum(len(tiles) for tiles in self.by_root.values())
+
+    @classmethod
+    def from_rules(cls, rules: tp.Mapping[str, RewriteRule], patterns: tp.Mapping[str, Pattern] = {}, costs: tp.Mapping[str, float] = {}) -> "RuleLibrary":
+        library = cls()
+        for name, rule in rules.items():
+            if rule is not None:
+                library.add(name, rule, patterns.get(name), costs.get(name, 1))
+        return library
+
+    @classmethod
+    def from_database(cls, db, ir, arch_fc, names: tp.Optional[tp.Iterable[str]] = None, patterns: tp.Mapping[str, Pattern] = {}, costs: tp.Mapping[str, float] = {}) -> "RuleLibrary":
+        '''
+        Loads the first rule of each IR instruction in names (every
+        instruction of ir by default) from the RuleDatabase db
+        '''
+        if names is None:
+            names = ir.instructions
+        library = cls()
+        for name in names:
+            entries = db.entries(name=name)
+            if entries:
+                rule = db.load(entries[0], ir.instructions[name], arch_fc)
+                library.add(name, rule, patterns.get(name), costs.get(name, 1))
+        return library
+
+
+class Tile(tp.NamedTuple):
+    #Node computed by the tile
+    root: int
+    tile_rule: TileRule
+    #Node of each hole of the pattern
+    operands: tp.Tuple[int, ...]
+    #Nodes covered by the tile
+    nodes: tp.Tuple[int, ...]
+
+    @property
+    def name(self):
+        return self.tile_rule.name
+
+    #Const arch input field -> (assembled opcode, instruction value)
+    def instruction(self):
+        return self.tile_rule.instruction()
+
+    #arch input path -> node
+    def inputs(self) -> tp.Dict[tuple, int]:
+        return {arch_path: self.operands[hole] for hole, _, arch_path in self.tile_rule.inputs}
+
+
+class Selection(tp.NamedTuple):
+    #In topological order
+    tiles: tp.List[Tile]
+    #Index in tiles of the tile covering each node (-1 for graph inputs)
+    node_tile: tp.List[int]
+    cost: float
+
+
+#Matches pattern at node. Holes are appended to holes and the covered nodes
+#to nodes. Only node itself may be shared.
+def _match(pattern, node, ops, operands, shared, holes, nodes):
+    if ops[node] != pattern[0] or len(operands[node]) != len(pattern) - 1:
+        return False
+    nodes.append(node)
+    for child, operand in zip(pattern[1:], operands[node]):
+        if isinstance(child, int):
+            while len(holes) <= child:
+                holes.append(None)
+            if holes[child] is None:
+                holes[child] = operand
+            elif holes[child] != operand:
+                return False
+        elif shared[operand] or not _match(child, operand, ops, operands, shared, holes, nodes):
+            return False
+    return True
+
+
+def select_instructions(graph: DataflowGraph, library: RuleLibrary) -> Selection:
+    '''
+    Covers graph with the tiles of library.
+
+    The DAG is cut into trees at every shared node (an output, or a node
+    with more or less than one user), which is computed once by the root of
+    its own tile. Each tree is covered optimally, with respect to the sum of
+    the tile costs, by dynamic programming over the nodes in topological
+    order, which is linear in the size of the graph for a fixed library.
+    Raises ValueError if no tile matches some node.
+    '''
+    ops = graph.ops
+    operands = graph.operands
+    n = len(ops)
+    uses = [0] * n
+    for node_operands in operands:
+        for o in node_operands:
+            uses[o] += 1
+    shared = [u != 1 for u in uses]
+    for o in graph.outputs:
+        shared[o] = True
+    for node, op in enumerate(ops):
+        if op is None:
+            shared[node] = True
+
+    #Cost of the cheapest cover of the tree below node and its tile
+    best = [0] * n
+    choice: tp.List[tp.Optional[tuple]] = [None] * n
+    by_root = library.by_root
+    for node in range(n):
+        op = ops[node]
+        if op is None:
+            continue
+        best_cost = None
+        for tile_rule in by_root.get(op, ()):
+            holes = []
+            nodes = []
+            if not _match(tile_rule.pattern, node, ops, operands, shared, holes, nodes):
+                continue
+            cost = tile_rule.cost
+            for h in holes:
+                if not shared[h]:
+                    cost += best[h]
+            if best_cost is None or cost < best_cost:
+                best_cost = cost
+                choice[node] = (tile_rule, tuple(holes), tuple(nodes))
+        if best_cost is None:
+            raise ValueError(f"No rule covers node {node} ({op})")
+        best[node] = best_cost
+
+    #Tiles of every tree, starting from the shared nodes
+    node_tile = [-1] * n
+    roots = [node for node in range(n) if shared[node] and ops[node] is not None]
+    stack = list(roots)
+    chosen = []
+    while stack:
+        node = stack.pop()
+        tile_rule, holes, nodes = choice[node]
+        chosen.append(Tile(node, tile_rule, holes, nodes))
+        for h in holes:
+            if not shared[h]:
+                stack.append(h)
+    chosen.sort(key=lambda tile: tile.root)
+    for idx, tile in enumerate(chosen):
+        for node in tile.nodes:
+            node_tile[node] = idx
+    return Selection(chosen, node_tile, sum(best[node] for node in roots))
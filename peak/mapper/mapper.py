@@ -1,8 +1,10 @@
 import itertools
 import random
+import time
 import typing as tp
 from functools import lru_cache
-from collections import defaultdict
+from contextlib import contextmanager, closing
+from collections import defaultdict, namedtuple
 from peak import family_closure, Const
 from hwtypes.adt import Product, Tuple
 from hwtypes import Bit, BitVector, SMTBit
@@ -10,13 +12,16 @@ from hwtypes import AbstractBit, AbstractBitVector, TypeFamily
 from hwtypes.adt import is_adt_type
 from hwtypes.modifiers import strip_modifiers, wrap_modifier, unwrap_modifier
 from peak.assembler import Assembler, AssembledADT
-from .index_var import IndexVar, OneHot
-from .utils import SMTForms, SimplifyBinding
+from .index_var import IndexVar, OneHot, get_index_var
+from .stats import MapperStats, phase, count
+from .cex_pool import CounterexamplePool
+from .utils import SMTForms, SimplifyBinding, LazyList
 from .utils import Unbound, Match
 from .utils import create_bindings, pretty_print_binding
 from .utils import aadt_product_to_dict
 from .utils import solved_to_bv, log2
-from .utils import rebind_binding
+from .utils import rebind_binding, rebind_value
+from .utils import path_to_json, path_from_json
 from hwtypes.adt_meta import GetitemSyntax, AttrSyntax, EnumMeta
 import inspect
 from peak import Peak
@@ -32,6 +37,7 @@ from pysmt.logics import BV
 from pysmt import typing as smt_typing
 
 from .formula_constructor import And, Or, Implies, or_reduce, and_reduce
+from .prefilter import prefilter_bindings
 
 
 def _create_free_var(aadt, name, SMT=peak_family.SMTFamily()):
@@ -110,11 +116,16 @@ def get_bb_inputs(peak_obj):
 
 
 class SMTMapper:
-    def __init__(self, peak_fc: tp.Callable, family: TypeFamily=peak_family, IVar: IndexVar=OneHot):
+    #tag_constraints: sum path -> allowed choices, see SMTForms. Only the
+    #paths which are sums of the input are kept (in self.tag_constraints)
+    def __init__(self, peak_fc: tp.Callable, family: TypeFamily=peak_family, IVar: IndexVar=OneHot, stats: tp.Optional[MapperStats] = None, tag_constraints={}):
+        IVar = get_index_var(IVar)
         self.family = family
+        self.stats = stats
         if not isinstance(peak_fc, family_closure):
             raise ValueError(f"family closure {peak_fc} needs to be decorated with @family_closure")
-        Peak_cls = _get_peak_cls(peak_fc(family.SMTFamily()))
+        with phase(stats, "peak_class"):
+            Peak_cls = _get_peak_cls(peak_fc(family.SMTFamily()))
         try:
             input_t = Peak_cls.input_t
             output_t = Peak_cls.output_t
@@ -134,30 +145,41 @@ class SMTMapper:
         self.bb_outputs = create_and_set_bb_outputs(self.peak_obj, prefix=f"BB.{Peak_cls.__name__}")
 
         self.output_aadt_t = output_aadt_t
-        input_forms, input_varmap, input_value = SMTForms()(input_aadt_t)
+        with phase(stats, "forms"):
+            input_smt_forms = SMTForms(tag_constraints)
+            input_forms, input_varmap, input_value = input_smt_forms(input_aadt_t)
         self.input_value = input_value
+        self.tag_constraints = {path: tag_constraints[path] for path in input_smt_forms.constrained}
 
-        #output_form = output_forms[input_form_idx][output_form_idx]
-        output_forms = []
-        self.const_valid_conditions = []
         const_fields = [field for field, T in input_t.field_dict.items() if issubclass(T, Const)]
 
-        for input_form in input_forms:
-            inputs = aadt_product_to_dict(input_form.value)
-            self.const_valid_conditions.append([is_valid(inputs[field]) for field in const_fields])
+        #The peak object is only evaluated on an input form when its outputs
+        #or const conditions are first needed
+        def eval_form(fi):
+            inputs = aadt_product_to_dict(input_forms[fi].value)
+            const_valid_conditions = [is_valid(inputs[field]) for field in const_fields]
             #Construct output_aadt value
-            outputs = self.peak_obj(**inputs)
+            with phase(stats, "symbolic_execution"):
+                outputs = self.peak_obj(**inputs)
 
             output_value = wrap_outputs(outputs, output_aadt_t)
 
-            forms, output_varmap, _ = SMTForms()(output_aadt_t, value=output_value)
-
-            output_forms.append(forms)
-        num_input_forms = len(output_forms)
-        num_output_forms = len(output_forms[0])
-
-        #verify same number of output forms
-        assert all(num_output_forms == len(forms) for forms in output_forms)
+            with phase(stats, "forms"):
+                forms, output_varmap, _ = SMTForms()(output_aadt_t, value=output_value)
+            return const_valid_conditions, forms
+
+        num_input_forms = len(input_forms)
+        evaluated_forms = LazyList(num_input_forms, eval_form)
+        #(const_valid_conditions, output forms) of each input form. Can be
+        #primed from an on disk cache (see arch_cache.py)
+        self.evaluated_forms = evaluated_forms
+        self.const_fields = const_fields
+        self.const_valid_conditions = LazyList(num_input_forms, lambda fi: evaluated_forms[fi][0])
+        #output_form = output_forms[input_form_idx][output_form_idx]
+        output_forms = LazyList(num_input_forms, lambda fi: evaluated_forms[fi][1])
+        #The number of output forms only depends on the output type, so it
+        #is taken from the forms of a free output value
+        num_output_forms = len(SMTForms()(output_aadt_t)[0])
         self.peak_fc = peak_fc
         self.input_form_var = IVar(num_input_forms, name=f"fi", SMT=family.SMTFamily())
         self.output_form_var = IVar(num_output_forms, name=f"fo", SMT=family.SMTFamily())
@@ -169,6 +191,11 @@ class SMTMapper:
         self.input_varmap = input_varmap
         self.const_paths = set(path for path, T in self.path_to_adt(True, strip=False).items() if issubclass(T, Const))
 
+    #The peak class of the Py family of self.family
+    @lru_cache(None)
+    def py_peak_cls(self):
+        return _get_peak_cls(self.peak_fc(self.family.PyFamily()))
+
     @lru_cache(None)
     def path_to_adt(self, input, strip=False):
         cls = self.peak_fc.Py
@@ -178,17 +205,30 @@ class SMTMapper:
         return _create_path_to_adt(adt)
 
 class ArchMapper(SMTMapper):
-    def __init__(self, arch_fc, *, path_constraints= {}, family=peak_family, IVar: IndexVar=OneHot):
-        super().__init__(arch_fc, family=family, IVar=IVar)
+    #path_constraints: path -> allowed value(s). The path is either an adt
+    #leaf of the input or a Sum (TaggedUnion) whose allowed values are its
+    #fields (field names). Input forms choosing any other field of a
+    #constrained Sum are removed before anything is built for them.
+    #pool_size: entries per sort of the counterexample pool shared by the
+    #CEGIS runs of every IR instruction (see CounterexamplePool). The pool
+    #changes which candidates CEGIS starts from, so it is off (0) unless
+    #asked for, eg with CounterexamplePool.DEFAULT_SIZE.
+    def __init__(self, arch_fc, *, path_constraints= {}, family=peak_family, IVar: IndexVar=OneHot, interchangeable=(), stats: tp.Optional[MapperStats] = None, pool_size: int = 0):
+        path_constraints = {path: (c if isinstance(c, tuple) else (c,)) for path, c in path_constraints.items()}
+        super().__init__(arch_fc, family=family, IVar=IVar, stats=stats, tag_constraints=path_constraints)
+        if stats is not None:
+            stats.set("num_input_forms", self.num_input_forms)
+            stats.set("num_output_forms", self.num_output_forms)
         if self.num_output_forms > 1:
             raise NotImplementedError("Multiple ir output forms")
 
-        #Verify that all the path_constraints are valid
-        path_constraints = {path: (c if isinstance(c, tuple) else (c,)) for path, c in path_constraints.items()}
+        #Verify that all the path_constraints are valid. The ones on Sums
+        #were already applied to the input forms.
+        path_constraints = {path: c for path, c in path_constraints.items() if path not in self.tag_constraints}
         path_to_adt = self.path_to_adt(input=True, strip=True)
         for path, constraints in path_constraints.copy().items():
             if path not in path_to_adt:
-                raise ValueError(f"{path} is either invalid or not an adt leaf")
+                raise ValueError(f"{path} is either invalid or not an adt leaf or sum")
             assert path in self.input_varmap
             adt = path_to_adt[path]
             aadt = self.family.SMTFamily().get_adt_t(rebind_type(adt, self.family.SMTFamily()))
@@ -200,10 +240,39 @@ class ArchMapper(SMTMapper):
             path_constraints[path] =constraints
 
         self.path_constraints = path_constraints
-        self.IVar = IVar
 
-    def process_ir_instruction(self, ir_fc, simple_formula=False):
-        return IRMapper(self, ir_fc, simple_formula, self.IVar)
+        #Verify that each group of interchangeable inputs are distinct leaves
+        #of the same type. Bindings which only differ by a permutation within
+        #a group are considered equivalent and only one of them is tried.
+        interchangeable = tuple(tuple(group) for group in interchangeable)
+        grouped = set()
+        for group in interchangeable:
+            for path in group:
+                if path not in path_to_adt:
+                    raise ValueError(f"{path} is either invalid or not an adt leaf")
+                if path in grouped:
+                    raise ValueError(f"{path} is in multiple interchangeable groups")
+                grouped.add(path)
+            if len(set(path_to_adt[path] for path in group)) > 1:
+                raise ValueError(f"Interchangeable paths {group} have different types")
+        #A constrained path can not be swapped with the other paths of its
+        #group, so it is removed from it before breaking the symmetry
+        interchangeable = tuple(
+            group for group in (tuple(p for p in group if p not in path_constraints) for group in interchangeable)
+            if len(group) > 1
+        )
+        self.interchangeable = interchangeable
+        self.IVar = get_index_var(IVar)
+        self.active_session = None
+        self.counterexample_pool = CounterexamplePool(pool_size) if pool_size > 0 else None
+
+    def process_ir_instruction(self, ir_fc, simple_formula=False, stats: tp.Optional[MapperStats] = None, prefilter: int = 0):
+        return IRMapper(self, ir_fc, simple_formula, self.IVar, stats=stats, prefilter=prefilter)
+
+    #Returns a MapperSession. While the session is entered every
+    #IRMapper.solve using the same solver_name and logic runs in it.
+    def session(self, solver_name: str = 'z3', logic=BV) -> "MapperSession":
+        return MapperSession(self, solver_name, logic)
 
 def is_valid(aadt_value: tp.Union[AssembledADT, AbstractBit, AbstractBitVector]):
     if isinstance(aadt_value, (AbstractBitVector, AbstractBit)):
@@ -303,7 +372,13 @@ class RewriteRule:
         return values
 
     # Returns a counterexample if found, otherwise None
-    def verify(self, solver_name: str = "z3") -> tp.Union[None, "CounterExample"]:
+    def verify(self, solver_name: str = "z3", session: tp.Optional["MapperSession"] = None, stats: tp.Optional[MapperStats] = None) -> tp.Union[None, "CounterExample"]:
+        with phase(stats, "verify"):
+            if session is not None:
+                return session.verify(self)
+            return self._verify(solver_name)
+
+    def _verify(self, solver_name: str) -> tp.Union[None, "CounterExample"]:
 
         # create free variable for each ir_val
         # The types are all Py
@@ -359,26 +434,40 @@ class RewriteRule:
                 arch_ce = {path: solved_to_bv(var, solver) for path, var in arch_values.items()}
                 return ir_ce, arch_ce
 
-    def serialize_bindings(self):
+    #If portable is set every path is converted with path_to_json so the
+    #result can be written out as json or sent to another process
+    def serialize_bindings(self, portable: bool = False):
+        if portable:
+            ir_bv = self.ir_fc.Py
+            arch_bv = self.arch_fc.Py
+            ir_ipath = lambda p: path_to_json(ir_bv.input_t, p)
+            arch_ipath = lambda p: path_to_json(arch_bv.input_t, p)
+            ir_opath = lambda p: path_to_json(ir_bv.output_t, p)
+            arch_opath = lambda p: path_to_json(arch_bv.output_t, p)
+        else:
+            ir_ipath = arch_ipath = ir_opath = arch_opath = lambda p: p
+
         rrule_out = {}
         rrule_out["ibinding"] = []
         for t in self.ibinding:
             if isinstance(t[0], BitVector):
-                rrule_out["ibinding"].append(tuple([{'type':'BitVector', 'width':len(t[0]), 'value':t[0].value}, t[1]]))
+                rrule_out["ibinding"].append(tuple([{'type':'BitVector', 'width':len(t[0]), 'value':t[0].value}, arch_ipath(t[1])]))
             elif isinstance(t[0], Bit):
-                rrule_out["ibinding"].append(tuple([{'type':'Bit', 'width':1, 'value':t[0]._value}, t[1]]))
+                rrule_out["ibinding"].append(tuple([{'type':'Bit', 'width':1, 'value':t[0]._value}, arch_ipath(t[1])]))
             elif t[0] == Unbound:
-                rrule_out["ibinding"].append(tuple(["unbound", t[1]]))
+                rrule_out["ibinding"].append(tuple(["unbound", arch_ipath(t[1])]))
             else:
-                rrule_out["ibinding"].append(t)
+                rrule_out["ibinding"].append(tuple([ir_ipath(t[0]), arch_ipath(t[1])]))
 
         rrule_out["obinding"] = []
         for t in self.obinding:
             if t[0] == Unbound:
-                rrule_out["obinding"].append(tuple(["unbound", t[1]]))
+                rrule_out["obinding"].append(tuple(["unbound", arch_opath(t[1])]))
             else:
-                rrule_out["obinding"].append(t)
+                rrule_out["obinding"].append(tuple([ir_opath(t[0]), arch_opath(t[1])]))
 
+        if portable:
+            rrule_out["portable"] = True
         return rrule_out
 
 def read_serialized_bindings(serialized_rr, ir_fc, arch_fc):
@@ -386,6 +475,16 @@ def read_serialized_bindings(serialized_rr, ir_fc, arch_fc):
     input_binding = []
     output_binding = []
 
+    if serialized_rr.get("portable", False):
+        ir_bv = ir_fc.Py
+        arch_bv = arch_fc.Py
+        ir_ipath = lambda p: path_from_json(ir_bv.input_t, p)
+        arch_ipath = lambda p: path_from_json(arch_bv.input_t, p)
+        ir_opath = lambda p: path_from_json(ir_bv.output_t, p)
+        arch_opath = lambda p: path_from_json(arch_bv.output_t, p)
+    else:
+        ir_ipath = arch_ipath = ir_opath = arch_opath = tuple
+
     for i in serialized_rr["ibinding"]:
         if isinstance(i[0], dict):
             u = i[0]
@@ -395,22 +494,28 @@ def read_serialized_bindings(serialized_rr, ir_fc, arch_fc):
             elif u['type'] == "Bit":
                 u = (Bit(u['value']))
 
-            input_binding.append(tuple([u, tuple(v) ]))
+            input_binding.append(tuple([u, arch_ipath(v)]))
         elif i[0] == "unbound":
-            input_binding.append(tuple([Unbound, tuple(i[1])]))
+            input_binding.append(tuple([Unbound, arch_ipath(i[1])]))
         else:
-            input_binding.append(tuple([tuple(i[0]), tuple(i[1])]))
+            input_binding.append(tuple([ir_ipath(i[0]), arch_ipath(i[1])]))
 
     for o in serialized_rr["obinding"]:
         if o[0] == "unbound":
-            output_binding.append(tuple([Unbound, tuple(o[1])]))
+            output_binding.append(tuple([Unbound, arch_opath(o[1])]))
         else:
-            output_binding.append(tuple([tuple(o[0]), tuple(o[1])]))
+            output_binding.append(tuple([ir_opath(o[0]), arch_opath(o[1])]))
 
     return RewriteRule(input_binding, output_binding, ir_fc, arch_fc)
 
 
 #T is always a Py type
+#The pysmt term of an output value
+def _term(value):
+    if isinstance(value, AssembledADT):
+        value = value._value_
+    return value.value
+
 def _free_var_from_t(T, family):
     T = rebind_type(T, family.SMTFamily())
     if issubclass(T, (family.SMTFamily().BitVector, family.SMTFamily().Bit)):
@@ -461,9 +566,37 @@ def update_with_bb(
         return Implies(bb_cond, f), bb_forall
     return f, bb_forall
 
+#Unless external_loop is given, IRMapper.solve instantiates the formula for
+#every assignment of the forall vars (instead of using ForAll) when they have
+#at most this many bits in total. Each instance is a pysmt substitution of the whole
+#formula, so this only pays off for a handful of instances.
+EXPAND_WIDTH = 4
+
+def _var_width(var):
+    T = var.get_type()
+    return T.width if T.is_bv_type() else 1
+
+def forall_width(y) -> int:
+    return sum(_var_width(v) for v in y)
+
+#Conjunction of phi instantiated with every assignment of y (the instances
+#are left for the solver to simplify)
+def expand_forall(y, phi):
+    y = list(y)
+    widths = [_var_width(v) for v in y]
+    instances = []
+    for values in itertools.product(*(range(1 << w) for w in widths)):
+        sigma = {v: _int_to_pysmt(x, v.get_type()) for v, x in zip(y, values)}
+        instances.append(phi.substitute(sigma))
+    return smt.And(instances)
+
+
 class IRMapper(SMTMapper):
-    def __init__(self, archmapper, ir_fc, simple_formula=True, IVar: IndexVar=OneHot):
-        super().__init__(ir_fc)
+    #If prefilter > 0 the (form, input binding, output binding) candidates
+    #are first simulated on that many input vectors (see prefilter.py) and
+    #only the surviving ones are encoded in the formula
+    def __init__(self, archmapper, ir_fc, simple_formula=True, IVar: IndexVar=OneHot, stats: tp.Optional[MapperStats] = None, prefilter: int = 0):
+        super().__init__(ir_fc, stats=stats)
         #For now assume that ir input forms and ir output forms is just 1
         if self.num_input_forms > 1:
             raise NotImplementedError("Multiple ir input forms")
@@ -476,6 +609,15 @@ class IRMapper(SMTMapper):
 
         # should be a param to __init__ but this works for now
         self.archmapper = archmapper
+        self.simple_formula = simple_formula
+        IVar = get_index_var(IVar)
+        self.IVar = IVar
+        self.cegis_stats = []
+        #What formula_with_definitions needs of the formula (see there)
+        self._arch_output_terms = None
+        self._definition_clauses = None
+        self._allowed = None
+        self._definitions_formula = None
 
         # Create input bindings
         # binding = [input_form_idx][bidx]
@@ -496,12 +638,15 @@ class IRMapper(SMTMapper):
             #Verify all paths of form is subset of all paths
             assert set(arch_input_path_to_adt.keys()).issuperset(set(af.varmap.keys()))
             form_arch_input_path_to_adt = {p:T for p, T in arch_input_path_to_adt.items() if p in af.varmap}
-            bindings = create_bindings(form_arch_input_path_to_adt, ir_path_to_adt)
-            bindings = list(filter(constraint_filter, bindings))
+            with phase(stats, "bindings"):
+                bindings = create_bindings(form_arch_input_path_to_adt, ir_path_to_adt, archmapper.interchangeable)
+                bindings = list(filter(constraint_filter, bindings))
             for i, b in enumerate(bindings):
                 logger.debug(f"Binding {i}")
                 pretty_print_binding(b, logger.debug)
             input_bindings.append(bindings)
+        if stats is not None:
+            stats.set("num_input_bindings", sum(len(bs) for bs in input_bindings))
         # Check Early out
         self.has_bindings = max(len(bs) for bs in input_bindings) > 0
         if not self.has_bindings:
@@ -513,7 +658,10 @@ class IRMapper(SMTMapper):
         ir_path_to_adt = self.path_to_adt(input=False)
 
         #binding = [bidx]
-        output_bindings = create_bindings(arch_output_path_to_adt, ir_path_to_adt)
+        with phase(stats, "bindings"):
+            output_bindings = list(create_bindings(arch_output_path_to_adt, ir_path_to_adt))
+        if stats is not None:
+            stats.set("num_output_bindings", len(output_bindings))
 
         # Check Early out
         self.has_bindings = len(output_bindings) > 0
@@ -521,6 +669,20 @@ class IRMapper(SMTMapper):
             logger.debug("Early out, no output binidngs")
             return
 
+        allowed = None
+        if prefilter > 0:
+            with phase(stats, "prefilter"):
+                result = prefilter_bindings(self, input_bindings, output_bindings, prefilter)
+            if result is not None:
+                if stats is not None:
+                    stats.set("prefilter_candidates", sum(len(bs) for bs in input_bindings) * len(output_bindings))
+                    stats.set("prefilter_survivors", len(result))
+                input_bindings, output_bindings, allowed = _select_bindings(input_bindings, output_bindings, result)
+                self.has_bindings = len(output_bindings) > 0
+                if not self.has_bindings:
+                    logger.debug("Early out, no bindings survived the prefilter")
+                    return
+
         form_var = archmapper.input_form_var
 
 
@@ -553,6 +715,7 @@ class IRMapper(SMTMapper):
 
 
         use_input_sub = True
+        formula_start = time.perf_counter()
         #--------------------------------------------
         if simple_formula:
 
@@ -639,7 +802,7 @@ class IRMapper(SMTMapper):
                 assert len(forall_fbs) > 0
                 var_a = type(var)(prefix=str(var)+"_FORALL")
                 var_e = type(var)(prefix=str(var)+"_EXISTS")
-                e_conds = Or([(form_var.match_index(fi) & ib_var.match_index(bi)) for fi,bi in exists_fbs]).to_hwtypes()
+                e_conds = Or([And([form_var.match_index(fi), ib_var.match_index(bi)]) for fi,bi in exists_fbs]).to_hwtypes()
                 sub_var = e_conds.ite(var_e, var_a)
                 overlap_subs.append((var, sub_var))
                 pysmt_forall_vars.remove(var.value)
@@ -679,7 +842,7 @@ class IRMapper(SMTMapper):
             fb_conds = []
 
             for (f,b), conds in fb_conditions.items():
-                fb_conds.append(form_var.match_index(f) & ib_var.match_index(b))
+                fb_conds.append(And([form_var.match_index(f), ib_var.match_index(b)]))
                 fb_cond = And(conds)
                 impl_conds.append(fb_cond)
 
@@ -708,17 +871,32 @@ class IRMapper(SMTMapper):
                 self.bb_outputs
             )
 
-            formula = formula.to_hwtypes()
-            if use_input_sub:
-                #Do input substitutions
-                input_subs = [
-                    (temp_arch_in._value_, archmapper.input_value._value_),
-                    (temp_ir_in._value_, self.input_value._value_)
-                ]
-                formula = formula.substitute(*input_subs)
-
-            if len(overlap_subs) > 0:
-                formula = formula.substitute(*overlap_subs)
+            with phase(stats, "to_hwtypes"):
+                formula = formula.to_hwtypes()
+            with phase(stats, "substitute"):
+                if use_input_sub:
+                    #Do input substitutions
+                    input_subs = [
+                        (temp_arch_in._value_, archmapper.input_value._value_),
+                        (temp_ir_in._value_, self.input_value._value_)
+                    ]
+                    formula = formula.substitute(*input_subs)
+
+                if len(overlap_subs) > 0:
+                    formula = formula.substitute(*overlap_subs)
+
+            if len(archmapper.bb_outputs) == 0:
+                #The arch output terms as they appear in the formula (SMTBit
+                #simplifies the formula after each substitution). Only the
+                #ones the overlap substitution did not change are still the
+                #arch outputs of ArchMapper.input_value.
+                arch_input_sub = {temp_arch_in._value_.value: archmapper.input_value._value_.value}
+                overlap_sub = {var.value: sub_var.value for var, sub_var in overlap_subs}
+                self._arch_output_terms = {}
+                for path, value in arch_output_dict.items():
+                    term = smt.simplify(_term(value).substitute(arch_input_sub))
+                    if smt.simplify(term.substitute(overlap_sub)) is term:
+                        self._arch_output_terms[path] = term
 
             pysmt_forall_vars += bb_forall
             self.formula = smt.ForAll(pysmt_forall_vars, formula.value)
@@ -726,6 +904,9 @@ class IRMapper(SMTMapper):
             self.formula_wo_forall = formula.value
         else:
             constraints = []
+            #(conditions without the output equalities, submap, outputs) of
+            #each constraint
+            definition_clauses = []
             #Build the constraint
             forall_vars = set()
             for fi, ibindings in enumerate(input_bindings):
@@ -755,14 +936,17 @@ class IRMapper(SMTMapper):
                     for bo, obinding in enumerate(output_bindings):
                         bo_match = ob_var.match_index(bo)
                         conditions = list(form_conditions[fi]) + [bi_match, bo_match]
+                        outputs = []
                         for ir_path, arch_path in obinding:
                             if ir_path is Unbound:
                                 continue
                             ir_out = self.output_forms[0][0].varmap[ir_path]
+                            outputs.append((ir_out, fi, arch_path))
                             arch_out = archmapper.output_forms[fi][0].varmap[arch_path]
                             arch_out = arch_out.substitute(*submap)
                             conditions.append(ir_out == arch_out)
                         constraints.append(conditions)
+                        definition_clauses.append((conditions[:len(conditions) - len(outputs)], submap, outputs))
 
             logger.debug("Unconstrained Formula")
             for c in constraints:
@@ -799,31 +983,548 @@ class IRMapper(SMTMapper):
             self.formula = smt.ForAll(list(forall_vars), formula.value)
             self.forall_vars = forall_vars
             self.formula_wo_forall = formula.value
+            if len(archmapper.bb_outputs) == 0:
+                self._definition_clauses = definition_clauses
 
             logger.debug("Universally Quantified Vars")
             for var in forall_vars:
                 logger.debug(f"  {var}")
 
-
+        if allowed is not None:
+            #Only the surviving combinations of form and bindings
+            allowed = Or([
+                And([form_var.match_index(fi), ib_var.match_index(bi), ob_var.match_index(bo)])
+                for fi, bi, bo in allowed
+            ]).to_hwtypes()
+            self._allowed = allowed.value
+            self.formula_wo_forall = smt.And(allowed.value, self.formula_wo_forall)
+            self.formula = smt.ForAll(list(self.forall_vars), self.formula_wo_forall)
+
+        if stats is not None:
+            stats.add_time("formula", time.perf_counter() - formula_start)
+            stats.dag_size("formula_dag_size", self.formula_wo_forall)
+            stats.set("num_forall_vars", len(self.forall_vars))
+
+    #formula_wo_forall with the arch outputs replaced by the definitions of
+    #session (see MapperSession). Only valid for checking counterexamples
+    #to values of the exists vars (MapperSession.counterexamples). Returns
+    #formula_wo_forall itself if the definitions do not apply.
+    def formula_with_definitions(self, session: "MapperSession"):
+        if self._definitions_formula is not None and self._definitions_formula[0] is session:
+            return self._definitions_formula[1]
+        phi = self.formula_wo_forall
+        if self._arch_output_terms is not None and len(session.output_definitions) > 0:
+            #simple_formula: the arch outputs are the same function of
+            #ArchMapper.input_value as the definitions
+            phi = phi.substitute({
+                term: session.output_definitions[path].value
+                for path, term in self._arch_output_terms.items()
+            })
+        elif self._definition_clauses is not None and session.has_definitions:
+            phi = self._build_formula_with_definitions(session)
+        self._definitions_formula = (session, phi)
+        return phi
+
+    #The formula keeps the arch vars which were substituted with ir vars and
+    #implies the arch output definitions of the form from their equalities
+    #instead. With the exists vars fixed only one constraint can hold so this
+    #is equivalent, unless a substituted arch var is also an exists var.
+    def _build_formula_with_definitions(self, session):
+        archmapper = self.archmapper
+        substituted = set(arch_var.value for _, submap, _ in self._definition_clauses for arch_var, _ in submap)
+        exists_vars = self.formula_wo_forall.get_free_variables() - set(self.forall_vars)
+        if len(substituted & exists_vars) > 0:
+            return self.formula_wo_forall
+        constraints = []
+        for conditions, submap, outputs in self._definition_clauses:
+            conditions = list(conditions)
+            equal_outputs = [ir_out == session.form_definition(fi, arch_path) for ir_out, fi, arch_path in outputs]
+            if len(equal_outputs) > 0 and len(submap) > 0:
+                bound = and_reduce([arch_var == ir_var for arch_var, ir_var in submap])
+                equal_outputs = [~bound | and_reduce(equal_outputs)]
+            constraints.append(and_reduce(conditions + equal_outputs))
+        formula = or_reduce(constraints)
+        arch_input_path_to_adt = archmapper.path_to_adt(input=True)
+        for path, constraints in archmapper.path_constraints.items():
+            arch_var = archmapper.input_varmap[path]
+            constraint = or_reduce((arch_var == c for c in constraints))
+            if issubclass(arch_input_path_to_adt[path], Const):
+                formula &= constraint
+            else:
+                #Instead of the substitution of each allowed value
+                formula = ~constraint | formula
+        phi = formula.value
+        if self._allowed is not None:
+            phi = smt.And(self._allowed, phi)
+        return phi
+
+    #external_loop selects the solving strategy: True runs the external
+    #(CEGIS) loop and False solves the ForAll formula in one query. With None
+    #(the default) the forall vars are expanded (see expand_forall) if they
+    #have at most expand_width bits, otherwise it behaves as False. An
+    #explicit external_loop always takes precedence over expand_width.
     def solve(self,
         solver_name : str = 'z3',
-        external_loop : bool = False,
+        external_loop : tp.Optional[bool] = None,
         itr_limit = 20,
         num_init = -1,
-        logic = BV
+        logic = BV,
+        cache: tp.Optional["RuleCache"] = None,
+        num_counterexamples: int = 1,
+        expand_width: tp.Optional[int] = EXPAND_WIDTH,
     ) -> tp.Union[None, RewriteRule]:
         if not self.has_bindings:
             return None
 
+        stats = self.stats
+        if cache is not None:
+            key = cache.key(self, solver_name)
+            found, rr = cache.get(key, self.peak_fc, self.archmapper.peak_fc)
+            count(stats, "cache_hits" if found else "cache_misses")
+            if found:
+                return rr
+
+        session = self.archmapper.active_session
+        if session is not None and not session.matches(solver_name, logic):
+            session = None
+
+        #Statistics of each CEGIS iteration of the last solve (none unless
+        #the external loop is used)
+        self.cegis_stats = []
+        solve_start = time.perf_counter()
+        expand = external_loop is None and expand_width is not None
+        if expand and forall_width(self.forall_vars) <= expand_width:
+            #Few enough forall assignments to instantiate all of them
+            with phase(stats, "expand_forall"):
+                formula = expand_forall(self.forall_vars, self.formula_wo_forall)
+            rr = self._solve_direct(formula, solver_name, logic, session)
+            if stats is not None:
+                stats.add_time("solve", time.perf_counter() - solve_start)
+                count(stats, "solver_iterations")
+                count(stats, "expanded_solves")
+        elif external_loop:
+            pool = self.archmapper.counterexample_pool
+            num_seeded = 0 if pool is None else pool.num_seeded
+            try:
+                rr = external_loop_solve(
+                    self.forall_vars,
+                    self.formula_wo_forall,
+                    logic,
+                    itr_limit,
+                    solver_name,
+                    self,
+                    num_init,
+                    session=session,
+                    num_counterexamples=num_counterexamples,
+                    stats=self.cegis_stats,
+                    pool=pool,
+                )
+            finally:
+                if stats is not None:
+                    stats.add_time("solve", time.perf_counter() - solve_start)
+                    count(stats, "solver_iterations", len(self.cegis_stats))
+                    if pool is not None:
+                        count(stats, "pool_seeds", pool.num_seeded - num_seeded)
+                    for itr in self.cegis_stats:
+                        stats.add_time("synthesis", itr.synth_time)
+                        stats.add_time("verification", itr.verify_time)
+        else:
+            rr = self._solve_direct(self.formula, solver_name, logic, session)
+            if stats is not None:
+                stats.add_time("solve", time.perf_counter() - solve_start)
+                count(stats, "solver_iterations")
+
+        if cache is not None:
+            cache.put(key, rr)
+        return rr
+
+    #Solves formula with a single query, without the external loop. formula
+    #is either quantifier free (expanded) or self.formula with its ForAll
+    def _solve_direct(self, formula, solver_name, logic, session):
+        if session is None:
+            solver_ctx = smt.Solver(solver_name, logic=logic)
+        else:
+            solver_ctx = session.scope()
+        with solver_ctx as solver:
+            solver.add_assertion(formula)
+            if not solver.solve():
+                return None
+            return rr_from_solver(solver, self)
+
+    #Generates distinct rewrite rules (up to limit of them) as they are found.
+    #After each rule a blocking clause over the form, binding and Const
+    #values of the rule is added to the same solver (see block_rule), so the
+    #formula and the counterexamples found so far are reused.
+    #With external_loop itr_limit bounds the iterations spent on each rule.
+    def enumerate_rules(self,
+        limit: tp.Optional[int] = None,
+        solver_name : str = 'z3',
+        external_loop : bool = True,
+        itr_limit = 20,
+        num_init = -1,
+        logic = BV,
+        num_counterexamples: int = 1,
+    ) -> tp.Iterator[RewriteRule]:
+        if not self.has_bindings or limit == 0:
+            return
+
+        session = self.archmapper.active_session
+        if session is not None and not session.matches(solver_name, logic):
+            session = None
+
         if external_loop:
-            return external_loop_solve(self.forall_vars, self.formula_wo_forall, logic, itr_limit, solver_name, self, num_init)
+            self.cegis_stats = []
+            rules = external_loop_enumerate(
+                self.forall_vars,
+                self.formula_wo_forall,
+                logic,
+                itr_limit,
+                solver_name,
+                self,
+                num_init,
+                session=session,
+                num_counterexamples=num_counterexamples,
+                stats=self.cegis_stats,
+                block=block_rule,
+                pool=self.archmapper.counterexample_pool,
+            )
+        else:
+            rules = self._enumerate_quantified(solver_name, logic, session)
+
+        with closing(rules):
+            for num, rr in enumerate(rules, 1):
+                yield rr
+                if limit is not None and num >= limit:
+                    return
 
-        with smt.Solver(solver_name, logic=logic) as solver:
+    def _enumerate_quantified(self, solver_name, logic, session):
+        if session is None:
+            solver_ctx = smt.Solver(solver_name, logic=logic)
+        else:
+            solver_ctx = session.scope()
+        with solver_ctx as solver:
             solver.add_assertion(self.formula)
-            is_solved = solver.solve()
-            if not is_solved:
-                return None
-            return rr_from_solver(solver, self)
+            while solver.solve():
+                blocking = block_rule(solver, self)
+                yield rr_from_solver(solver, self)
+                solver.add_assertion(blocking)
+
+    #Races solve with each config in configs in separate processes.
+    #Returns a PortfolioResult with the first definitive answer and the
+    #config which produced it
+    def solve_portfolio(self, configs=None, timeout: tp.Optional[float] = None) -> "PortfolioResult":
+        from .parallel import solve_portfolio
+        return solve_portfolio(self, configs, timeout)
+
+    #Tries every valid encoding of the Const arch inputs concretely instead
+    #of solving the exists/forall query (see enumerative.py)
+    def solve_enumerative(self, solver_name: str = 'z3', **kwargs) -> tp.Union[None, RewriteRule]:
+        from .enumerative import enumerative_solve
+        return enumerative_solve(self, solver_name, **kwargs)
+
+#Maps the input paths of each form to the path_dicts of the forms with
+#exactly those paths
+def _forms_by_paths(forms):
+    form_paths = {}
+    for form in forms:
+        form_paths.setdefault(frozenset(form.varmap.keys()), []).append(form.path_dict)
+    return form_paths
+
+
+#The conditions selecting the one input form whose paths are paths
+def _form_conditions(form_paths, input_varmap, paths):
+    path_dicts = form_paths.get(frozenset(paths), [])
+    if len(path_dicts) != 1:
+        raise ValueError("Rule does not match any input form")
+    return [input_varmap[path + (Match,)][choice] for path, choice in path_dicts[0].items()]
+
+
+#The formula which is satisfiable iff rule has a counterexample: the
+#conditions selecting the arch form the rule binds, the input equalities of
+#its ibinding and the negated output equalities of its obinding.
+#Returns None if the rule binds no output.
+def _counterexample_formula(rule, arch_form_paths, arch_input_varmap, arch_outputs, ir_inputs, ir_outputs, conditions=()):
+    arch_paths = set(arch_path for _, arch_path in rule.ibinding)
+    conditions = list(conditions) + _form_conditions(arch_form_paths, arch_input_varmap, arch_paths)
+    for ir_path, arch_path in rule.ibinding:
+        arch_var = arch_input_varmap[arch_path]
+        if isinstance(ir_path, tuple):
+            conditions.append(arch_var == ir_inputs[ir_path])
+        elif ir_path is not Unbound:
+            conditions.append(arch_var == rebind_value(ir_path, rule.family.SMTFamily()))
+
+    outputs = []
+    for ir_path, arch_path in rule.obinding:
+        # The value of an unused output does not matter
+        if ir_path is Unbound:
+            continue
+        if ir_path not in ir_outputs:
+            raise ValueError(f"{ir_path} is not valid")
+        if arch_path not in arch_outputs:
+            raise ValueError(f"{arch_path} is not valid")
+        outputs.append(ir_outputs[ir_path] == arch_outputs[arch_path])
+    if len(outputs) == 0:
+        return None
+    return And(conditions + [~And(outputs).to_hwtypes()]).to_hwtypes().value
+
+
+#Checks formula (see _counterexample_formula) in a scope of solver and
+#returns the counterexample as the values of ir_vars and arch_vars
+def _solve_counterexample(solver, formula, ir_vars, arch_vars):
+    if formula is None:
+        return None
+    solver.push()
+    try:
+        solver.add_assertion(formula)
+        if not solver.solve():
+            return None
+        ir_ce = {path: solved_to_bv(var, solver) for path, var in ir_vars.items()}
+        arch_ce = {path: solved_to_bv(var, solver) for path, var in arch_vars.items()}
+        return ir_ce, arch_ce
+    finally:
+        solver.pop()
+
+
+class MapperSession:
+    '''
+    Keeps solvers alive across all the IR instructions mapped to (and rules
+    verified against) one ArchMapper.
+
+    solver is used for the synthesis queries. Arch side conditions which hold
+    for every instruction (validity of the Const inputs and the Const
+    path_constraints) are asserted into it once, and each query is pushed and
+    popped on top of them.
+
+    verifier is used for the counterexample queries of external_loop_solve and
+    for RewriteRule.verify. The arch outputs are asserted into it once as
+    definitions: 'ArchOut.<path> == output' as a function of
+    ArchMapper.input_value (used by simple_formula IRMappers and verify) and,
+    on first use, 'ArchOut<fi>.<path> == output' of each arch input form fi
+    (used by the other IRMappers). The counterexample queries use
+    IRMapper.formula_with_definitions, which references the definitions
+    instead of the output terms, so the arch semantics are only processed
+    once per session.
+    Definitions are not created for archs with black boxes.
+    '''
+    def __init__(self, archmapper: ArchMapper, solver_name: str = 'z3', logic=BV):
+        self.archmapper = archmapper
+        self.solver_name = solver_name
+        self.logic = logic
+        self.solver = smt.Solver(solver_name, logic=logic)
+        self.verifier = smt.Solver(solver_name, logic=logic, solver_options=_incremental_options(solver_name))
+        am = archmapper
+
+        #Arch side conditions shared by every instruction
+        const_fields = [field for field, T in am.peak_fc.Py.input_t.field_dict.items() if issubclass(T, Const)]
+        inputs = aadt_product_to_dict(am.input_value)
+        conditions = [is_valid(inputs[field]) for field in const_fields]
+        arch_input_path_to_adt = am.path_to_adt(input=True)
+        for path, constraints in am.path_constraints.items():
+            if issubclass(arch_input_path_to_adt[path], Const):
+                arch_var = am.input_varmap[path]
+                conditions.append(Or([arch_var == c for c in constraints]))
+        if len(conditions) > 0:
+            self.solver.add_assertion(And(conditions).to_hwtypes().value)
+
+        #Arch output definitions
+        #Maps each output path to its definition var
+        self.output_definitions = {}
+        #Maps (input form idx, output path) to its definition var
+        self._form_definitions = {}
+        #The arch input forms by their paths, built on first verify
+        self._arch_forms = None
+        self.has_definitions = len(am.bb_outputs) == 0
+        if self.has_definitions:
+            #This is built the same way as in the IRMapper simple formula so
+            #that the output terms are identical
+            temp_arch_in = _create_free_var(am.input_aadt_t, "Arch_in")
+            outputs = am.peak_obj(**aadt_product_to_dict(temp_arch_in))
+            output_value = wrap_outputs(outputs, am.output_aadt_t)
+            input_sub = {temp_arch_in._value_.value: am.input_value._value_.value}
+            for field, value in aadt_product_to_dict(output_value).items():
+                if isinstance(value, AssembledADT):
+                    value = value._value_
+                term = value.value.substitute(input_sub)
+                d = type(value)(prefix=f"ArchOut.{field}")
+                self.verifier.add_assertion(smt.EqualsOrIff(d.value, term))
+                self.output_definitions[(field,)] = d
+
+    def matches(self, solver_name, logic):
+        return self.solver_name == solver_name and self.logic == logic
+
+    @contextmanager
+    def scope(self, solver=None):
+        if solver is None:
+            solver = self.solver
+        solver.push()
+        try:
+            yield solver
+        finally:
+            solver.pop()
+
+    #The definition var of the output at path of the arch input form fi.
+    #The output term is the one of ArchMapper.output_forms, which the
+    #IRMapper formulas are built from.
+    def form_definition(self, fi: int, path):
+        key = (fi, path)
+        if key not in self._form_definitions:
+            term = self.archmapper.output_forms[fi][0].varmap[path]
+            name = ".".join(str(p) for p in path)
+            d = type(term)(prefix=f"ArchOut{fi}.{name}")
+            #Asserted outside of any scope of the verifier
+            self.verifier.add_assertion(smt.EqualsOrIff(d.value, term.value))
+            self._form_definitions[key] = d
+        return self._form_definitions[key]
+
+    #Returns up to num counterexamples to phi (assignments to y) given the
+    #values tau of the other vars
+    #phi may reference the definitions (see IRMapper.formula_with_definitions)
+    def counterexamples(self, y, phi, tau, num: int = 1):
+        with self.scope(self.verifier) as verifier:
+            for v, val in tau.items():
+                verifier.add_assertion(smt.EqualsOrIff(v, val))
+            verifier.add_assertion(smt.Not(phi))
+            return _harvest_counterexamples(verifier, y, num)
+
+    def verify(self, rule: RewriteRule):
+        am = self.archmapper
+        ir = rule.ir_fc(rule.family.SMTFamily())()
+        if len(self.output_definitions) == 0 or len(get_black_boxes(ir)) > 0:
+            return rule.verify(self.solver_name)
+
+        if self._arch_forms is None:
+            self._arch_forms = _forms_by_paths(am.input_forms)
+
+        ir_path_types = _create_path_to_adt(strip_modifiers(rule.ir_fc(rule.family.SMTFamily()).input_t))
+        arch_path_types = _create_path_to_adt(strip_modifiers(rule.arch_fc(rule.family.SMTFamily()).input_t))
+        ir_paths, arch_paths = rule.get_input_paths()
+        ir_values = {path:_free_var_from_t(ir_path_types[path], rule.family) for path in ir_paths}
+        arch_values = {path: _free_var_from_t(arch_path_types[path], rule.family) for path in arch_paths}
+        ir_inputs, _ = rule.build_inputs(ir_values, arch_values, rule.family.SMTFamily())
+        create_and_set_bb_outputs(ir)
+        ir_out_values = rule.parse_ir_output(ir(**ir_inputs))
+
+        formula = _counterexample_formula(
+            rule,
+            self._arch_forms,
+            am.input_varmap,
+            self.output_definitions,
+            ir_values,
+            ir_out_values,
+        )
+        return _solve_counterexample(
+            self.verifier,
+            formula,
+            ir_values,
+            {path: am.input_varmap[path] for path in arch_paths},
+        )
+
+    def close(self):
+        self.solver.exit()
+        self.verifier.exit()
+
+    def __enter__(self):
+        if self.archmapper.active_session is not None:
+            raise ValueError("ArchMapper already has an active session")
+        self.archmapper.active_session = self
+        return self
+
+    def __exit__(self, *args):
+        self.archmapper.active_session = None
+        self.close()
+
+
+#Symbolic execution of a family closure over free inputs
+#  form_paths: frozenset of the input paths of a form -> its path_dict
+#  input_varmap: as returned by SMTForms for the input
+#  outputs: output path -> value
+#  has_bbs: the peak has black boxes
+_Executed = namedtuple("_Executed", ["form_paths", "input_varmap", "outputs", "has_bbs"])
+
+class RuleVerifier:
+    '''
+    Verifies many RewriteRules in one solver.
+
+    Each distinct (family closure, family) is symbolically executed once, over
+    free inputs, and the outputs are shared by every rule using it. A rule
+    only adds the conditions selecting the input forms it binds, the input
+    equalities of its ibinding and the negated output equalities of its
+    obinding, which are pushed and popped on the one solver.
+    Rules whose arch or ir have black boxes fall back to RewriteRule.verify.
+    '''
+    def __init__(self, solver_name: str = 'z3', logic=BV):
+        self.solver_name = solver_name
+        self.logic = logic
+        self.solver = smt.Solver(solver_name, logic=logic, solver_options=_incremental_options(solver_name))
+        self._executed = {}
+
+    def execute(self, fc, family) -> _Executed:
+        key = (fc, family)
+        if key not in self._executed:
+            mapper = SMTMapper(fc, family=family)
+            outputs = mapper.peak_obj(**aadt_product_to_dict(mapper.input_value))
+            output_value = wrap_outputs(outputs, mapper.output_aadt_t)
+            _, output_varmap, _ = SMTForms()(mapper.output_aadt_t, value=output_value)
+            has_bbs = len(get_black_boxes(mapper.peak_obj)) > 0
+            form_paths = _forms_by_paths(mapper.input_forms)
+            self._executed[key] = _Executed(form_paths, mapper.input_varmap, output_varmap, has_bbs)
+        return self._executed[key]
+
+    def verify(self, rule: RewriteRule) -> tp.Union[None, "CounterExample"]:
+        arch = self.execute(rule.arch_fc, rule.family)
+        ir = self.execute(rule.ir_fc, rule.family)
+        if arch.has_bbs or ir.has_bbs:
+            return rule.verify(self.solver_name)
+
+        ir_paths, arch_paths = rule.get_input_paths()
+        #Select the ir input form which the rule binds
+        conditions = _form_conditions(ir.form_paths, ir.input_varmap, ir_paths)
+        formula = _counterexample_formula(
+            rule,
+            arch.form_paths,
+            arch.input_varmap,
+            arch.outputs,
+            ir.input_varmap,
+            ir.outputs,
+            conditions,
+        )
+        return _solve_counterexample(
+            self.solver,
+            formula,
+            {path: ir.input_varmap[path] for path in ir_paths},
+            {path: arch.input_varmap[path] for path in arch_paths},
+        )
+
+    def verify_all(self, rules: tp.Iterable[RewriteRule]) -> tp.List[tp.Union[None, "CounterExample"]]:
+        return [self.verify(rule) for rule in rules]
+
+    def close(self):
+        self.solver.exit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+#Restricts the bindings to the survivors of the prefilter. Returns the
+#bindings which are part of a surviving triple and the surviving triples
+#reindexed into them (None if every remaining combination survived)
+def _select_bindings(input_bindings, output_bindings, survivors):
+    bos = sorted(set(bo for _, _, bo in survivors))
+    bo_idx = {bo: i for i, bo in enumerate(bos)}
+    new_input_bindings = []
+    bi_idx = {}
+    for fi, bindings in enumerate(input_bindings):
+        bis = sorted(set(bi for f, bi, _ in survivors if f == fi))
+        bi_idx.update({(fi, bi): i for i, bi in enumerate(bis)})
+        new_input_bindings.append([bindings[bi] for bi in bis])
+    allowed = sorted((fi, bi_idx[(fi, bi)], bo_idx[bo]) for fi, bi, bo in survivors)
+    if len(allowed) == sum(len(bs) for bs in new_input_bindings) * len(bos):
+        allowed = None
+    return new_input_bindings, [output_bindings[bo] for bo in bos], allowed
+
 
 def _input_aadt_t(fc, family):
     bv = fc(family)
@@ -837,28 +1538,54 @@ def rr_from_solver(solver, irmapper):
     arch_input_form_val = am.input_form_var.decode(int(solved_to_bv(am.input_form_var.var, solver)))
     ib_val = im.ib_var.decode(int(solved_to_bv(im.ib_var.var, solver)))
     ob_val = im.ob_var.decode(int(solved_to_bv(im.ob_var.var, solver)))
-    ibinding = im.input_bindings[arch_input_form_val][ib_val]
-    obinding = im.output_bindings[ob_val]
-
+    return rr_from_selection(
+        im.input_bindings[arch_input_form_val][ib_val],
+        im.output_bindings[ob_val],
+        am.const_paths | set(am.path_constraints),
+        lambda arch_path: solved_to_bv(am.input_varmap[arch_path], solver),
+        im.peak_fc,
+        am.peak_fc,
+    )
+
+
+#Builds the rule of the selected input and output binding. const_value
+#returns the (python) value of an unbound input in const_paths
+def rr_from_selection(ibinding, obinding, const_paths, const_value, ir_fc, arch_fc):
     #extract, simplify, and convert constants to BV in the input binding
     bv_ibinding = []
     for ir_path, arch_path in ibinding:
-        if (ir_path is Unbound) and (arch_path in am.const_paths or arch_path in am.path_constraints):
-            var = am.input_varmap[arch_path]
-            bv_val = solved_to_bv(var, solver)
-            ir_path = bv_val
+        if (ir_path is Unbound) and (arch_path in const_paths):
+            ir_path = const_value(arch_path)
         bv_ibinding.append((ir_path, arch_path))
 
-    fam = am.peak_fc._family_.PyFamily()
+    fam = arch_fc._family_.PyFamily()
     bv_ibinding = rebind_binding(bv_ibinding, fam)
 
     bv_ibinding = strip_aadt(bv_ibinding)
-    return RewriteRule(bv_ibinding, obinding, im.peak_fc, am.peak_fc)
+    return RewriteRule(bv_ibinding, obinding, ir_fc, arch_fc)
+
+
+#Blocking clause which excludes the rule rr_from_solver builds from the
+#current model: the selected form and bindings and the values of the Const
+#inputs the rule binds
+def block_rule(solver, irmapper):
+    im = irmapper
+    am = irmapper.archmapper
+    selectors = [am.input_form_var.var, im.ib_var.var, im.ob_var.var]
+    fi = am.input_form_var.decode(int(solved_to_bv(am.input_form_var.var, solver)))
+    bi = im.ib_var.decode(int(solved_to_bv(im.ib_var.var, solver)))
+    consts = []
+    for ir_path, arch_path in im.input_bindings[fi][bi]:
+        if (ir_path is Unbound) and (arch_path in am.const_paths or arch_path in am.path_constraints):
+            consts.append(am.input_varmap[arch_path])
+    return smt.Not(smt.And([
+        smt.EqualsOrIff(var.value, solver.get_value(var.value)) for var in selectors + consts
+    ]))
 
 
 def _int_to_pysmt(x: int, sort: smt_typing.PySMTType):
     if sort.is_bv_type():
-        return smt.BV(x % sort.width, sort.width)
+        return smt.BV(x % (1 << sort.width), sort.width)
     else:
         assert sort.is_bool_type()
         return smt.Bool(bool(x))
@@ -890,38 +1617,150 @@ def _gen_initial(y, num_initial_vectors):
 class LoopException(Exception):
     pass
 
-def external_loop_solve(y, phi, logic = BV, maxloops=10, solver_name = "cvc4", irmapper = None, num_initial_vectors: int = 0, rr_from_solver=rr_from_solver):
+#Statistics of one iteration of external_loop_solve
+#   synth_time: time spent finding candidate exists values
+#   verify_time: time spent searching for counterexamples to the candidate
+#   num_counterexamples: number of counterexamples added
+CEGISIteration = namedtuple("CEGISIteration", ["synth_time", "verify_time", "num_counterexamples"])
+
+#z3 switches to its incremental core once push is used, which is much slower
+#on the nonlinear bitvector queries the mapper produces. With a timeout on
+#the incremental core z3 falls back to its default (bit-blasting) solver.
+def _incremental_options(solver_name):
+    if solver_name == "z3":
+        return {"combined_solver.solver2_timeout": 100}
+    return {}
+
+#Returns up to num models of the assertions of solver (restricted to y).
+#Each model is blocked before searching for the next so they are distinct.
+#Must be called within a push/pop scope.
+def _harvest_counterexamples(solver, y, num: int):
+    sigmas = []
+    while len(sigmas) < num and solver.solve():
+        sigma = {v: solver.get_value(v) for v in y}
+        sigmas.append(sigma)
+        if len(sigmas) < num:
+            solver.add_assertion(smt.And([smt.Not(smt.EqualsOrIff(v, val)) for v, val in sigma.items()]))
+    return sigmas
+
+#num_counterexamples: maximum number of counterexamples added per iteration
+#stats: if a list is passed a CEGISIteration is appended to it for each iteration
+#pool: CounterexamplePool which seeds the synthesis query and records every
+#      counterexample found
+def external_loop_solve(
+    y,
+    phi,
+    logic = BV,
+    maxloops=10,
+    solver_name = "cvc4",
+    irmapper = None,
+    num_initial_vectors: int = 0,
+    rr_from_solver=rr_from_solver,
+    session: tp.Optional[MapperSession] = None,
+    num_counterexamples: int = 1,
+    stats: tp.Optional[tp.List[CEGISIteration]] = None,
+    pool: tp.Optional[CounterexamplePool] = None,
+):
+    rules = external_loop_enumerate(
+        y, phi, logic, maxloops, solver_name, irmapper, num_initial_vectors,
+        rr_from_solver, session, num_counterexamples, stats, pool=pool,
+    )
+    with closing(rules):
+        return next(rules, None)
+
+#Generator version of external_loop_solve. After each solution block(solver,
+#irmapper) is asserted into the synthesis solver (keeping every
+#counterexample found so far) and the loop continues until no other solution
+#exists. maxloops limits the iterations spent finding each solution.
+#If block is None only the first solution is generated.
+def external_loop_enumerate(
+    y,
+    phi,
+    logic = BV,
+    maxloops=10,
+    solver_name = "cvc4",
+    irmapper = None,
+    num_initial_vectors: int = 0,
+    rr_from_solver=rr_from_solver,
+    session: tp.Optional[MapperSession] = None,
+    num_counterexamples: int = 1,
+    stats: tp.Optional[tp.List[CEGISIteration]] = None,
+    block=None,
+    pool: tp.Optional[CounterexamplePool] = None,
+):
+    if num_counterexamples < 1:
+        raise ValueError("num_counterexamples needs to be at least 1")
 
     y = set(y) #forall_vars
     x = phi.get_free_variables() - y #exist vars
     initial_vectors =_gen_initial(y, num_initial_vectors)
+    if pool is not None:
+        initial_vectors += pool.seeds(y)
 
-    with smt.Solver(logic=logic, name=solver_name) as solver:
-        solver.add_assertion(smt.Bool(True))
-        for sigma in initial_vectors:
-            sub_phi = phi.substitute(sigma).simplify()
-            solver.add_assertion(sub_phi)
-
-        loops = 0
-        while maxloops is None or loops <= maxloops:
-            loops += 1
-            eres = solver.solve()
-
-            if not eres:
-                return None
-            else:
+    if session is None:
+        solver_ctx = smt.Solver(logic=logic, name=solver_name)
+        #Kept alive for every counterexample query
+        verifier = smt.Solver(logic=logic, name=solver_name, solver_options=_incremental_options(solver_name))
+    else:
+        solver_ctx = session.scope()
+        phi_d = phi
+        if isinstance(irmapper, IRMapper) and phi is irmapper.formula_wo_forall:
+            phi_d = irmapper.formula_with_definitions(session)
+
+    def counterexamples(tau):
+        if session is not None:
+            return session.counterexamples(y, phi_d, tau, num_counterexamples)
+        sub_phi = phi.substitute(tau).simplify()
+        verifier.push()
+        try:
+            verifier.add_assertion(smt.Not(sub_phi))
+            return _harvest_counterexamples(verifier, y, num_counterexamples)
+        finally:
+            verifier.pop()
+
+    try:
+        with solver_ctx as solver:
+            solver.add_assertion(smt.Bool(True))
+            for sigma in initial_vectors:
+                sub_phi = phi.substitute(sigma).simplify()
+                solver.add_assertion(sub_phi)
+
+            loops = 0
+            while maxloops is None or loops <= maxloops:
+                loops += 1
+                start = time.perf_counter()
+                eres = solver.solve()
+                synth_time = time.perf_counter() - start
+
+                if not eres:
+                    if stats is not None:
+                        stats.append(CEGISIteration(synth_time, 0.0, 0))
+                    return
                 tau = {v: solver.get_value(v) for v in x}
-                sub_phi = phi.substitute(tau).simplify()
-                model = smt.get_model(smt.Not(sub_phi), solver_name=solver_name, logic=logic)
-
-                if model is None:
-                    #return loops
-                    return rr_from_solver(solver, irmapper)
-                else :
-                    sigma = {v: model.get_value(v) for v in y}
+                start = time.perf_counter()
+                sigmas = counterexamples(tau)
+                if stats is not None:
+                    stats.append(CEGISIteration(synth_time, time.perf_counter() - start, len(sigmas)))
+
+                if len(sigmas) == 0:
+                    rr = rr_from_solver(solver, irmapper)
+                    if block is None:
+                        yield rr
+                        return
+                    blocking = block(solver, irmapper)
+                    yield rr
+                    solver.add_assertion(blocking)
+                    loops = 0
+                    continue
+                for sigma in sigmas:
+                    if pool is not None:
+                        pool.record(sigma)
                     sub_phi = phi.substitute(sigma).simplify()
                     solver.add_assertion(sub_phi)
-        raise LoopException(f"Unknown result in efsmt in {maxloops} number of iterations")
+            raise LoopException(f"Unknown result in efsmt in {maxloops} number of iterations")
+    finally:
+        if session is None:
+            verifier.exit()
 
 
 def strip_aadt(binding):
@@ -1,10 +1,9 @@
 import itertools
-from functools import reduce
 from types import SimpleNamespace
 from hwtypes import strip_modifiers
 from peak import family as peak_family, family_closure, Peak, Const
 from .mapper import aadt_product_to_dict, external_loop_solve
-from .index_var import IndexVar, OneHot, Binary
+from .index_var import IndexVar, OneHot, Binary, get_index_var
 from .mapper import _get_peak_cls, _create_free_var, create_and_set_bb_outputs, wrap_outputs, is_valid, get_bb_inputs
 from .utils import _sort_by_t, pretty_print_binding, solved_to_bv, Unbound
 from .formula_constructor import And, Or, Implies
@@ -35,8 +34,46 @@ def create_bindings(inputs, outputs, use_unbound=True):
         bindings.append(binding)
     return bindings
 
+#Yields the binding index of every block (bindings[i] is the list of
+#bindings of block i) such that each of ir_paths is bound exactly once.
+#The tuples are built constructively with backtracking, in the order of
+#itertools.product, instead of filtering the product.
+def valid_multi_bindings(bindings, ir_paths):
+    ir_idx = {p: j for j, p in enumerate(ir_paths)}
+    #Per block, the index and ir path usage of each binding which does not use
+    #an ir path more than once
+    blocks = []
+    for block_bindings in bindings:
+        candidates = []
+        for b, binding in enumerate(block_bindings):
+            used = [ir_idx[ipath] for ipath, _ in binding if ipath in ir_idx]
+            if len(used) == len(set(used)):
+                candidates.append((b, frozenset(used)))
+        blocks.append(candidates)
+    #Ir paths which can still be bound by blocks i and later
+    reachable = [frozenset()]*(len(blocks)+1)
+    for i in reversed(range(len(blocks))):
+        reachable[i] = reachable[i+1].union(*(used for _, used in blocks[i]))
+    all_paths = frozenset(range(len(ir_paths)))
+
+    indices = []
+    def extend(i, bound):
+        if not (all_paths - bound) <= reachable[i]:
+            return
+        if i == len(blocks):
+            yield tuple(indices)
+            return
+        for b, used in blocks[i]:
+            if used & bound:
+                continue
+            indices.append(b)
+            yield from extend(i+1, bound | used)
+            indices.pop()
+    yield from extend(0, frozenset())
+
 #This will Solve a multi-rewrite rule N instructions
 def Multi(arch_fc, ir_fc, N: int, family=peak_family, IVar: IndexVar = Binary, use_real = True, use_split_instr = False):
+    IVar = get_index_var(IVar)
     def parse_peak_fc(peak_fc):
         if not isinstance(peak_fc, family_closure):
             raise ValueError(f"family closure {peak_fc} needs to be decorated with @family_closure")
@@ -171,17 +208,7 @@ def Multi(arch_fc, ir_fc, N: int, family=peak_family, IVar: IndexVar = Binary, u
     ir_paths = [("IR_in", field) for field in ir_info.input_t.field_dict]
     all_bindings = [block.bindings for block in block_info]
 
-    orig_bindings = reduce(lambda x, y: x*y, [len(b) for b in all_bindings])
-    def filt(x):
-        bind = [b[x[j]] for j, b in enumerate(all_bindings)]
-        found = [0 for _ in ir_paths]
-        for j, p in enumerate(ir_paths):
-            for binding in bind:
-                for input, _ in binding:
-                    if input == p:
-                        found[j] += 1
-        return all(f in (1,) for f in found)
-    valid_bindings = list(filter(filt, itertools.product(*[range(len(bindings)) for bindings in all_bindings])))
+    valid_bindings = list(valid_multi_bindings(all_bindings, ir_paths))
     if len(valid_bindings) == 0:
         raise ValueError("There are no valid Bindings")
     bind_var = IVar(len(valid_bindings), "bind_in")
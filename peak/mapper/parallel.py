@@ -0,0 +1,430 @@
+import multiprocessing
+import multiprocessing.connection
+import os
+import time
+import traceback
+
+import pysmt.shortcuts as smt
+import typing as tp
+from collections import namedtuple
+
+from hwtypes import Bit, BitVector
+
+from peak import family as peak_family
+from peak.ir import IR
+from .index_var import IndexVar, OneHot
+from .mapper import ArchMapper, RewriteRule, RuleVerifier, read_serialized_bindings, LoopException
+from .arch_cache import cached_arch_mapper
+
+import logging
+logger = logging.getLogger(__name__)
+
+# rules: name -> RewriteRule (None if no rule was found or the solve timed out)
+# times: name -> wall time in seconds spent on the instruction
+# timed_out: names of the instructions which hit the timeout
+# unknown: names of the instructions whose solve gave up (LoopException: an
+#   unknown solver result or the itr_limit of the external loop)
+IRMapping = namedtuple("IRMapping", ["rules", "times", "timed_out", "unknown"])
+
+
+# Family closures built by IR.add_peak_instruction are created with exec and
+# cannot be pickled. Worker processes are therefore always forked so that the
+# arch_fc and the IR are inherited instead of being sent over a pipe.
+def _mp_context():
+    return multiprocessing.get_context("fork")
+
+
+def _worker_main(conn, arch_fc, ir, mapper_kwargs, arch_cache, simple_formula, solve_kwargs):
+    # The ArchMapper is only built once per worker process
+    try:
+        if arch_cache is None:
+            arch_mapper = ArchMapper(arch_fc, **mapper_kwargs)
+        else:
+            arch_mapper = cached_arch_mapper(arch_fc, arch_cache, **mapper_kwargs)
+    except Exception as e:
+        conn.send(("error", None, (repr(e), traceback.format_exc()), 0))
+        conn.close()
+        return
+    # Signals that the worker is ready to take instructions
+    conn.send(None)
+    while True:
+        name = conn.recv()
+        if name is None:
+            break
+        start = time.perf_counter()
+        try:
+            ir_fc = ir.instructions[name]
+            ir_mapper = arch_mapper.process_ir_instruction(ir_fc, simple_formula)
+            rr = ir_mapper.solve(**solve_kwargs)
+            serialized = None if rr is None else rr.serialize_bindings(portable=True)
+            conn.send(("done", name, serialized, time.perf_counter() - start))
+        except LoopException:
+            conn.send(("unknown", name, None, time.perf_counter() - start))
+        except Exception as e:
+            conn.send(("error", name, (repr(e), traceback.format_exc()), time.perf_counter() - start))
+    conn.close()
+
+
+class _Worker:
+    def __init__(self, ctx, args):
+        self.conn, child_conn = ctx.Pipe()
+        self.proc = ctx.Process(target=_worker_main, args=(child_conn, *args), daemon=True)
+        self.proc.start()
+        child_conn.close()
+        self.name = None
+        self.start = None
+
+    def submit(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.conn.send(name)
+
+    def kill(self):
+        self.proc.kill()
+        self.proc.join()
+        self.conn.close()
+
+    def close(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.proc.join(1)
+        if self.proc.is_alive():
+            self.proc.kill()
+            self.proc.join()
+        self.conn.close()
+
+
+def map_ir(
+    arch_fc,
+    ir: IR,
+    workers: tp.Optional[int] = None,
+    timeout: tp.Optional[float] = None,
+    *,
+    path_constraints={},
+    family=peak_family,
+    IVar: IndexVar = OneHot,
+    interchangeable=(),
+    pool_size: int = 0,
+    simple_formula: bool = False,
+    arch_cache: tp.Optional[str] = None,
+    solver_name: str = 'z3',
+    external_loop: bool = True,
+    **solve_kwargs,
+) -> IRMapping:
+    '''
+    Maps every instruction of ir onto arch_fc using a pool of worker processes.
+
+    Each worker builds its own ArchMapper once and then constructs and solves
+    one IRMapper per instruction it is handed.
+    timeout is the per instruction wall time limit in seconds. A worker which
+    exceeds it is killed and replaced.
+    An instruction whose solve gives up (LoopException) has no rule and is
+    listed in unknown. Any other error in a worker raises a RuntimeError.
+    If arch_cache is a directory the workers load the ArchMapper from it (see
+    cached_arch_mapper) instead of running the arch on every input form.
+    With pool_size > 0 each worker's ArchMapper has a counterexample pool (see
+    CounterexamplePool), which lives in the worker: it only seeds the
+    instructions solved by that worker and is not returned to the caller.
+    '''
+    names = list(ir.instructions)
+    if len(names) == 0:
+        return IRMapping({}, {}, set(), set())
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(names)))
+    mapper_kwargs = dict(path_constraints=path_constraints, family=family, IVar=IVar, interchangeable=interchangeable, pool_size=pool_size)
+    solve_kwargs = dict(solver_name=solver_name, external_loop=external_loop, **solve_kwargs)
+    args = (arch_fc, ir, mapper_kwargs, arch_cache, simple_formula, solve_kwargs)
+
+    ctx = _mp_context()
+    serialized = {}
+    times = {}
+    timed_out = set()
+    unknown = set()
+    pending = list(reversed(names))
+    # Workers which are still building their ArchMapper
+    starting = {}
+    idle = []
+    busy = {}
+    def start_worker():
+        worker = _Worker(ctx, args)
+        starting[worker.conn] = worker
+
+    for _ in range(workers):
+        start_worker()
+    try:
+        while pending or busy:
+            while pending and idle:
+                worker = idle.pop()
+                worker.submit(pending.pop())
+                busy[worker.conn] = worker
+
+            wait_time = None
+            if timeout is not None and busy:
+                now = time.perf_counter()
+                wait_time = max(0, min(w.start + timeout - now for w in busy.values()))
+            for conn in multiprocessing.connection.wait([*starting, *busy], wait_time):
+                worker = starting.pop(conn, None) or busy.pop(conn)
+                try:
+                    msg = conn.recv()
+                except EOFError:
+                    raise RuntimeError(f"Worker died while mapping {worker.name}")
+                if msg is None:
+                    idle.append(worker)
+                    continue
+                status, name, rr, t = msg
+                if status == "error":
+                    err_msg, tb = rr
+                    raise RuntimeError(f"Mapping {name} failed with {err_msg}\n{tb}")
+                if status == "unknown":
+                    logger.debug(f"Gave up mapping {name}")
+                    unknown.add(name)
+                    rr = None
+                serialized[name] = rr
+                times[name] = t
+                idle.append(worker)
+
+            if timeout is not None:
+                now = time.perf_counter()
+                for conn, worker in list(busy.items()):
+                    if now - worker.start >= timeout:
+                        logger.debug(f"Timed out mapping {worker.name}")
+                        del busy[conn]
+                        worker.kill()
+                        serialized[worker.name] = None
+                        times[worker.name] = now - worker.start
+                        timed_out.add(worker.name)
+                        start_worker()
+    finally:
+        for worker in [*starting.values(), *busy.values()]:
+            worker.kill()
+        for worker in idle:
+            worker.close()
+
+    rules = {}
+    for name in names:
+        rr = serialized[name]
+        if rr is not None:
+            rr = read_serialized_bindings(rr, ir.instructions[name], arch_fc)
+        rules[name] = rr
+    times = {name: times[name] for name in names}
+    return IRMapping(rules, times, timed_out, unknown)
+
+
+# rule: RewriteRule or None
+# config: the config which produced the answer, None if no config gave a
+#   definitive answer within the timeout
+# times: elapsed wall time of each config (None if it was killed)
+PortfolioResult = namedtuple("PortfolioResult", ["rule", "config", "times"])
+
+_SOLVE_ARGS = ("solver_name", "external_loop", "itr_limit", "num_init", "logic", "num_counterexamples")
+
+# Solvers which can solve the quantified formula directly
+_QUANTIFIER_SOLVERS = ("z3", "cvc4")
+
+def default_portfolio():
+    '''
+    Every installed solver with the external (CEGIS) loop, and the quantifier
+    supporting solvers on the quantified formula.
+    '''
+    available = smt.get_env().factory.all_solvers()
+    configs = []
+    for solver_name in ("z3", "cvc4", "yices", "btor"):
+        if solver_name not in available:
+            continue
+        configs.append(dict(solver_name=solver_name, external_loop=True))
+        if solver_name in _QUANTIFIER_SOLVERS:
+            configs.append(dict(solver_name=solver_name, external_loop=False))
+    return configs
+
+
+def _portfolio_main(conn, ir_mapper, config):
+    start = time.perf_counter()
+    try:
+        rr = ir_mapper.solve(**config)
+        serialized = None if rr is None else rr.serialize_bindings(portable=True)
+        conn.send(("done", serialized, time.perf_counter() - start))
+    except LoopException:
+        conn.send(("unknown", None, time.perf_counter() - start))
+    except Exception as e:
+        conn.send(("error", (repr(e), traceback.format_exc()), time.perf_counter() - start))
+    conn.close()
+
+
+def solve_portfolio(ir_mapper, configs=None, timeout: tp.Optional[float] = None) -> PortfolioResult:
+    '''
+    Runs ir_mapper.solve with each config (a dict of solve arguments) in its
+    own process and returns the first definitive answer (a rule or the proof
+    that none exists). The remaining processes are killed.
+    A config that fails (eg the solver is not installed) or hits the
+    iteration limit is ignored unless every config fails.
+    '''
+    if configs is None:
+        configs = default_portfolio()
+    configs = [dict(config) for config in configs]
+    if len(configs) == 0:
+        raise ValueError("Portfolio needs at least one config")
+    for config in configs:
+        for arg in config:
+            if arg not in _SOLVE_ARGS:
+                raise ValueError(f"Invalid solve argument {arg}, expected one of {_SOLVE_ARGS}")
+    times = [None for _ in configs]
+    if not ir_mapper.has_bindings:
+        return PortfolioResult(None, configs[0], times)
+
+    ctx = _mp_context()
+    procs = {}
+    for i, config in enumerate(configs):
+        conn, child_conn = ctx.Pipe()
+        proc = ctx.Process(target=_portfolio_main, args=(child_conn, ir_mapper, config), daemon=True)
+        proc.start()
+        child_conn.close()
+        procs[conn] = (i, proc)
+
+    start = time.perf_counter()
+    winner = None
+    serialized = None
+    errors = []
+    try:
+        while procs and winner is None:
+            wait_time = None
+            if timeout is not None:
+                wait_time = max(0, start + timeout - time.perf_counter())
+            ready = multiprocessing.connection.wait(list(procs), wait_time)
+            if len(ready) == 0:
+                logger.debug("Portfolio timed out")
+                break
+            for conn in ready:
+                i, proc = procs.pop(conn)
+                try:
+                    status, result, t = conn.recv()
+                except EOFError:
+                    status, result, t = "error", ("Process died", ""), time.perf_counter() - start
+                conn.close()
+                proc.join()
+                times[i] = t
+                logger.debug(f"Portfolio config {configs[i]} finished with {status} in {t:.2f}s")
+                if status == "done":
+                    winner = i
+                    serialized = result
+                    break
+                elif status == "error":
+                    errors.append((configs[i], *result))
+    finally:
+        for conn, (_, proc) in procs.items():
+            proc.kill()
+            proc.join()
+            conn.close()
+
+    if winner is None:
+        if len(errors) == len(configs):
+            config, err_msg, tb = errors[0]
+            raise RuntimeError(f"Every portfolio config failed, {config} failed with {err_msg}\n{tb}")
+        return PortfolioResult(None, None, times)
+    rr = serialized
+    if rr is not None:
+        rr = read_serialized_bindings(rr, ir_mapper.peak_fc, ir_mapper.archmapper.peak_fc)
+    return PortfolioResult(rr, configs[winner], times)
+
+
+# Counterexamples are sent back from the workers keyed by the index of the
+# path in the ibinding of the rule (paths may contain types which can not be
+# pickled, neither can hwtypes values)
+def _portable_ce(rule, ce):
+    if ce is None:
+        return None
+    ir_ce, arch_ce = ce
+    ir_idx = {ir_path: i for i, (ir_path, _) in enumerate(rule.ibinding) if isinstance(ir_path, tuple)}
+    arch_idx = {arch_path: i for i, (_, arch_path) in enumerate(rule.ibinding)}
+    to_int = lambda v: (True, 1, int(v)) if isinstance(v, Bit) else (False, v.size, int(v))
+    return (
+        [(ir_idx[path], to_int(v)) for path, v in ir_ce.items()],
+        [(arch_idx[path], to_int(v)) for path, v in arch_ce.items()],
+    )
+
+
+def _load_ce(rule, portable):
+    if portable is None:
+        return None
+    ir_ce, arch_ce = portable
+    from_int = lambda is_bit, size, v: Bit(v) if is_bit else BitVector[size](v)
+    return (
+        {rule.ibinding[i][0]: from_int(*v) for i, v in ir_ce},
+        {rule.ibinding[i][1]: from_int(*v) for i, v in arch_ce},
+    )
+
+
+def _verify_main(conn, rules, indices, solver_name):
+    try:
+        with RuleVerifier(solver_name) as verifier:
+            ces = [(i, _portable_ce(rules[i], verifier.verify(rules[i]))) for i in indices]
+        conn.send((ces, None))
+    except Exception as e:
+        conn.send((None, (repr(e), traceback.format_exc())))
+    conn.close()
+
+
+def verify_all(
+    rules: tp.Sequence[RewriteRule],
+    workers: tp.Optional[int] = None,
+    solver_name: str = 'z3',
+) -> tp.List[tp.Union[None, "CounterExample"]]:
+    '''
+    Verifies every rule, returning the counterexample of each (None if the
+    rule is valid) in the order of rules.
+
+    Rules are split over workers processes by (arch_fc, ir_fc) so that each
+    worker symbolically executes each family closure at most once, and
+    verifies its rules incrementally in one RuleVerifier. With workers=1
+    everything runs in this process.
+    '''
+    rules = list(rules)
+    if len(rules) == 0:
+        return []
+    groups = {}
+    for i, rule in enumerate(rules):
+        groups.setdefault((rule.arch_fc, rule.ir_fc), []).append(i)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(groups)))
+    if workers == 1:
+        with RuleVerifier(solver_name) as verifier:
+            return verifier.verify_all(rules)
+
+    # Largest groups first, each to the worker with the fewest rules
+    assignments = [[] for _ in range(workers)]
+    for group in sorted(groups.values(), key=len, reverse=True):
+        min(assignments, key=len).extend(group)
+
+    ctx = _mp_context()
+    procs = {}
+    ces = [None]*len(rules)
+    try:
+        for indices in assignments:
+            conn, child_conn = ctx.Pipe()
+            proc = ctx.Process(target=_verify_main, args=(child_conn, rules, indices, solver_name), daemon=True)
+            proc.start()
+            child_conn.close()
+            procs[conn] = proc
+        while procs:
+            for conn in multiprocessing.connection.wait(list(procs)):
+                proc = procs.pop(conn)
+                try:
+                    result, err = conn.recv()
+                except EOFError:
+                    raise RuntimeError("Worker died while verifying rules")
+                conn.close()
+                proc.join()
+                if err is not None:
+                    err_msg, tb = err
+                    raise RuntimeError(f"Verifying rules failed with {err_msg}\n{tb}")
+                for i, ce in result:
+                    ces[i] = _load_ce(rules[i], ce)
+    finally:
+        for conn, proc in procs.items():
+            proc.kill()
+            proc.join()
+            conn.close()
+    return ces
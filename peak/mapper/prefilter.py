@@ -0,0 +1,255 @@
+import functools
+import itertools
+import random
+import typing as tp
+
+from hwtypes import Bit, BitVector
+from hwtypes.adt import Product, Tuple, Sum, TaggedUnion, Enum
+from hwtypes.modifiers import strip_modifiers
+from peak.assembler import Assembler
+from peak.black_box import get_black_boxes
+import pysmt.shortcuts as smt
+from pysmt.logics import QF_BV
+from .utils import Unbound, Match
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+#Const BitVector leaves up to this width are enumerated exhaustively
+EXHAUSTIVE_WIDTH = 3
+
+
+def _corners(T):
+    if issubclass(T, Bit):
+        return [Bit(0), Bit(1)]
+    w = T.size
+    values = [0, 1, -1, 1 << (w - 1), (1 << (w - 1)) - 1]
+    ret = []
+    for v in values:
+        v = T(v)
+        if v not in ret:
+            ret.append(v)
+    return ret
+
+def _random(T, rng):
+    if issubclass(T, Bit):
+        return Bit(rng.getrandbits(1))
+    return T(rng.getrandbits(T.size))
+
+#Returns (values, exhaustive) for a Const leaf of type T. Leaves which are
+#adts (eg opcode enums) take the values of T.enumerate()
+def _const_values(T, rng, num):
+    T = strip_modifiers(T)
+    if issubclass(T, Bit):
+        return [Bit(0), Bit(1)], True
+    if issubclass(T, BitVector):
+        if T.size <= EXHAUSTIVE_WIDTH:
+            return [T(v) for v in range(1 << T.size)], True
+        values = _corners(T)
+        while len(values) < num:
+            values.append(_random(T, rng))
+        return values, False
+    #enumerate only covers every value of an Enum
+    return list(T.enumerate()), issubclass(T, Enum)
+
+#Input leaves which are universally quantified: corner cases (the same one
+#for every leaf) followed by random values
+def _vector_values(T, rng, num):
+    T = strip_modifiers(T)
+    if issubclass(T, (Bit, BitVector)):
+        values = _corners(T)[:num]
+        while len(values) < num:
+            values.append(_random(T, rng))
+        return values
+    values = list(T.enumerate())
+    return [rng.choice(values) for _ in range(num)]
+
+#strip_modifiers is most of the cost of a simulation otherwise
+_strip = functools.lru_cache(None)(strip_modifiers)
+
+def _flatten(T, value, path=()):
+    T = _strip(T)
+    if issubclass(T, Product):
+        for k, sub_t in T.field_dict.items():
+            yield from _flatten(sub_t, getattr(value, k), path + (k,))
+    elif issubclass(T, Tuple):
+        for k, sub_t in T.field_dict.items():
+            yield from _flatten(sub_t, value[k], path + (k,))
+    else:
+        yield path, value
+
+#Builds the value of type T at path from the values of its leaves. The field
+#of a Sum is the one the leaves are under
+def _build(T, leaves, path=()):
+    if path in leaves:
+        return leaves[path]
+    T = _strip(T)
+    if issubclass(T, TaggedUnion) or issubclass(T, Sum):
+        n = len(path)
+        field = next(p[n] for p in leaves if p[:n] == path and len(p) > n)
+        value = _build(T.field_dict[field], leaves, path + (field,))
+        if issubclass(T, TaggedUnion):
+            return T(**{field: value})
+        return T(value)
+    values = [_build(sub_t, leaves, path + (k,)) for k, sub_t in T.field_dict.items()]
+    return T(*values)
+
+#Runs the Py peak class cls on the values of its input leaves (path -> value)
+def _simulate(cls, leaves):
+    input_t = _strip(cls.input_t)
+    inputs = {k: _build(T, leaves, (k,)) for k, T in input_t.field_dict.items()}
+    outputs = cls()(**inputs)
+    output_t = _strip(cls.output_t)
+    if not isinstance(outputs, tuple):
+        outputs = (outputs,)
+    ret = {}
+    for (k, sub_t), v in zip(output_t.field_dict.items(), outputs):
+        ret.update(_flatten(sub_t, v, (k,)))
+    return ret
+
+
+def _to_pysmt(value):
+    if isinstance(value, Bit):
+        return smt.Bool(bool(value))
+    if isinstance(value, BitVector):
+        return smt.BV(value.value, value.size)
+    assembler = Assembler(type(value))
+    return smt.BV(assembler.assemble(value, BitVector).value, assembler.width)
+
+#Decides the triples the simulation could not: the arch outputs of the form
+#are evaluated on the concrete vectors with the Const inputs left symbolic and
+#the solver is asked for Const values matching the ir on every vector
+def _check_consts(am, fi, ibinding, bos, compared, vectors, ir_outputs, solver_name):
+    output_form = am.output_forms[fi][0]
+    survivors = set()
+    with smt.Solver(solver_name, logic=QF_BV) as solver:
+        for cond in am.const_valid_conditions[fi]:
+            solver.add_assertion(cond.value)
+        for path, choice in am.input_forms[fi].path_dict.items():
+            solver.add_assertion(am.input_varmap[path + (Match,)][choice].value)
+        arch_outputs = []
+        for k, vector in enumerate(vectors):
+            subs = {am.input_varmap[arch_path].value: _to_pysmt(vector[arch_path]) for _, arch_path in ibinding if arch_path in vector}
+            arch_outputs.append({
+                path: output_form.varmap[path].value.substitute(subs).simplify()
+                for path in set(a for bo in bos for _, a in compared[bo])
+            })
+        for bo in bos:
+            eqs = [
+                smt.EqualsOrIff(arch_output[a], _to_pysmt(ir_output[i]))
+                for arch_output, ir_output in zip(arch_outputs, ir_outputs)
+                for i, a in compared[bo]
+            ]
+            solver.push()
+            solver.add_assertion(smt.And(eqs))
+            if solver.solve():
+                survivors.add(bo)
+            solver.pop()
+    return survivors
+
+
+def prefilter_bindings(irmapper, input_bindings, output_bindings, num_vectors: int = 8, max_consts: int = 64, seed: int = 0, solver_name: str = 'z3') -> tp.Optional[tp.Set[tp.Tuple[int, int, int]]]:
+    '''
+    Returns the (form, input binding, output binding) triples for which some
+    assignment of the unbound Const arch inputs matches the ir on
+    num_vectors corner case and random input vectors. Every rule of the
+    IRMapper is among the survivors.
+
+    The ir and arch are simulated in the Py family with Const values drawn
+    from their valid encodings (at most max_consts assignments). When these
+    do not cover every Const value, or the arch can not be simulated on the
+    form, a rejected triple is confirmed by a solver query over the Const
+    inputs only.
+    Returns None if the arch or ir can not be handled this way (black boxes,
+    path constraints, an ir or arch which can not be simulated at all).
+    '''
+    am = irmapper.archmapper
+    if get_black_boxes(am.peak_obj) or get_black_boxes(irmapper.peak_obj) or am.path_constraints:
+        return None
+    rng = random.Random(seed)
+    ir_cls = irmapper.py_peak_cls()
+    arch_cls = am.py_peak_cls()
+    ir_path_types = irmapper.path_to_adt(input=True, strip=True)
+    arch_path_types = am.path_to_adt(input=True, strip=True)
+
+    ir_vectors = {path: _vector_values(T, rng, num_vectors) for path, T in sorted(ir_path_types.items(), key=repr)}
+    arch_vectors = {}
+    def arch_vector(path):
+        if path not in arch_vectors:
+            arch_vectors[path] = _vector_values(arch_path_types[path], rng, num_vectors)
+        return arch_vectors[path]
+
+    ir_outputs = []
+    for k in range(num_vectors):
+        try:
+            ir_outputs.append(_simulate(ir_cls, {path: vs[k] for path, vs in ir_vectors.items()}))
+        except Exception as e:
+            logger.debug(f"Can not simulate the ir: {e}")
+            return None
+
+    compared = [
+        [(ir_path, arch_path) for ir_path, arch_path in obinding if ir_path is not Unbound]
+        for obinding in output_bindings
+    ]
+    survivors = set()
+    unsimulatable = set()
+    simulated = False
+    unchecked = []
+    for fi, bindings in enumerate(input_bindings):
+        for bi, ibinding in enumerate(bindings):
+            const_paths = [arch_path for ir_path, arch_path in ibinding if ir_path is Unbound and arch_path in am.const_paths]
+            spaces = [_const_values(arch_path_types[path], rng, max_consts) for path in const_paths]
+            exhaustive = all(e for _, e in spaces)
+            num_consts = 1
+            for values, _ in spaces:
+                num_consts *= len(values)
+            if num_consts <= max_consts:
+                consts = itertools.product(*(values for values, _ in spaces))
+            else:
+                exhaustive = False
+                consts = (tuple(rng.choice(values) for values, _ in spaces) for _ in range(max_consts))
+
+            #The values of the non Const arch inputs on each vector
+            vectors = [{} for _ in range(num_vectors)]
+            for ir_path, arch_path in ibinding:
+                if arch_path in const_paths:
+                    continue
+                values = arch_vector(arch_path) if ir_path is Unbound else ir_vectors[ir_path]
+                for k in range(num_vectors):
+                    vectors[k][arch_path] = values[k]
+
+            passed = set()
+            try:
+                if fi in unsimulatable:
+                    consts = ()
+                for const in consts:
+                    const_values = dict(zip(const_paths, const))
+                    alive = set(range(len(output_bindings))) - passed
+                    for vector, ir_output in zip(vectors, ir_outputs):
+                        arch_output = _simulate(arch_cls, {**vector, **const_values})
+                        simulated = True
+                        alive = {bo for bo in alive if all(ir_output[i] == arch_output[a] for i, a in compared[bo])}
+                        if not alive:
+                            break
+                    passed |= alive
+                    if len(passed) == len(output_bindings):
+                        break
+            except Exception as e:
+                #Some peak objects only run in the SMT family (eg reading the
+                #value of an unmatched Sum)
+                logger.debug(f"Can not simulate the arch: {e}")
+                unsimulatable.add(fi)
+            if fi in unsimulatable:
+                passed = set()
+                exhaustive = False
+            rejected = set(range(len(output_bindings))) - passed
+            if rejected and not exhaustive:
+                unchecked.append((fi, bi, ibinding, rejected, vectors))
+            survivors.update((fi, bi, bo) for bo in passed)
+    if not simulated:
+        return None
+    for fi, bi, ibinding, rejected, vectors in unchecked:
+        passed = _check_consts(am, fi, ibinding, rejected, compared, vectors, ir_outputs, solver_name)
+        survivors.update((fi, bi, bo) for bo in passed)
+    return survivors
@@ -0,0 +1,160 @@
+import itertools
+import re
+import typing as tp
+
+from hwtypes import Bit, BitVector
+from hwtypes.adt import Sum, TaggedUnion
+from hwtypes.adt import is_adt_type
+from hwtypes.modifiers import strip_modifiers
+from peak.assembler import Assembler
+from .mapper import ArchMapper, RewriteRule, LoopException, _create_path_to_adt
+from .stats import MapperStats, phase, count
+from .utils import Unbound
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+#Finds the field of the Sum type target_t which corresponds to the field T of
+#the same Sum type built at another width. Fields are matched by their repr,
+#first as is and then with the small width replaced by the target width.
+def _lift_sum_field(T, target_t, small_width, width):
+    name = repr(T)
+    for candidate in (name, re.sub(rf"\b{small_width}\b", str(width), name)):
+        fields = [F for F in target_t.fields if repr(F) == candidate]
+        if len(fields) == 1:
+            return fields[0]
+    raise ValueError(f"Cannot find a field of {target_t} corresponding to {T}")
+
+#Translates a path of adt_t into the corresponding path of target_t
+def lift_path(adt_t, target_t, path, small_width, width):
+    if path is Unbound:
+        return path
+    ret = []
+    for p in path:
+        adt_t = strip_modifiers(adt_t)
+        target_t = strip_modifiers(target_t)
+        if issubclass(adt_t, Sum) and not issubclass(adt_t, TaggedUnion):
+            q = _lift_sum_field(p, target_t, small_width, width)
+        else:
+            q = p
+        ret.append(q)
+        adt_t = adt_t.field_dict[p]
+        target_t = target_t.field_dict[q]
+    return tuple(ret)
+
+def _const_width(T):
+    T = strip_modifiers(T)
+    if issubclass(T, Bit):
+        return 1
+    elif issubclass(T, BitVector):
+        return T.size
+    assert is_adt_type(T)
+    return Assembler(T).width
+
+#The values a constant of the small rule may take at the target width
+def _lift_const(value, width):
+    if isinstance(value, Bit) or len(value) == width:
+        return [value]
+    if len(value) > width:
+        raise ValueError(f"Cannot lift {value} to a narrower width {width}")
+    candidates = [value.zext(width - len(value))]
+    sext = value.sext(width - len(value))
+    if sext != candidates[0]:
+        candidates.append(sext)
+    return candidates
+
+def lift_rule(rr: RewriteRule, ir_fc, arch_fc, small_width: int, width: int) -> tp.Iterator[RewriteRule]:
+    '''
+    Yields the candidate rules for ir_fc and arch_fc (the target width
+    instances) obtained from rr, which was found for the small_width
+    instances. Paths are translated field by field and each constant whose
+    width changes is either zero or sign extended, so several candidates are
+    yielded when the rule has such constants.
+    '''
+    small_arch = rr.arch_fc.Py
+    small_ir = rr.ir_fc.Py
+    arch_bv = arch_fc.Py
+    ir_bv = ir_fc.Py
+    arch_path_types = _create_path_to_adt(arch_bv.input_t)
+
+    def arch_ipath(p):
+        return lift_path(small_arch.input_t, arch_bv.input_t, p, small_width, width)
+
+    ibinding = []
+    for ir_path, arch_path in rr.ibinding:
+        arch_path = arch_ipath(arch_path)
+        if ir_path is Unbound or isinstance(ir_path, tuple):
+            ir_path = lift_path(small_ir.input_t, ir_bv.input_t, ir_path, small_width, width)
+            ibinding.append([(ir_path, arch_path)])
+        else:
+            values = _lift_const(ir_path, _const_width(arch_path_types[arch_path]))
+            ibinding.append([(v, arch_path) for v in values])
+
+    obinding = []
+    for ir_path, arch_path in rr.obinding:
+        ir_path = lift_path(small_ir.output_t, ir_bv.output_t, ir_path, small_width, width)
+        arch_path = lift_path(small_arch.output_t, arch_bv.output_t, arch_path, small_width, width)
+        obinding.append((ir_path, arch_path))
+
+    for binding in itertools.product(*ibinding):
+        try:
+            yield RewriteRule(list(binding), obinding, ir_fc, arch_fc)
+        except ValueError:
+            #The extended constant is not a valid value for its type
+            continue
+
+def map_reduced_width(
+    gen_arch: tp.Callable[[int], tp.Callable],
+    gen_ir: tp.Callable[[int], tp.Callable],
+    width: int,
+    small_width: int = 4,
+    solver_name: str = 'z3',
+    trust_small_unsat: bool = False,
+    arch_kwargs: tp.Optional[tp.Mapping] = None,
+    stats: tp.Optional[MapperStats] = None,
+    **solve_kwargs,
+) -> tp.Optional[RewriteRule]:
+    '''
+    Maps gen_ir(width) onto gen_arch(width) by solving at small_width.
+
+    gen_arch and gen_ir build the family closures of a given data width (eg
+    examples.PE_lut.gen_PE). The rule found for the small_width instances is
+    lifted to width with lift_rule and checked with RewriteRule.verify. The
+    width instances are only solved directly when no lifted candidate
+    verifies or when no small rule is found. With trust_small_unsat None is
+    returned in the latter case instead, which is faster but not exact (eg
+    when the mapping needs a constant which does not fit in small_width).
+    '''
+    if arch_kwargs is None:
+        arch_kwargs = {}
+    arch_fc = gen_arch(width)
+    ir_fc = gen_ir(width)
+
+    if small_width < width:
+        small_arch_mapper = ArchMapper(gen_arch(small_width), stats=stats, **arch_kwargs)
+        small_ir_mapper = small_arch_mapper.process_ir_instruction(gen_ir(small_width), stats=stats)
+        with phase(stats, "small_solve"):
+            try:
+                small_rr = small_ir_mapper.solve(solver_name, **solve_kwargs)
+                unsat = small_rr is None
+            except LoopException:
+                small_rr = None
+                unsat = False
+        if unsat and trust_small_unsat:
+            return None
+        if small_rr is not None:
+            try:
+                for rr in lift_rule(small_rr, ir_fc, arch_fc, small_width, width):
+                    count(stats, "lifted_candidates")
+                    if rr.verify(solver_name, stats=stats) is None:
+                        count(stats, "lifted_rules")
+                        return rr
+            except (ValueError, KeyError) as e:
+                logger.debug(f"Cannot lift the {small_width} bit rule: {e}")
+
+    count(stats, "full_width_solves")
+    arch_mapper = ArchMapper(arch_fc, stats=stats, **arch_kwargs)
+    ir_mapper = arch_mapper.process_ir_instruction(ir_fc, stats=stats)
+    with phase(stats, "full_solve"):
+        return ir_mapper.solve(solver_name, **solve_kwargs)
@@ -0,0 +1,195 @@
+import json
+import mmap
+import os
+import struct
+import typing as tp
+
+from hwtypes.modifiers import strip_modifiers
+
+from .mapper import RewriteRule, read_serialized_bindings
+
+
+# A rule database is a directory holding
+#   rules.db:  _DATA_MAGIC followed by the records. A record is the portable
+#              serialize_bindings of a rule as compact json.
+#   rules.idx: _INDEX_MAGIC followed by one entry per record: _ENTRY (offset
+#              and length of the record in rules.db, lengths of the name and
+#              signature) then the utf-8 name and signature.
+# Both files are only ever appended to (by one writer at a time). A record is
+# written (and flushed) before its index entry so an interrupted append leaves
+# at most an unreferenced record or a partial entry at the end of rules.idx,
+# which is ignored.
+_DATA = "rules.db"
+_INDEX = "rules.idx"
+_DATA_MAGIC = b"PEAKRDB1"
+_INDEX_MAGIC = b"PEAKRIX1"
+_ENTRY = struct.Struct("<QIHH")
+
+
+def type_signature(fc) -> str:
+    '''
+    The input and output types (in field order, without modifiers) of the
+    peak class of the family closure fc, eg "(BitVector[8],BitVector[8])->(BitVector[8])"
+    '''
+    cls = fc.Py
+    def types(adt):
+        return ",".join(repr(strip_modifiers(T)) for T in adt.field_dict.values())
+    return f"({types(cls.input_t)})->({types(cls.output_t)})"
+
+
+class RuleEntry(tp.NamedTuple):
+    index: int
+    name: str
+    signature: str
+    offset: int
+    length: int
+
+
+class RuleDatabase:
+    '''
+    Append only on disk library of rewrite rules indexed by IR instruction
+    name and by IR type signature (see type_signature).
+
+    Opening a database only reads the index. rules.db is memory mapped and a
+    rule is decoded (and its family closures instantiated) only when it is
+    loaded, so looking up a few instructions in a large library touches only
+    their records.
+
+    entries(name=None, signature=None) returns the index entries which match,
+    load(entry, ir_fc, arch_fc) builds the RewriteRule of an entry.
+    append(name, rr) adds a rule; refresh() picks up rules appended by others.
+    '''
+    def __init__(self, path, readonly: bool = False):
+        self.path = os.fspath(path)
+        self.readonly = readonly
+        data = os.path.join(self.path, _DATA)
+        index = os.path.join(self.path, _INDEX)
+        if not os.path.exists(index):
+            if readonly:
+                raise FileNotFoundError(f"No rule database at {self.path}")
+            os.makedirs(self.path, exist_ok=True)
+            for fname, magic in ((data, _DATA_MAGIC), (index, _INDEX_MAGIC)):
+                with open(fname, "xb") as f:
+                    f.write(magic)
+        mode = "rb" if readonly else "r+b"
+        self._map = None
+        self._data = open(data, mode)
+        self._index = open(index, mode)
+        if self._data.read(len(_DATA_MAGIC)) != _DATA_MAGIC or self._index.read(len(_INDEX_MAGIC)) != _INDEX_MAGIC:
+            self.close()
+            raise ValueError(f"{self.path} is not a rule database")
+        self._index_end = len(_INDEX_MAGIC)
+        self._entries: tp.List[RuleEntry] = []
+        self._by_name: tp.Dict[str, tp.List[int]] = {}
+        self._by_signature: tp.Dict[str, tp.List[int]] = {}
+        #Number of records decoded
+        self.num_loaded = 0
+        self.refresh()
+
+    def refresh(self):
+        '''
+        Reads the index entries appended since the database was opened (or
+        last refreshed)
+        '''
+        self._index.seek(self._index_end)
+        buf = self._index.read()
+        data_size = os.fstat(self._data.fileno()).st_size
+        pos = 0
+        while pos + _ENTRY.size <= len(buf):
+            offset, length, name_len, sig_len = _ENTRY.unpack_from(buf, pos)
+            end = pos + _ENTRY.size + name_len + sig_len
+            if end > len(buf) or offset + length > data_size:
+                break
+            name = buf[pos + _ENTRY.size:pos + _ENTRY.size + name_len].decode()
+            signature = buf[end - sig_len:end].decode()
+            self._add(name, signature, offset, length)
+            pos = end
+        self._index_end += pos
+
+    def _add(self, name, signature, offset, length):
+        entry = RuleEntry(len(self._entries), name, signature, offset, length)
+        self._entries.append(entry)
+        self._by_name.setdefault(name, []).append(entry.index)
+        self._by_signature.setdefault(signature, []).append(entry.index)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def names(self) -> tp.List[str]:
+        return list(self._by_name)
+
+    def signatures(self) -> tp.List[str]:
+        return list(self._by_signature)
+
+    def entries(self, name: tp.Optional[str] = None, signature: tp.Optional[str] = None) -> tp.List[RuleEntry]:
+        if name is None and signature is None:
+            return list(self._entries)
+        idxs = None
+        for key, table in ((name, self._by_name), (signature, self._by_signature)):
+            if key is None:
+                continue
+            found = table.get(key, [])
+            idxs = found if idxs is None else sorted(set(idxs).intersection(found))
+        return [self._entries[i] for i in idxs]
+
+    def serialized(self, entry: RuleEntry) -> dict:
+        '''
+        The serialize_bindings dict of entry
+        '''
+        end = entry.offset + entry.length
+        if self._map is None or len(self._map) < end:
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self._data.fileno(), 0, access=mmap.ACCESS_READ)
+        self.num_loaded += 1
+        return json.loads(self._map[entry.offset:end])
+
+    def load(self, entry: RuleEntry, ir_fc, arch_fc) -> RewriteRule:
+        return read_serialized_bindings(self.serialized(entry), ir_fc, arch_fc)
+
+    #The rules of the IR instruction name
+    def rules(self, name: str, ir_fc, arch_fc) -> tp.List[RewriteRule]:
+        return [self.load(entry, ir_fc, arch_fc) for entry in self.entries(name=name)]
+
+    def append(self, name: str, rr: RewriteRule) -> RuleEntry:
+        return self.append_serialized(name, type_signature(rr.ir_fc), rr.serialize_bindings(portable=True))
+
+    def append_serialized(self, name: str, signature: str, serialized: dict) -> RuleEntry:
+        '''
+        Appends a rule given as its portable serialize_bindings dict (eg
+        when converting a json rule library without building the rules)
+        '''
+        if self.readonly:
+            raise ValueError("Rule database is read only")
+        if not serialized.get("portable", False):
+            raise ValueError("Rules need to be serialized with portable=True")
+        record = json.dumps(serialized, separators=(",", ":")).encode()
+        name_b = name.encode()
+        sig_b = signature.encode()
+
+        self._data.seek(0, os.SEEK_END)
+        offset = self._data.tell()
+        self._data.write(record)
+        self._data.flush()
+
+        #Drop a partial entry left by an interrupted append
+        self.refresh()
+        self._index.truncate(self._index_end)
+        self._index.seek(self._index_end)
+        self._index.write(_ENTRY.pack(offset, len(record), len(name_b), len(sig_b)) + name_b + sig_b)
+        self._index.flush()
+        self.refresh()
+        return self._entries[-1]
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._data.close()
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
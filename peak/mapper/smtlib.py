@@ -0,0 +1,216 @@
+import json
+import re
+import warnings
+import typing as tp
+
+from pysmt.smtlib import commands as smtcmd
+from pysmt.smtlib.script import smtlibscript_from_formula
+from hwtypes import Bit, BitVector, SMTBit
+
+from .cache import fingerprint
+from .mapper import IRMapper, RewriteRule, rr_from_selection, expand_forall
+from .utils import Unbound, path_to_json, path_from_json
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+# An exported query is an SMT-LIB2 script which asserts IRMapper.formula,
+# checks it and asks for the values of the selectors and Const inputs, plus a
+# json sidecar (<fname>.json) which maps those variables back to the input
+# and output bindings of the IRMapper:
+#   ir, arch:   fingerprints of the family closures the query was built from
+#   selectors:  for each of form/ibinding/obinding the variable name and the
+#               value which selects each index
+#   consts:     [arch path, variable name, width, is_bit] of each input which
+#               rr_from_solver reads from the model
+#   input_bindings[form][bidx], output_bindings[bidx]: the bindings with
+#               portable paths ("unbound" for Unbound)
+_VERSION = 1
+SIDECAR_SUFFIX = ".json"
+
+
+def _selector(ivar):
+    return dict(
+        name=ivar.var.value.symbol_name(),
+        codes=[int(ivar.translate_index(ivar.num_entries, i)) for i in range(ivar.num_entries)],
+    )
+
+def _binding_to_json(binding, ir_t, arch_t):
+    return [
+        ["unbound" if ir_path is Unbound else path_to_json(ir_t, ir_path), path_to_json(arch_t, arch_path)]
+        for ir_path, arch_path in binding
+    ]
+
+def _binding_from_json(binding, ir_t, arch_t):
+    return [
+        (Unbound if ir_path == "unbound" else path_from_json(ir_t, ir_path), path_from_json(arch_t, arch_path))
+        for ir_path, arch_path in binding
+    ]
+
+def _const_paths(irmapper):
+    am = irmapper.archmapper
+    paths = am.const_paths | set(am.path_constraints)
+    used = set()
+    for bindings in irmapper.input_bindings:
+        for binding in bindings:
+            used.update(arch_path for ir_path, arch_path in binding if ir_path is Unbound and arch_path in paths)
+    return sorted(used, key=repr)
+
+
+def export_query(irmapper: IRMapper, fname: str, quantifier_free: bool = False):
+    '''
+    Writes the query of irmapper to fname as SMT-LIB2 and its sidecar to
+    fname + SIDECAR_SUFFIX. With quantifier_free the forall variables are
+    expanded (see expand_forall), which is only feasible for narrow queries.
+    '''
+    if not irmapper.has_bindings:
+        raise ValueError("The IRMapper has no bindings so there is no query")
+    am = irmapper.archmapper
+    if quantifier_free:
+        formula = expand_forall(irmapper.forall_vars, irmapper.formula_wo_forall)
+    else:
+        formula = irmapper.formula
+
+    selectors = dict(
+        form=_selector(am.input_form_var),
+        ibinding=_selector(irmapper.ib_var),
+        obinding=_selector(irmapper.ob_var),
+    )
+    arch_t = am.peak_fc.Py
+    ir_t = irmapper.peak_fc.Py
+    consts = []
+    for path in _const_paths(irmapper):
+        var = am.input_varmap[path]
+        is_bit = isinstance(var, SMTBit)
+        consts.append([path_to_json(arch_t.input_t, path), var.value.symbol_name(), 1 if is_bit else var.size, is_bit])
+
+    with warnings.catch_warnings():
+        #pysmt does not list BV (quantified bitvectors) as an SMT-LIB logic
+        warnings.simplefilter("ignore")
+        script = smtlibscript_from_formula(formula, logic="QF_BV" if quantifier_free else "BV")
+    free_vars = formula.get_free_variables()
+    values = [v for v in (am.input_form_var.var.value, irmapper.ib_var.var.value, irmapper.ob_var.var.value) if v in free_vars]
+    values += [am.input_varmap[path].value for path in _const_paths(irmapper) if am.input_varmap[path].value in free_vars]
+    script.add(smtcmd.GET_VALUE, values)
+    with open(fname, "w") as f:
+        script.serialize(f, daggify=True)
+
+    sidecar = dict(
+        version=_VERSION,
+        ir=fingerprint(irmapper.peak_fc),
+        arch=fingerprint(am.peak_fc),
+        selectors=selectors,
+        consts=consts,
+        input_bindings=[[_binding_to_json(b, ir_t.input_t, arch_t.input_t) for b in bindings] for bindings in irmapper.input_bindings],
+        output_bindings=[_binding_to_json(b, ir_t.output_t, arch_t.output_t) for b in irmapper.output_bindings],
+    )
+    with open(fname + SIDECAR_SUFFIX, "w") as f:
+        json.dump(sidecar, f)
+
+
+_TOKEN = re.compile(r'\(|\)|\|[^|]*\||"(?:[^"]|"")*"|;[^\n]*|[^\s()|";]+')
+
+def _parse_sexprs(text):
+    stack = [[]]
+    for tok in _TOKEN.findall(text):
+        if tok.startswith(";"):
+            continue
+        if tok == "(":
+            stack.append([])
+        elif tok == ")":
+            if len(stack) == 1:
+                raise ValueError("Unbalanced parenthesis in model")
+            e = stack.pop()
+            stack[-1].append(e)
+        elif tok.startswith("|"):
+            stack[-1].append(tok[1:-1])
+        else:
+            stack[-1].append(tok)
+    if len(stack) != 1:
+        raise ValueError("Unbalanced parenthesis in model")
+    return stack[0]
+
+def _value(e):
+    if isinstance(e, str):
+        if e.startswith("#b"):
+            return int(e[2:], 2)
+        if e.startswith("#x"):
+            return int(e[2:], 16)
+        if e in ("true", "false"):
+            return int(e == "true")
+    elif len(e) == 3 and e[0] == "_" and isinstance(e[1], str) and e[1].startswith("bv"):
+        return int(e[1][2:])
+    raise ValueError(f"{e} is not a bitvector or boolean constant")
+
+def _collect(e, values):
+    if not isinstance(e, list):
+        return
+    if len(e) == 5 and e[0] == "define-fun" and e[2] == []:
+        values[e[1]] = _value(e[4])
+        return
+    if len(e) == 2 and isinstance(e[0], str):
+        try:
+            values[e[0]] = _value(e[1])
+            return
+        except ValueError:
+            pass
+    for sub in e:
+        _collect(sub, values)
+
+def read_model(text: str) -> tp.Optional[tp.Mapping[str, int]]:
+    '''
+    Parses the output of a solver run on an exported query (the check-sat
+    result followed by get-value and/or get-model output). Returns None if
+    the query is unsat and a map from variable name to value if it is sat.
+    '''
+    sexprs = _parse_sexprs(text)
+    if len(sexprs) == 0 or sexprs[0] not in ("sat", "unsat"):
+        raise ValueError(f"Solver did not answer sat or unsat: {text[:80]!r}")
+    if sexprs[0] == "unsat":
+        return None
+    values = {}
+    for e in sexprs[1:]:
+        _collect(e, values)
+    return values
+
+
+def import_model(model_fname: str, sidecar_fname: str, ir_fc, arch_fc) -> tp.Optional[RewriteRule]:
+    '''
+    Builds the RewriteRule selected by a solver model of an exported query
+    (None if the solver answered unsat). ir_fc and arch_fc have to be the
+    family closures the query was exported from.
+    '''
+    with open(sidecar_fname) as f:
+        sidecar = json.load(f)
+    if sidecar.get("version") != _VERSION:
+        raise ValueError(f"Unknown sidecar version {sidecar.get('version')}")
+    if sidecar["ir"] != fingerprint(ir_fc) or sidecar["arch"] != fingerprint(arch_fc):
+        raise ValueError(f"{sidecar_fname} was not exported from {ir_fc} and {arch_fc}")
+    with open(model_fname) as f:
+        values = read_model(f.read())
+    if values is None:
+        return None
+
+    def decode(selector):
+        s = sidecar["selectors"][selector]
+        if len(s["codes"]) == 1 and s["name"] not in values:
+            #A single entry selector may not be constrained by the query
+            return 0
+        try:
+            return s["codes"].index(values[s["name"]])
+        except (KeyError, ValueError):
+            raise ValueError(f"Model has no valid value for the {selector} selector {s['name']}")
+
+    fi, bi, bo = decode("form"), decode("ibinding"), decode("obinding")
+    arch_t = arch_fc.Py
+    ir_t = ir_fc.Py
+    ibinding = _binding_from_json(sidecar["input_bindings"][fi][bi], ir_t.input_t, arch_t.input_t)
+    obinding = _binding_from_json(sidecar["output_bindings"][bo], ir_t.output_t, arch_t.output_t)
+
+    consts = {}
+    for path, name, width, is_bit in sidecar["consts"]:
+        #Inputs the query does not depend on can take any value
+        v = values.get(name, 0)
+        consts[path_from_json(arch_t.input_t, path)] = Bit(v) if is_bit else BitVector[width](v)
+    return rr_from_selection(ibinding, obinding, set(consts), consts.__getitem__, ir_fc, arch_fc)
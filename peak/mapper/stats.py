@@ -0,0 +1,152 @@
+import json
+import sys
+import time
+import tracemalloc
+import typing as tp
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+#tracemalloc.reset_peak was added in python 3.9
+_can_reset_peak = hasattr(tracemalloc, "reset_peak")
+
+
+class PhaseStats:
+    def __init__(self):
+        self.time = 0.0
+        self.calls = 0
+        #Peak traced memory (bytes) during the phase, only if memory is traced
+        self.peak_memory = None
+
+    def as_dict(self):
+        return dict(time=self.time, calls=self.calls, peak_memory=self.peak_memory)
+
+    def __repr__(self):
+        return f"PhaseStats(time={self.time:.4f}, calls={self.calls}, peak_memory={self.peak_memory})"
+
+
+class MapperStats:
+    '''
+    Opt-in instrumentation for the mapper. Pass an instance as stats= to
+    ArchMapper, IRMapper (or process_ir_instruction) and RewriteRule.verify.
+
+    phases: name -> PhaseStats with the accumulated wall time of the phase
+    counters: name -> int (eg number of forms, bindings, formula DAG size,
+      solver iterations)
+
+    If trace_memory is True the peak python heap usage of each phase is
+    recorded with tracemalloc (which slows everything down considerably).
+    Before python 3.9 (no tracemalloc.reset_peak) the peak is only exact for
+    the outermost phase, nested phases record the larger of the traced
+    memory at their start and end.
+    The peak resident set size of the process is always reported.
+    '''
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.phases: tp.Dict[str, PhaseStats] = {}
+        self.counters: tp.Dict[str, int] = {}
+        #Peak traced memory seen so far by each open phase (innermost last)
+        self._open_peaks: tp.List[int] = []
+
+    #The traced peak since the last reset belongs to every open phase
+    def _update_open_peaks(self, peak):
+        self._open_peaks = [max(p, peak) for p in self._open_peaks]
+
+    @contextmanager
+    def phase(self, name: str):
+        stats = self.phases.setdefault(name, PhaseStats())
+        trace = self.trace_memory
+        if trace:
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start()
+            current, peak = tracemalloc.get_traced_memory()
+            if _can_reset_peak:
+                self._update_open_peaks(peak)
+                tracemalloc.reset_peak()
+                self._open_peaks.append(current)
+            else:
+                self._open_peaks.append(peak if started_tracing else current)
+        start = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            stats.time += time.perf_counter() - start
+            stats.calls += 1
+            if trace:
+                current, peak = tracemalloc.get_traced_memory()
+                if _can_reset_peak or started_tracing:
+                    self._update_open_peaks(peak)
+                else:
+                    self._update_open_peaks(current)
+                stats.peak_memory = max(self._open_peaks.pop(), stats.peak_memory or 0)
+                if started_tracing:
+                    tracemalloc.stop()
+
+    #Adds time to a phase which was timed by the caller
+    def add_time(self, name: str, seconds: float):
+        stats = self.phases.setdefault(name, PhaseStats())
+        stats.time += seconds
+        stats.calls += 1
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def set(self, name: str, value: int):
+        self.counters[name] = value
+
+    def dag_size(self, name: str, formula):
+        self.set(name, formula_dag_size(formula))
+
+    def to_dict(self):
+        return dict(
+            phases={name: stats.as_dict() for name, stats in self.phases.items()},
+            counters=dict(self.counters),
+            peak_rss=peak_rss(),
+        )
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def __repr__(self):
+        return f"MapperStats(phases={self.phases}, counters={self.counters})"
+
+
+#Number of distinct nodes of the formula (same as
+#formula.size(SizeOracle.MEASURE_DAG_NODES) without pysmt's deprecated walker)
+def formula_dag_size(formula) -> int:
+    seen = set()
+    stack = [formula]
+    while stack:
+        node = stack.pop()
+        if node in seen:
+            continue
+        seen.add(node)
+        stack.extend(node.args())
+    return len(seen)
+
+
+#Peak resident set size of the process in bytes (None if unavailable)
+def peak_rss():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    if sys.platform == "darwin":
+        return rss
+    return rss*1024
+
+
+#Helpers so instrumented code does not need to check if stats are enabled
+def phase(stats: tp.Optional[MapperStats], name: str):
+    if stats is None:
+        return nullcontext()
+    return stats.phase(name)
+
+def count(stats: tp.Optional[MapperStats], name: str, n: int = 1):
+    if stats is not None:
+        stats.count(name, n)
@@ -1,4 +1,5 @@
-from collections import namedtuple, OrderedDict
+from collections import namedtuple, OrderedDict, ChainMap
+from collections.abc import Sequence
 from functools import wraps
 import itertools as it
 import operator
@@ -7,6 +8,7 @@ import typing as tp
 from hwtypes import BitVector, Bit, SMTBitVector, SMTBit
 from hwtypes.adt import Product, Sum, Tuple, TaggedUnion
 from hwtypes.adt_util import rebind_type
+from hwtypes.modifiers import strip_modifiers
 
 import pysmt.shortcuts as smt
 
@@ -21,7 +23,125 @@ class Unbound: pass
 Form = namedtuple("Form", ["value", "path_dict", "varmap"])
 
 
+#Read only sequence whose items are computed by f on first access and cached
+class LazyList(Sequence):
+    def __init__(self, size: int, f):
+        self._size = size
+        self._f = f
+        self._cache = {}
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(self._size))]
+        idx = _check_index(idx, self._size)
+        if idx not in self._cache:
+            self._cache[idx] = self._f(idx)
+        return self._cache[idx]
+
+    #Sets the item at idx so f is never called for it
+    def prime(self, idx, value):
+        self._cache[_check_index(idx, self._size)] = value
+
+    def is_computed(self, idx):
+        return _check_index(idx, self._size) in self._cache
+
+def _check_index(idx, size):
+    if idx < 0:
+        idx += size
+    if not 0 <= idx < size:
+        raise IndexError("form index out of range")
+    return idx
+
+#Factored representation of the forms of an ADT. The forms of a Sum are the
+#concatenation of the forms of its fields and the forms of a Product/Tuple are
+#the cartesian product of the forms of its fields. Only the factors are
+#stored; each Form is built when it is accessed (and not cached) so the
+#number of forms can be exponential in the number of Sums without using
+#exponential memory. The varmap of a built form is a ChainMap over the
+#varmaps of the leaves, which are shared between all forms.
+class Forms(Sequence):
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        return self._form(_check_index(idx, len(self)))
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self._form(idx)
+
+def _varmaps(varmap):
+    if isinstance(varmap, ChainMap):
+        return varmap.maps
+    return [varmap]
+
+class LeafForms(Forms):
+    def __init__(self, value, varmap):
+        self._form_ = Form(value=value, path_dict={}, varmap=varmap)
+
+    def __len__(self):
+        return 1
+
+    def _form(self, idx):
+        return self._form_
+
+class SumForms(Forms):
+    #fields: [(field, sub_forms)]
+    #build_value(field, sub_value) constructs the sum value of a form
+    def __init__(self, path, fields, build_value):
+        self._path = path
+        self._fields = fields
+        self._build_value = build_value
+        self._len = sum(len(sub_forms) for _, sub_forms in fields)
+
+    def __len__(self):
+        return self._len
+
+    def _form(self, idx):
+        for field, sub_forms in self._fields:
+            if idx < len(sub_forms):
+                sub_form = sub_forms[idx]
+                assert self._path not in sub_form.path_dict
+                path_dict = {self._path: field, **sub_form.path_dict}
+                value = self._build_value(field, sub_form.value)
+                return Form(value=value, path_dict=path_dict, varmap=sub_form.varmap)
+            idx -= len(sub_forms)
+        raise IndexError("form index out of range")
+
+class ProductForms(Forms):
+    #Forms are ordered the same as it.product(*sub_forms_list)
+    #build_value(sub_values) constructs the product value of a form
+    def __init__(self, sub_forms_list, build_value):
+        self._sub_forms_list = sub_forms_list
+        self._build_value = build_value
+        self._len = 1
+        for sub_forms in sub_forms_list:
+            self._len *= len(sub_forms)
+
+    def __len__(self):
+        return self._len
+
+    def _form(self, idx):
+        sub_idxs = []
+        for sub_forms in reversed(self._sub_forms_list):
+            idx, sub_idx = divmod(idx, len(sub_forms))
+            sub_idxs.append(sub_idx)
+        sub_idxs.reverse()
+        values = []
+        path_dict = {}
+        maps = []
+        for sub_forms, sub_idx in zip(self._sub_forms_list, sub_idxs):
+            sub_form = sub_forms[sub_idx]
+            values.append(sub_form.value)
+            path_dict.update(sub_form.path_dict)
+            maps += _varmaps(sub_form.varmap)
+        return Form(value=self._build_value(values), path_dict=path_dict, varmap=ChainMap(*maps))
+
+
 # SMTForms Constrcuts all the Forms for a particular AssemledADT type
+# The forms are returned as a lazy Forms sequence
 # A Form represents a single 'product' when the ADT type is simplified to 'Sum of Products' form.
 # Form contains
 #   value: constructed value from varmap if value is none;
@@ -31,8 +151,16 @@ Form = namedtuple("Form", ["value", "path_dict", "varmap"])
 #      values of all the leaf nodes (free vars if value is none)
 #      tags of all the sum types (free vars if value is none)
 #      match expressions for all possible sum choices
+# tag_constraints maps the path of a Sum (TaggedUnion) to the fields (field
+# names) it may choose. Forms making any other choice are never built, the
+# value and varmap still cover every choice. The constrained paths which were
+# found are collected in self.constrained.
 class SMTForms(AssembledADTRecursor):
-    def __call__(self, aadt_t, path=(), value=None) -> (tp.List[Form], tp.Mapping["path", SMTBitVector]):
+    def __init__(self, tag_constraints: tp.Mapping["path", tuple] = {}):
+        self.tag_constraints = tag_constraints
+        self.constrained = set()
+
+    def __call__(self, aadt_t, path=(), value=None) -> (Forms, tp.Mapping["path", SMTBitVector]):
         if value is not None:
             assert isinstance(value, aadt_t)
         return super().__call__(aadt_t, path=path, value=value)
@@ -45,7 +173,7 @@ class SMTForms(AssembledADTRecursor):
         else:
             bv_value = value
         varmap = {path: bv_value}
-        return [Form(value=bv_value, path_dict={}, varmap=varmap)], varmap, bv_value
+        return LeafForms(bv_value, varmap), varmap, bv_value
 
     def enum(self, aadt_t, path, value):
         #Leaf node
@@ -59,7 +187,20 @@ class SMTForms(AssembledADTRecursor):
             bv_value = value._value_
             aadt_value = value
         varmap = {path: bv_value}
-        return [Form(value=aadt_value, path_dict={}, varmap=varmap)], varmap, aadt_value
+        return LeafForms(aadt_value, varmap), varmap, aadt_value
+
+    #The choices of the sum at path which have forms
+    def _allowed(self, path, choices):
+        if path not in self.tag_constraints:
+            return choices
+        allowed = self.tag_constraints[path]
+        for c in allowed:
+            if c not in choices:
+                raise ValueError(f"{c} is not a choice of {path}")
+        if len(allowed) == 0:
+            raise ValueError(f"No choices allowed for {path}")
+        self.constrained.add(path)
+        return allowed
 
     def sum(self, aadt_t, path, value):
         adt_t, assembler_t, bv_t = aadt_t.fields
@@ -76,6 +217,7 @@ class SMTForms(AssembledADTRecursor):
         varmap[path + (_TAG,)] = tag
         varmap[path + (Match,)] = {}
         fields = list(adt_t.fields)
+        allowed = self._allowed(path, fields)
         for field in fields:
             #field_tag_value = assembler.assemble_tag(field, bv_t)
             #tag_match = (tag==field_tag_value)
@@ -86,27 +228,25 @@ class SMTForms(AssembledADTRecursor):
                 sub_value = value[field].value
             sub_forms, sub_varmap, _sub_value = self(sub_aadt_t, path=path + (field,), value=sub_value)
             _value = aadt_t.from_fields(field, _sub_value, tag_bv=tag)
-            #update sub_forms with current match path
-            for sub_form in sub_forms:
-                assert path not in sub_form.path_dict
-                path_dict = {path:field, **sub_form.path_dict}
-                if value is None:
-                    form_value = aadt_t.from_fields(field, sub_form.value, tag_bv=tag)
-                else:
-                    form_value = value
-                forms.append(Form(value=form_value, path_dict=path_dict, varmap=sub_form.varmap))
+            if field in allowed:
+                forms.append((field, sub_forms))
             match_cond = _value[field].match
             varmap[path + (Match,)][field] = match_cond
             field_dict[field] = (_value, match_cond)
             varmap.update(sub_varmap)
 
+        def build_value(field, sub_value, value=value):
+            if value is None:
+                return aadt_t.from_fields(field, sub_value, tag_bv=tag)
+            return value
+
         #Create a large ite chain
         items = list(field_dict.items())
         sum_value = items[0][1][0]
         for field, (value, cond) in items[1:]:
             sum_value = cond.ite(value, sum_value)
 
-        return forms, varmap, sum_value
+        return SumForms(path, forms, build_value), varmap, sum_value
 
     def tagged_union(self, aadt_t, path, value):
         adt_t, assembler_t, bv_t = aadt_t.fields
@@ -123,6 +263,7 @@ class SMTForms(AssembledADTRecursor):
         varmap = {}
         varmap[path + (_TAG,)] = tag
         varmap[path + (Match,)] = {}
+        allowed = self._allowed(path, list(adt_t.field_dict))
         for field_name, field in adt_t.field_dict.items():
             #field_tag_value = assembler.assemble_tag(field, bv_t)
             #tag_match = (tag==field_tag_value)
@@ -134,31 +275,28 @@ class SMTForms(AssembledADTRecursor):
 
             sub_forms, sub_varmap, _sub_value = self(sub_aadt_t, path=path + (field_name,), value=sub_value)
             _value = aadt_t.from_fields(tag_bv=tag, **{field_name: _sub_value})
-            #update sub_forms with current match path
-            for sub_form in sub_forms:
-                assert path not in sub_form.path_dict
-                path_dict = {path:field_name, **sub_form.path_dict}
-                if value is None:
-                    form_value = aadt_t.from_fields(tag_bv=tag, **{field_name: sub_form.value})
-                else:
-                    form_value = value
-                forms.append(Form(value=form_value, path_dict=path_dict, varmap=sub_form.varmap))
+            if field_name in allowed:
+                forms.append((field_name, sub_forms))
             match_cond = getattr(_value, field_name).match
             varmap[path + (Match,)][field_name] = match_cond
             field_dict[field_name] = (_value, match_cond)
             varmap.update(sub_varmap)
 
+        def build_value(field_name, sub_value, value=value):
+            if value is None:
+                return aadt_t.from_fields(tag_bv=tag, **{field_name: sub_value})
+            return value
+
         #Create a large ite chain
         items = list(field_dict.items())
         ta_value = items[0][1][0]
         for field, (value, cond) in items[1:]:
             ta_value = cond.ite(value, ta_value)
-        return forms, varmap, ta_value
+        return SumForms(path, forms, build_value), varmap, ta_value
 
     #TODO lots of common code between product and tuple
     def product(self, aadt_t, path, value):
         adt_t, assembler_t, bv_t = aadt_t.fields
-        forms = []
         varmap = {}
 
 
@@ -178,23 +316,12 @@ class SMTForms(AssembledADTRecursor):
             forms_to_product.append(sub_forms)
 
         p_value = aadt_t.from_fields(**field_to_value)
-        for sub_forms in it.product(*forms_to_product):
-            value_dict = {}
-            path_dict = {}
-            form_varmap = {}
-            for i, sub_form in enumerate(sub_forms):
-                field_name = adt_items[i][0]
-                value_dict[field_name] = sub_form.value
-                path_dict.update(sub_form.path_dict)
-                form_varmap.update(sub_form.varmap)
-            value = aadt_t.from_fields(**value_dict)
-            forms.append(Form(value=value, path_dict=path_dict, varmap=form_varmap))
-
-        return forms, varmap, p_value
+        def build_value(values):
+            return aadt_t.from_fields(**{field_name: v for (field_name, _), v in zip(adt_items, values)})
+        return ProductForms(forms_to_product, build_value), varmap, p_value
 
     def tuple(self, aadt_t, path, value):
         adt_t, assembler_t, bv_t = aadt_t.fields
-        forms = []
         varmap = {}
 
         values = []
@@ -211,17 +338,9 @@ class SMTForms(AssembledADTRecursor):
             varmap.update(sub_varmap)
             forms_to_product.append(sub_forms)
         t_value = aadt_t.from_fields(*values)
-        for sub_forms in it.product(*forms_to_product):
-            values = []
-            path_dict = {}
-            form_varmap = {}
-            for sub_form in sub_forms:
-                values.append(sub_form.value)
-                path_dict.update(sub_form.path_dict)
-                form_varmap.update(sub_form.varmap)
-            value = aadt_t.from_fields(*values)
-            forms.append(Form(value=value, path_dict=path_dict, varmap=form_varmap))
-        return forms, varmap, t_value
+        def build_value(values):
+            return aadt_t.from_fields(*values)
+        return ProductForms(forms_to_product, build_value), varmap, t_value
 
 def check_leaf(required=False):
     def dec(f):
@@ -381,45 +500,108 @@ def _sort_by_t(path2t : tp.Mapping[tuple, "adt"]) ->tp.Mapping["adt", tp.List[tu
 
 
 
-def create_bindings(arch_flat: dict, ir_flat: dict):
+#Yields every assignment of ir_paths to arch_paths (in the order of
+#it.product(*[ir_paths + [Unbound]]*len(arch_paths))) in which each ir path is
+#bound exactly once. groups is a list of tuples of indices into arch_paths
+#whose ports are interchangeable; only the assignment where the ir indices
+#along each group are non-decreasing (Unbound last) is yielded.
+def _injective_matches(arch_paths, ir_paths, groups=()):
+    num_arch = len(arch_paths)
+    num_ir = len(ir_paths)
+    if num_ir > num_arch:
+        return
+    unbound = num_ir
+    #prev[i] is the previous index in the group of arch position i (or None)
+    prev = [None]*num_arch
+    for group in groups:
+        for a, b in zip(group, group[1:]):
+            prev[b] = a
+    choice = [None]*num_arch
+    used = [False]*num_ir
+
+    def rec(i, num_unused):
+        #Not enough arch paths left to bind every ir path
+        if num_unused > num_arch - i:
+            return
+        if i == num_arch:
+            yield tuple(Unbound if c == unbound else ir_paths[c] for c in choice)
+            return
+        lo = 0 if prev[i] is None else choice[prev[i]]
+        for c in range(lo, num_ir):
+            if used[c]:
+                continue
+            used[c] = True
+            choice[i] = c
+            yield from rec(i+1, num_unused-1)
+            used[c] = False
+        choice[i] = unbound
+        yield from rec(i+1, num_unused)
+
+    yield from rec(0, num_ir)
+
+def _lazy_product(factories, prefix=()):
+    if len(factories) == 0:
+        yield prefix
+        return
+    for v in factories[0]():
+        yield from _lazy_product(factories[1:], prefix + (v,))
+
+#Lazily generates all the bindings of ir paths to arch paths of the same type
+#where every ir path is bound exactly once.
+#interchangeable is a collection of groups of arch paths which can be permuted
+#without changing the behavior of the arch (eg commutative operands). Bindings
+#which only differ by such a permutation are generated once.
+def create_bindings(arch_flat: dict, ir_flat: dict, interchangeable=()):
     arch_by_t = _sort_by_t(arch_flat)
     ir_by_t = _sort_by_t(ir_flat)
     #check early out
     if not all((ir_type in arch_by_t) for ir_type in ir_by_t):
-        return []
+        return
 
-    possible_matching = OrderedDict()
+    factories = []
     for arch_type, arch_paths in arch_by_t.items():
-        ir_paths = ir_by_t.setdefault(arch_type, [])
-
-        #ir_poss represents all the possible inputs that could be bound to each arch_input
-        ir_poss = tuple(ir_paths) + (Unbound,)
-        #Now ir_poss has all the possible mappings for each arch_path
-
-        #Filter out some bindings
-        #Only count bindings where each ir is represented exactly once
-        #Might want to decrease this restriction to find things like (0 -> x^x)
-        #TODO could have this customizable 
-        def filt(poss):
-            ret = True
-            for ir_path in ir_paths:
-                num_ir = poss.count(ir_path)
-                ret = ret and (num_ir==1)
-                #early out
-                if ret is False:
-                    return False
-            return ret
-        type_bindings = []
-
-        for ir_match in filter(filt, it.product(*[ir_poss for _ in range(len(arch_paths))])):
-
-            type_bindings.append(list(zip(ir_match, arch_paths)))
-        possible_matching[arch_type] = type_bindings
-    bindings = []
-
-    for l in it.product(*possible_matching.values()):
-        bindings.append(list(it.chain(*l)))
-    return bindings
+        ir_paths = ir_by_t.get(arch_type, [])
+        idx = {path: i for i, path in enumerate(arch_paths)}
+        groups = []
+        for group in interchangeable:
+            group = tuple(sorted(idx[path] for path in group if path in idx))
+            if len(group) > 1:
+                groups.append(group)
+
+        def factory(arch_paths=arch_paths, ir_paths=ir_paths, groups=groups):
+            for ir_match in _injective_matches(arch_paths, ir_paths, groups):
+                yield list(zip(ir_match, arch_paths))
+        factories.append(factory)
+
+    for l in _lazy_product(factories):
+        yield list(it.chain(*l))
+
+#Sum fields are keyed by type which cannot be written to json or sent to
+#another process. These convert a path to and from a form containing only
+#strings and ints (the repr of the type is used for Sum fields)
+def path_to_json(adt_t, path):
+    ret = []
+    for p in path:
+        adt_t = strip_modifiers(adt_t)
+        if issubclass(adt_t, Sum) and not issubclass(adt_t, TaggedUnion):
+            ret.append(repr(p))
+        else:
+            ret.append(p)
+        adt_t = adt_t.field_dict[p]
+    return ret
+
+def path_from_json(adt_t, path):
+    ret = []
+    for p in path:
+        adt_t = strip_modifiers(adt_t)
+        if issubclass(adt_t, Sum) and not issubclass(adt_t, TaggedUnion):
+            fields = [T for T in adt_t.fields if repr(T) == p]
+            if len(fields) != 1:
+                raise ValueError(f"Cannot find a unique field {p} in {adt_t}")
+            p = fields[0]
+        ret.append(p)
+        adt_t = adt_t.field_dict[p]
+    return tuple(ret)
 
 def _pretty_path(path):
     if path is Unbound:
@@ -18,5 +18,8 @@ setup(
         "coreir",
         "ast-tools >= 0.1.3",
     ],
+    extras_require={
+        "batch": ["numpy"],
+    },
     python_requires='>=3.7'
 )
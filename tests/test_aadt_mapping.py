@@ -468,6 +468,49 @@ def test_non_const_constraint(simple_formula, arch_fc, ISA_fc, is_sum):
             }
         run_constraint_test(arch_fc, ir_fc, constraints=constraints, solved=solved, simple_formula=simple_formula)
 
+@pytest.mark.parametrize('simple_formula', [True, False])
+@pytest.mark.parametrize('arch_fc, ISA_fc, is_sum', [
+    (PE_fc_s, ISA_fc_s, True),
+    (PE_fc_t, ISA_fc_t, False),
+    ])
+def test_tag_constraint(simple_formula, arch_fc, ISA_fc, is_sum):
+    @family_closure
+    def ir_fc(family):
+        Data = BitVector[8]
+
+        @family.assemble(locals(), globals())
+        class IR(Peak):
+            @name_outputs(out=Data)
+            def __call__(self, in0: Data, in1: Data):
+                return in0 + in1 + 4
+
+        return IR
+
+    isa = ISA_fc.Py
+    arith, bit = (isa.ArithOp, isa.BitOp) if is_sum else ('alu', 'bit')
+    assert ArchMapper(arch_fc).num_input_forms == 2
+    for choices, solved in (
+        (arith, True),
+        ((bit, arith), True),
+        (bit, False),
+    ):
+        constraints = {("inst",): choices}
+        arch_mapper = ArchMapper(arch_fc, path_constraints=constraints)
+        allowed = choices if isinstance(choices, tuple) else (choices,)
+        #Forms choosing another field are never built
+        assert arch_mapper.num_input_forms == len(allowed)
+        assert all(form.path_dict[("inst",)] in allowed for form in arch_mapper.input_forms)
+        assert arch_mapper.path_constraints == {}
+        run_constraint_test(arch_fc, ir_fc, constraints=constraints, solved=solved, simple_formula=simple_formula)
+
+    with pytest.raises(ValueError):
+        ArchMapper(arch_fc, path_constraints={("inst",): ()})
+    with pytest.raises(ValueError):
+        ArchMapper(arch_fc, path_constraints={("inst",): isa.Op})
+    with pytest.raises(ValueError):
+        ArchMapper(arch_fc, path_constraints={("foo",): 1})
+
+
 @pytest.mark.parametrize('simple_formula', [True, False])
 def test_riscv_rr(simple_formula):
     @family_closure
@@ -0,0 +1,98 @@
+import functools
+import os
+import subprocess
+import sys
+
+import pytest
+
+from peak.mapper import ArchMapper, MapperStats, map_ir
+from peak.mapper import save_arch_mapper, load_arch_mapper, cached_arch_mapper
+from peak.mapper.arch_cache import arch_key
+
+from examples.smallir import gen_SmallIR
+from examples.sum_pe.sim import PE_fc as PE_fc_s
+from examples.tagged_pe.sim import PE_fc as PE_fc_t
+from examples.PE_lut import gen_PE
+
+
+def _rules(arch_mapper, IR):
+    rules = {}
+    for name, ir_fc in IR.instructions.items():
+        rules[name] = arch_mapper.process_ir_instruction(ir_fc).solve('z3', external_loop=True)
+    return rules
+
+
+@pytest.mark.parametrize('arch_fc', [PE_fc_s, PE_fc_t, gen_PE(8)])
+def test_round_trip(arch_fc, tmp_path, monkeypatch):
+    IR = gen_SmallIR(8)
+    save_arch_mapper(ArchMapper(arch_fc), tmp_path)
+    #The peak object is never run
+    with monkeypatch.context() as m:
+        @functools.wraps(arch_fc.SMT.__call__)
+        def run(*args, **kwargs):
+            raise AssertionError("peak object was run")
+        m.setattr(arch_fc.SMT, "__call__", run)
+        arch_mapper = load_arch_mapper(tmp_path, arch_fc)
+        for fi in range(arch_mapper.num_input_forms):
+            assert arch_mapper.evaluated_forms.is_computed(fi)
+    expected = _rules(ArchMapper(arch_fc), IR)
+    rules = _rules(arch_mapper, IR)
+    assert {n for n, rr in rules.items() if rr is None} == {n for n, rr in expected.items() if rr is None}
+    for rr in rules.values():
+        if rr is not None:
+            assert rr.verify() is None
+
+
+def test_wrong_arch(tmp_path):
+    save_arch_mapper(ArchMapper(PE_fc_s), tmp_path)
+    with pytest.raises(ValueError):
+        load_arch_mapper(tmp_path, PE_fc_t)
+
+
+def test_cached_arch_mapper(tmp_path):
+    stats = MapperStats()
+    cached_arch_mapper(PE_fc_t, tmp_path, stats=stats)
+    assert "cached_input_forms" not in stats.to_dict()["counters"]
+    assert os.listdir(tmp_path) == [arch_key(PE_fc_t)]
+    stats = MapperStats()
+    arch_mapper = cached_arch_mapper(PE_fc_t, tmp_path, stats=stats)
+    assert stats.to_dict()["counters"]["cached_input_forms"] == arch_mapper.num_input_forms
+    rr = arch_mapper.process_ir_instruction(gen_SmallIR(8).instructions["Add"]).solve('z3')
+    assert rr is not None and rr.verify() is None
+
+
+#Constraining a Sum keeps a subset of the saved forms
+def test_tag_constraints(tmp_path):
+    save_arch_mapper(ArchMapper(PE_fc_t), tmp_path)
+    stats = MapperStats()
+    arch_mapper = load_arch_mapper(tmp_path, PE_fc_t, path_constraints={("inst",): "alu"}, stats=stats)
+    assert arch_mapper.num_input_forms == 1
+    assert stats.to_dict()["counters"]["cached_input_forms"] == 1
+    assert arch_mapper.evaluated_forms.is_computed(0)
+    rr = arch_mapper.process_ir_instruction(gen_SmallIR(8).instructions["Add"]).solve('z3')
+    assert rr is not None and rr.verify() is None
+
+
+#Sum fields and variable names differ between processes
+def test_other_process(tmp_path):
+    save_arch_mapper(ArchMapper(PE_fc_s), tmp_path)
+    src = "\n".join([
+        "import sys",
+        "from peak.mapper import load_arch_mapper",
+        "from examples.smallir import gen_SmallIR",
+        "from examples.sum_pe.sim import PE_fc",
+        "am = load_arch_mapper(sys.argv[1], PE_fc)",
+        "rr = am.process_ir_instruction(gen_SmallIR(8).instructions['Add']).solve('z3')",
+        "assert rr is not None and rr.verify() is None",
+    ])
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root)
+    subprocess.run([sys.executable, "-c", src, str(tmp_path)], check=True, cwd=root, env=env)
+
+
+def test_map_ir_arch_cache(tmp_path):
+    IR = gen_SmallIR(8)
+    rules = map_ir(PE_fc_t, IR, workers=2, arch_cache=tmp_path).rules
+    assert os.listdir(tmp_path) == [arch_key(PE_fc_t)]
+    cached = map_ir(PE_fc_t, IR, workers=2, arch_cache=tmp_path).rules
+    assert {n for n, rr in rules.items() if rr is None} == {n for n, rr in cached.items() if rr is None}
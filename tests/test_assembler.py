@@ -150,3 +150,22 @@ def test_sum_determinism(asm_t):
     val = assemble()
     for _ in range(100):
         assert val == assemble()
+
+
+#Enums whose values form several ranges
+@pytest.mark.parametrize("asm_t", [Assembler, Assembler2])
+def test_sparse_enum_is_valid(asm_t):
+    class OP(Enum):
+        A = 0
+        B = 1
+        C = 2
+        D = 3
+        E = 8
+        F = 9
+        G = 10
+        H = 11
+
+    assembler = asm_t(OP)
+    values = {int(assembler.assemble(op)) for op in OP.enumerate()}
+    for v in range(1 << assembler.width):
+        assert bool(assembler.is_valid(BitVector[assembler.width](v))) == (v in values)
@@ -86,6 +86,46 @@ def test_basic(ir_fc, name):
     assert counter_example is None
 
 
+@family_closure
+def comm_arch_fc(family):
+    @family.assemble(locals(), globals())
+    class Arch(Peak):
+        def __call__(self, inst: Const(RRInst.OP), r0: Word, r1: Word) -> Word:
+            if inst == RRInst.OP.mul:
+                return r0 * r1
+            else:
+                return r0 + r1
+    return Arch
+
+def test_interchangeable():
+    ir_fc = ir_add_fc
+    group = (("r0",), ("r1",))
+    full = ArchMapper(comm_arch_fc).process_ir_instruction(ir_fc, simple_formula=True)
+    arch_mapper = ArchMapper(comm_arch_fc, interchangeable=[group])
+    ir_mapper = arch_mapper.process_ir_instruction(ir_fc, simple_formula=True)
+    assert len(ir_mapper.input_bindings[0]) < len(full.input_bindings[0])
+    rewrite_rule = ir_mapper.solve('z3', external_loop=True)
+    assert rewrite_rule is not None
+    assert rewrite_rule.verify() is None
+
+#A constrained path is not interchangeable with the rest of its group
+def test_interchangeable_constrained():
+    group = (("r0",), ("r1",))
+    arch_mapper = ArchMapper(comm_arch_fc, interchangeable=[group], path_constraints={("r0",): Word(1)})
+    assert arch_mapper.interchangeable == ()
+    ir_mapper = arch_mapper.process_ir_instruction(ir_inc_fc, simple_formula=True)
+    rewrite_rule = ir_mapper.solve('z3', external_loop=True)
+    #r0 can not be bound to the ir, so the symmetric binding is needed
+    assert rewrite_rule is not None
+    assert (("a",), ("r1",)) in rewrite_rule.ibinding
+
+def test_interchangeable_invalid():
+    with pytest.raises(ValueError):
+        ArchMapper(comm_arch_fc, interchangeable=[(("r0",), ("inst",))])
+    with pytest.raises(ValueError):
+        ArchMapper(comm_arch_fc, interchangeable=[(("r0",), ("r1",)), (("r1",),)])
+
+
 from peak.mapper.multi import Multi, Binary, OneHot
 @family_closure
 def ir_add3_fc(family):
@@ -100,3 +140,22 @@ def test_multi():
     solve = Multi(arch_fc, ir_fc, 2, IVar=Binary)
     rr = solve(maxloops=300, solver_name="z3")
     assert rr is not None
+
+from peak.mapper.multi import valid_multi_bindings
+from peak.mapper.utils import Unbound
+import itertools
+def test_valid_multi_bindings():
+    ir_paths = [("IR_in", "a"), ("IR_in", "b"), ("IR_in", "c")]
+    poss = [Unbound, *ir_paths]
+    all_bindings = []
+    for i, num_inputs in enumerate((2, 3, 2)):
+        arch_paths = [("Arch_in", i, f"r{k}") for k in range(num_inputs)]
+        all_bindings.append([list(zip(l, arch_paths)) for l in itertools.product(poss, repeat=num_inputs)])
+
+    def filt(x):
+        bind = [b[x[j]] for j, b in enumerate(all_bindings)]
+        used = [ipath for binding in bind for ipath, _ in binding]
+        return all(used.count(p) == 1 for p in ir_paths)
+    expected = list(filter(filt, itertools.product(*[range(len(b)) for b in all_bindings])))
+    assert len(expected) > 0
+    assert list(valid_multi_bindings(all_bindings, ir_paths)) == expected
@@ -0,0 +1,152 @@
+import operator
+import random
+
+import pytest
+np = pytest.importorskip("numpy")
+
+from hwtypes import Bit, BitVector, SIntVector
+from hwtypes.modifiers import strip_modifiers
+
+from peak.assembler import Assembler
+from peak.batch import BatchBit, BatchBitVector, BatchSIntVector, batch, unbatch
+from peak.family import BatchPyFamily, PyXFamily
+from examples.PE_lut import gen_PE
+from examples.PE_lut.isa import gen_isa
+from examples.sum_pe.sim import PE_fc as sum_PE_fc
+from examples.tagged_pe.sim import PE_fc as tagged_PE_fc
+
+NUM = 64
+
+def _values(width, rng):
+    corners = [0, 1, (1 << width) - 1, 1 << (width - 1), (1 << (width - 1)) - 1, width, width - 1]
+    values = [v & ((1 << width) - 1) for v in corners]
+    while len(values) < NUM:
+        values.append(rng.getrandbits(width))
+    return values[:NUM]
+
+def _check(T, batched, expected):
+    assert len(batched.value) == NUM
+    assert unbatch(T, batched) == expected
+
+
+BINARY = [
+    'bvand', 'bvor', 'bvxor', 'bvshl', 'bvlshr', 'bvashr', 'bvrol', 'bvror',
+    'bvadd', 'bvsub', 'bvmul', 'bvudiv', 'bvurem', 'bvsdiv', 'bvsrem', 'bvcomp',
+]
+COMPARE = ['bveq', 'bvne', 'bvult', 'bvule', 'bvugt', 'bvuge', 'bvslt', 'bvsle', 'bvsgt', 'bvsge']
+
+@pytest.mark.parametrize("width", [1, 5, 8, 64, 70])
+def test_ops(width):
+    rng = random.Random(width)
+    T = BitVector[width]
+    a = _values(width, rng)
+    b = _values(width, rng)
+    rng.shuffle(b)
+    ba = BatchBitVector[width](np.array(a, dtype=object))
+    bb = BatchBitVector[width](np.array(b, dtype=object))
+    for op in BINARY:
+        #hwtypes shifts by the full amount, any amount >= width is the same
+        clamp = width if op in ('bvshl', 'bvlshr', 'bvashr') else None
+        res = [getattr(T(x), op)(T(min(y, clamp) if clamp else y)) for x, y in zip(a, b)]
+        _check(type(res[0]), getattr(ba, op)(bb), res)
+    for op in COMPARE:
+        _check(Bit, getattr(ba, op)(bb), [getattr(T(x), op)(T(y)) for x, y in zip(a, b)])
+    for op in ('bvnot', 'bvneg'):
+        _check(T, getattr(ba, op)(), [getattr(T(x), op)() for x in a])
+    _check(BitVector[2 * width], ba.concat(bb), [T(x).concat(T(y)) for x, y in zip(a, b)])
+    _check(BitVector[width + 3], ba.sext(3), [T(x).sext(3) for x in a])
+    _check(BitVector[width + 3], ba.zext(3), [T(x).zext(3) for x in a])
+    _check(Bit, ba[-1], [T(x)[-1] for x in a])
+    if width > 2:
+        _check(BitVector[width - 2], ba[1:-1], [T(x)[1:-1] for x in a])
+    res, carry = ba.adc(bb, BatchBit(np.array([x & 1 for x in b], dtype=bool)))
+    expected = [T(x).adc(T(y), Bit(y & 1)) for x, y in zip(a, b)]
+    _check(T, res, [r for r, _ in expected])
+    _check(Bit, carry, [c for _, c in expected])
+    sel = ba[0]
+    _check(T, sel.ite(ba, bb), [T(x)[0].ite(T(x), T(y)) for x, y in zip(a, b)])
+
+
+def test_signed():
+    rng = random.Random(0)
+    a = _values(8, rng)
+    b = _values(8, rng)
+    rng.shuffle(b)
+    sa = BatchSIntVector[8](np.array(a))
+    sb = BatchSIntVector[8](np.array(b))
+    for op in (operator.rshift, operator.floordiv, operator.mod, operator.lt, operator.ge):
+        expected = [op(SIntVector[8](x), SIntVector[8](y)) for x, y in zip(a, b)]
+        T = Bit if isinstance(expected[0], Bit) else SIntVector[8]
+        _check(T, op(sa, sb), expected)
+
+
+def test_constants_broadcast():
+    x = BatchBitVector[8](np.arange(NUM))
+    y = x + 3
+    assert len((x ^ x).value) == NUM
+    assert unbatch(BitVector[8], BatchBitVector[8](5), 3) == [BitVector[8](5)] * 3
+    assert unbatch(BitVector[8], y) == [BitVector[8](v + 3) for v in range(NUM)]
+    with pytest.raises(TypeError):
+        bool(x == 1)
+    assert bool(BatchBitVector[8](1) == 1)
+    #Lists of bits are bits, lists of ints are lanes
+    bits = BatchBitVector[3]([BatchBit(1), BatchBit(0), BatchBit(1)])
+    assert unbatch(BitVector[3], bits) == [BitVector[3](5)]
+    assert unbatch(BitVector[3], BatchBitVector[3]([1, 0, 1])) == [BitVector[3](v) for v in (1, 0, 1)]
+
+
+def test_assembled_adt_fields():
+    isa = gen_isa(8).Py
+    rng = random.Random(0)
+    insts = [isa.Inst(isa.AluInst(rng.choice(list(isa.OP.enumerate())), BitVector[8](rng.getrandbits(8))), BitVector[8](rng.getrandbits(8))) for _ in range(NUM)]
+    value = batch(isa.Inst, insts)
+    family = BatchPyFamily()
+    assert isinstance(value, family.get_adt_t(isa.Inst))
+    _check(BitVector[8], value.lut, [inst.lut for inst in insts])
+    _check(BitVector[8], value.alu_inst.imm, [inst.alu_inst.imm for inst in insts])
+    _check(Bit, value.alu_inst.op == isa.OP.Add, [Bit(inst.alu_inst.op == isa.OP.Add) for inst in insts])
+    assert unbatch(isa.Inst, value) == insts
+    assembler = Assembler(isa.Inst)
+    _check(Bit, assembler.is_valid(value._value_), [Bit(1)] * NUM)
+
+
+def _random_inputs(input_t, rng, num):
+    inputs = {}
+    for k, T in strip_modifiers(input_t).field_dict.items():
+        T = strip_modifiers(T)
+        if issubclass(T, Bit):
+            inputs[k] = [Bit(rng.getrandbits(1)) for _ in range(num)]
+        elif issubclass(T, BitVector):
+            inputs[k] = [T(rng.getrandbits(T.size)) for _ in range(num)]
+        else:
+            assembler = Assembler(T)
+            values = []
+            while len(values) < num:
+                opcode = BitVector[assembler.width](rng.getrandbits(assembler.width))
+                if assembler.is_valid(opcode):
+                    values.append(assembler.disassemble(opcode))
+            inputs[k] = values
+    return inputs
+
+#Runs a batch through fc.BatchPy and each lane through the reference family
+@pytest.mark.parametrize("fc, ref", [(gen_PE(8), "Py"), (tagged_PE_fc, "Py"), (sum_PE_fc, "PyX")])
+def test_batch_pe(fc, ref):
+    rng = random.Random(0)
+    input_t = strip_modifiers(fc.Py.input_t)
+    output_t = strip_modifiers(fc.Py.output_t)
+    inputs = _random_inputs(input_t, rng, NUM)
+    outputs = fc.BatchPy()(**{k: batch(input_t.field_dict[k], v) for k, v in inputs.items()})
+
+    ref_cls = getattr(fc, ref)
+    ref_family = PyXFamily()
+    for i in range(NUM):
+        lane = {}
+        for k, v in inputs.items():
+            v = v[i]
+            if ref == "PyX" and not isinstance(v, (Bit, BitVector)):
+                v = ref_family.get_adt_t(type(v))(v)
+            lane[k] = v
+        ref_outputs = ref_cls()(**lane)
+        for (k, T), out, ref_out in zip(output_t.field_dict.items(), outputs, ref_outputs):
+            T = strip_modifiers(T)
+            assert unbatch(T, out, NUM)[i] == T(ref_out)
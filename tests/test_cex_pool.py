@@ -0,0 +1,73 @@
+import pysmt.shortcuts as smt
+from pysmt.typing import BVType, BOOL
+
+from peak.mapper import ArchMapper, MapperStats, CounterexamplePool
+from examples.smallir import gen_SmallIR
+from examples.tagged_pe.sim import PE_fc as tagged_PE_fc
+
+
+def _vars(prefix):
+    return (
+        smt.Symbol(f"{prefix}.a", BVType(8)),
+        smt.Symbol(f"{prefix}.b", BVType(8)),
+        smt.Symbol(f"{prefix}.c", BVType(16)),
+        smt.Symbol(f"{prefix}.d", BOOL),
+    )
+
+def _sigma(vs, *values):
+    return {v: smt.BV(x, v.get_type().width) if v.get_type().is_bv_type() else smt.Bool(x) for v, x in zip(vs, values)}
+
+
+def test_keyed_by_sort():
+    pool = CounterexamplePool()
+    a, b, c, d = _vars("IR0")
+    pool.record(_sigma((a, b, c, d), 0x80, 0xff, 7, True))
+    assert pool.ranked(("BV", 8)) == [(0x80, 0xff)]
+    assert pool.ranked(("BV", 16)) == [(7,)]
+    assert pool.ranked(("Bool",)) == [(True,)]
+
+    #The vars of another instruction get the values of their sort
+    x, y, z, _ = _vars("IR1")
+    w = smt.Symbol("IR1.w", BVType(4))
+    seeds = pool.seeds([x, y, z, w])
+    assert seeds == [_sigma((x, y, z, w), 0x80, 0xff, 7, 0)]
+    #Vars are filled positionally, repeating the entry if it is too short
+    seeds = pool.seeds([x])
+    assert seeds == [_sigma((x,), 0x80)]
+    assert pool.seeds([w]) == []
+    assert pool.num_seeded == 2
+
+
+def test_eviction_by_usefulness():
+    pool = CounterexamplePool(size=2, max_seeds=2)
+    a, = _vars("IR")[:1]
+    pool.record(_sigma((a,), 1))
+    pool.record(_sigma((a,), 1))
+    pool.record(_sigma((a,), 2))
+    pool.record(_sigma((a,), 3))
+    #2 is the least found entry when 3 is added
+    assert pool.ranked(("BV", 8)) == [(1,), (3,)]
+    assert pool.num_evicted == 1
+    assert [seed[a].constant_value() for seed in pool.seeds([a])] == [1, 3]
+
+    pool.clear()
+    assert len(pool) == 0
+    assert (pool.num_recorded, pool.num_seeded, pool.num_evicted) == (0, 0, 0)
+
+
+def test_pool_seeds_cegis():
+    ir = gen_SmallIR(8).instructions
+    am = ArchMapper(tagged_PE_fc, pool_size=CounterexamplePool.DEFAULT_SIZE)
+    assert am.counterexample_pool is not None
+    for name in ("Sub", "Add"):
+        stats = MapperStats()
+        irm = am.process_ir_instruction(ir[name], stats=stats)
+        rr = irm.solve('z3', external_loop=True)
+        assert rr is not None
+        assert rr.verify() is None
+    #The first run fills the pool which seeds the second
+    assert len(am.counterexample_pool) > 0
+    assert stats.to_dict()["counters"]["pool_seeds"] > 0
+
+    #Off by default
+    assert ArchMapper(tagged_PE_fc).counterexample_pool is None
@@ -0,0 +1,41 @@
+import pytest
+
+from peak.mapper import ArchMapper, MapperSession
+from examples.sum_pe.sim import PE_fc
+from examples.smallir import gen_SmallIR
+
+
+def _key(rr):
+    return repr(rr.serialize_bindings())
+
+
+@pytest.mark.parametrize("external_loop", [True, False])
+def test_enumerate_rules(external_loop):
+    ir = gen_SmallIR(8)
+    arch_mapper = ArchMapper(PE_fc)
+    ir_mapper = arch_mapper.process_ir_instruction(ir.instructions["Add"], simple_formula=True)
+    rules = list(ir_mapper.enumerate_rules(external_loop=external_loop))
+    #in0 + in1 and in1 + in0
+    assert len(rules) == 2
+    assert len(set(_key(rr) for rr in rules)) == 2
+    for rr in rules:
+        assert rr.verify() is None
+
+    assert len(list(ir_mapper.enumerate_rules(limit=1, external_loop=external_loop))) == 1
+
+    ir_mapper = arch_mapper.process_ir_instruction(ir.instructions["Mul"], simple_formula=True)
+    assert list(ir_mapper.enumerate_rules(external_loop=external_loop)) == []
+
+
+def test_enumerate_rules_session():
+    ir = gen_SmallIR(8)
+    arch_mapper = ArchMapper(PE_fc)
+    with MapperSession(arch_mapper) as session:
+        for name in ("And", "Nor"):
+            ir_mapper = arch_mapper.process_ir_instruction(ir.instructions[name], simple_formula=True)
+            rules = ir_mapper.enumerate_rules()
+            first = next(rules)
+            assert session.verify(first) is None
+            #Stopping early pops the session solver
+            rules.close()
+            assert len(list(ir_mapper.enumerate_rules())) == 2
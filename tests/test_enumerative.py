@@ -0,0 +1,57 @@
+import pytest
+
+from peak.assembler import Assembler
+
+from peak.mapper import ArchMapper, MapperStats, enumerative_solve
+from peak.mapper.enumerative import _encodings
+from examples.PE_lut import gen_PE
+from examples.smallir import gen_SmallIR
+from examples.sum_pe.sim import PE_fc as sum_PE_fc
+from examples.tagged_pe.sim import PE_fc as tagged_PE_fc
+from examples.tagged_pe.isa import ISA_fc
+
+
+def test_encodings():
+    isa = ISA_fc.Py
+    encodings = _encodings(isa.Inst)
+    #(Op, Bit) and (Op, Word)
+    assert len(encodings) == 2 * 2 + 2 * 256
+    assembler = Assembler(isa.Inst)
+    for value, opcode in encodings:
+        assert assembler.assemble(value) == opcode
+
+
+@pytest.mark.parametrize("arch_fc", [tagged_PE_fc, sum_PE_fc])
+def test_enumerative_rules(arch_fc):
+    am = ArchMapper(arch_fc)
+    for name, ir_fc in gen_SmallIR(8).instructions.items():
+        rr = am.process_ir_instruction(ir_fc).solve('z3', external_loop=True)
+        enum_rr = am.process_ir_instruction(ir_fc).solve_enumerative('z3', external_loop=True)
+        assert (rr is None) == (enum_rr is None), name
+        if enum_rr is not None:
+            assert enum_rr.verify() is None
+
+
+def test_enumerative_no_fallback():
+    stats = MapperStats()
+    am = ArchMapper(tagged_PE_fc)
+    irm = am.process_ir_instruction(gen_SmallIR(8).instructions["Add"], stats=stats)
+    rr = enumerative_solve(irm)
+    assert rr is not None
+    counters = stats.to_dict()["counters"]
+    assert "enumerative_fallbacks" not in counters
+    assert counters["enumerative_verifies"] >= 1
+
+
+#The PE_lut Const inputs (op, imm and lut) have 2^19 encodings
+@pytest.mark.parametrize("max_opcodes", [None, 16])
+def test_enumerative_fallback(max_opcodes):
+    stats = MapperStats()
+    arch_fc = gen_PE(8) if max_opcodes is None else tagged_PE_fc
+    am = ArchMapper(arch_fc)
+    irm = am.process_ir_instruction(gen_SmallIR(8).instructions["Add"], stats=stats)
+    kwargs = {} if max_opcodes is None else dict(max_opcodes=max_opcodes)
+    rr = irm.solve_enumerative('z3', external_loop=True, **kwargs)
+    assert rr is not None
+    assert rr.verify() is None
+    assert stats.to_dict()["counters"]["enumerative_fallbacks"] == 1
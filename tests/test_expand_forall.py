@@ -0,0 +1,75 @@
+import pytest
+import pysmt.shortcuts as smt
+from pysmt.typing import BVType
+from hwtypes import BitVector
+from hwtypes.adt import Enum
+
+from peak import Peak, family_closure, Const
+from peak.mapper import ArchMapper, MapperStats
+from peak.mapper.mapper import expand_forall, forall_width, _int_to_pysmt
+from examples.smallir import gen_SmallIR
+
+
+def test_int_to_pysmt():
+    assert _int_to_pysmt(-1, BVType(4)).constant_value() == 15
+    assert _int_to_pysmt(1, BVType(1)).constant_value() == 1
+
+
+def test_expand_forall():
+    x = smt.Symbol("expand_test.x", BVType(2))
+    b = smt.Symbol("expand_test.b")
+    e = smt.Symbol("expand_test.e", BVType(2))
+    phi = smt.Implies(b, smt.Equals(smt.BVAdd(x, e), x))
+    assert forall_width([x, b]) == 3
+    expanded = expand_forall([x, b], phi)
+    assert expanded.get_free_variables() == {e}
+    assert smt.is_valid(smt.Iff(expanded, smt.ForAll([x, b], phi)))
+
+
+class Op(Enum):
+    add = 1
+    and_ = 2
+    xnor = 3
+
+Word = BitVector[2]
+
+@family_closure
+def narrow_fc(family):
+    @family.assemble(locals(), globals())
+    class PE(Peak):
+        def __call__(self, op: Const(Op), a: Word, b: Word) -> Word:
+            if op == Op.add:
+                res = a + b
+            elif op == Op.and_:
+                res = a & b
+            else:
+                res = ~(a ^ b)
+            return res
+    return PE
+
+
+@pytest.mark.parametrize("name, found", [("Add", True), ("And", True), ("Or", False), ("Sub", False)])
+def test_expanded_solve(name, found):
+    ir = gen_SmallIR(2)
+    stats = MapperStats()
+    arch_mapper = ArchMapper(narrow_fc)
+    ir_mapper = arch_mapper.process_ir_instruction(ir.instructions[name], simple_formula=True, stats=stats)
+    assert forall_width(ir_mapper.forall_vars) == 8
+    #Too wide for the default
+    ir_mapper.solve('z3')
+    assert "expanded_solves" not in stats.counters
+    rr = ir_mapper.solve('z3', expand_width=8)
+    assert stats.counters["expanded_solves"] == 1
+    assert (rr is not None) == found
+    if found:
+        assert rr.verify() is None
+    assert (ir_mapper.solve('z3', external_loop=True) is not None) == found
+    assert len(ir_mapper.cegis_stats) > 0
+    #An explicit external_loop is not overridden by expand_width
+    ir_mapper.solve('z3', external_loop=True, expand_width=8)
+    assert stats.counters["expanded_solves"] == 1
+    assert len(ir_mapper.cegis_stats) > 0
+    #The expanded solve does not report the iterations of the previous solve
+    ir_mapper.solve('z3', expand_width=8)
+    assert stats.counters["expanded_solves"] == 2
+    assert ir_mapper.cegis_stats == []
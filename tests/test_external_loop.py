@@ -0,0 +1,50 @@
+import contextlib
+
+import pytest
+import pysmt.shortcuts as smt
+from pysmt.typing import BVType
+
+from peak.mapper import ArchMapper
+from peak.mapper.mapper import external_loop_solve, CEGISIteration
+
+from examples.smallir import gen_SmallIR
+from examples.tagged_pe.sim import PE_fc
+
+
+@pytest.mark.parametrize("num_counterexamples", [1, 3])
+def test_external_loop_solve(num_counterexamples):
+    a = smt.Symbol("cegis_test.a", BVType(8))
+    b = smt.Symbol("cegis_test.b", BVType(8))
+    c = smt.Symbol("cegis_test.c", BVType(8))
+    # exists a, c. forall b. (b & a) + c == b + 1
+    phi = smt.Equals(smt.BVAdd(smt.BVAnd(b, a), c), smt.BVAdd(b, smt.BV(1, 8)))
+    stats = []
+    def model(solver, _):
+        return solver.get_value(a).bv_unsigned_value(), solver.get_value(c).bv_unsigned_value()
+    res = external_loop_solve(
+        [b], phi, maxloops=20, solver_name="z3", rr_from_solver=model,
+        num_counterexamples=num_counterexamples, stats=stats,
+    )
+    assert res == (0xff, 1)
+    assert all(isinstance(s, CEGISIteration) for s in stats)
+    assert all(s.num_counterexamples <= num_counterexamples for s in stats)
+    assert stats[-1].num_counterexamples == 0
+
+
+@pytest.mark.parametrize("use_session", [False, True])
+@pytest.mark.parametrize("num_counterexamples", [1, 4])
+def test_num_counterexamples(use_session, num_counterexamples):
+    IR = gen_SmallIR(8)
+    arch_mapper = ArchMapper(PE_fc)
+    session = arch_mapper.session('z3') if use_session else contextlib.nullcontext()
+    with session:
+        for name in ("Add", "Nand", "Mul"):
+            ir_mapper = arch_mapper.process_ir_instruction(IR.instructions[name], simple_formula=True)
+            rr = ir_mapper.solve('z3', external_loop=True, num_counterexamples=num_counterexamples)
+            assert (rr is not None) == (name != "Mul")
+            if rr is not None:
+                assert rr.verify() is None
+            stats = ir_mapper.cegis_stats
+            assert len(stats) > 0
+            assert all(0 <= s.num_counterexamples <= num_counterexamples for s in stats)
+            assert stats[-1].num_counterexamples == 0
@@ -0,0 +1,56 @@
+import operator
+
+import pysmt.shortcuts as smt
+from hwtypes import SMTBit, SMTBitVector
+
+from peak.mapper.formula_constructor import And, Or, Implies, balanced_reduce
+
+
+def _equiv(x, y):
+    return smt.is_valid(smt.Iff(x.value, y.value))
+
+
+def test_hash_consing():
+    a, b, c = (SMTBit(prefix=n) for n in "abc")
+    assert And([a, b]) is And([a, b])
+    assert Or([a, And([b, c])]) is Or([a, And([b, c])])
+    assert Implies(a, b) is Implies(a, b)
+    assert And([a, b]) is not Or([a, b])
+    assert And([a, b]) is not And([b, a])
+
+
+def test_simplification():
+    a, b, c = (SMTBit(prefix=n) for n in "abc")
+    #Flattening and duplicates
+    f = And([a, And([b, And([a, c])]), b])
+    assert f.values == [a, b, c]
+    assert f is And([a, b, c])
+    assert Or([Or([a]), Or([b])]).values == [a, b]
+    #Constants
+    assert And([a, SMTBit(True)]).values == [a]
+    assert And([a, SMTBit(False), Or([b])]).to_hwtypes().value.is_false()
+    assert Or([a, SMTBit(True)]).to_hwtypes().value.is_true()
+    assert Or([SMTBit(False)]).to_hwtypes().value.is_false()
+    assert Or([a, And([SMTBit(False), b])]).values == [a]
+
+
+def test_lowering():
+    v = SMTBitVector[8](prefix="v")
+    terms = [v == i for i in range(200)]
+    f = Or([And([t, v[0]]) for t in terms])
+    hw = f.to_hwtypes()
+    assert hw is f.to_hwtypes()
+    assert hw.value.is_or()
+    assert len(hw.value.args()) == len(terms)
+    assert _equiv(hw, balanced_reduce(operator.or_, (t & v[0] for t in terms)))
+    #Deep nesting is flattened
+    g = terms[0]
+    for t in terms[1:]:
+        g = And([g, t])
+    assert len(g.values) == len(terms)
+    assert len(g.to_hwtypes().value.args()) == len(terms)
+
+
+def test_balanced_reduce():
+    assert balanced_reduce(operator.add, range(10)) == 45
+    assert balanced_reduce(lambda x, y: f"({x}{y})", "abcde") == "(((ab)(cd))e)"
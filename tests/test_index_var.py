@@ -0,0 +1,45 @@
+import pytest
+import pysmt.shortcuts as smt
+
+from peak.mapper import ArchMapper
+from peak.mapper.index_var import OneHot, Binary, Gray, HybridOneHot, Auto, get_index_var
+from peak.mapper.formula_constructor import Or
+from examples.sum_pe.sim import PE_fc
+from examples.smallir import gen_SmallIR
+
+ENCODINGS = (OneHot, Binary, Gray, HybridOneHot)
+
+@pytest.mark.parametrize("IVar", ENCODINGS)
+@pytest.mark.parametrize("num_entries", [1, 2, 3, 5, 8, 10, 17])
+def test_encoding(IVar, num_entries):
+    ivar = IVar(num_entries, name="x")
+    codes = [IVar.translate_index(num_entries, i) for i in range(num_entries)]
+    assert len(set(codes)) == num_entries
+    assert all(code < 2**IVar.var_len(num_entries) for code in codes)
+    for i, code in enumerate(codes):
+        assert ivar.decode(code) == i
+    #is_valid holds exactly on the codes of the entries
+    any_match = Or([ivar.match_index(i) for i in range(num_entries)]).to_hwtypes()
+    assert smt.is_valid(smt.Iff(ivar.is_valid().value, any_match.value))
+
+
+def test_auto():
+    assert isinstance(Auto(4, name="x"), OneHot)
+    assert isinstance(Auto(100, name="x"), HybridOneHot)
+    assert isinstance(Auto(1000, name="x"), Binary)
+    assert get_index_var("auto") is Auto
+    assert get_index_var("gray") is Gray
+    assert get_index_var(Binary) is Binary
+    with pytest.raises(ValueError):
+        get_index_var("unary")
+
+
+@pytest.mark.parametrize("IVar", ["binary", "gray", "hybrid", "auto"])
+def test_mapping(IVar):
+    ir = gen_SmallIR(8)
+    arch_mapper = ArchMapper(PE_fc, IVar=IVar)
+    for name in ("Add", "And", "Nor"):
+        ir_mapper = arch_mapper.process_ir_instruction(ir.instructions[name], simple_formula=True)
+        rr = ir_mapper.solve('z3', external_loop=True)
+        assert rr is not None
+        assert rr.verify() is None
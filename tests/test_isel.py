@@ -0,0 +1,228 @@
+import random
+
+import pytest
+
+from peak import family_closure, Peak, Const
+from peak.ir import IR
+from hwtypes.adt import Enum, Product
+from hwtypes import BitVector
+from hwtypes.modifiers import strip_modifiers
+
+from peak.mapper import ArchMapper, DataflowGraph, RuleLibrary, RuleDatabase, select_instructions
+from examples.smallir import gen_SmallIR
+from examples.tagged_pe.sim import PE_fc as tagged_PE_fc
+
+Word = BitVector[8]
+
+class Op(Enum):
+    add = 1
+    sub = 2
+    mul = 3
+    muladd = 4
+
+@family_closure
+def arch_fc(family):
+    @family.assemble(locals(), globals())
+    class Arch(Peak):
+        def __call__(self, op: Const(Op), a: Word, b: Word, c: Word) -> Word:
+            if op == Op.add:
+                return a + b
+            elif op == Op.sub:
+                return a - b
+            elif op == Op.mul:
+                return a * b
+            else:
+                return a * b + c
+    return Arch
+
+class TernaryInput(Product):
+    in0 = Word
+    in1 = Word
+    in2 = Word
+
+class Output(Product):
+    out = Word
+
+MULADD = ("Add", ("Mul", 0, 1), 2)
+
+
+@pytest.fixture(scope="module")
+def rules():
+    ir = gen_SmallIR(8)
+    ir.add_peak_instruction("MulAdd", TernaryInput, Output, lambda f, x, y, z: x*y + z)
+    am = ArchMapper(arch_fc)
+    found = {}
+    for name in ("Add", "Sub", "Mul", "MulAdd"):
+        rr = am.process_ir_instruction(ir.instructions[name]).solve('z3', external_loop=True)
+        assert rr is not None
+        found[name] = rr
+    return ir, found
+
+
+def _library(rules, fused=True):
+    _, found = rules
+    library = RuleLibrary.from_rules({name: rr for name, rr in found.items() if name != "MulAdd"})
+    if fused:
+        library.add("MulAdd", found["MulAdd"], MULADD)
+        library.add("MulAdd", found["MulAdd"], ("Add", 2, ("Mul", 0, 1)))
+    return library
+
+
+def _random_graph(num_nodes, num_inputs=4, seed=0):
+    rng = random.Random(seed)
+    graph = DataflowGraph()
+    for _ in range(num_inputs):
+        graph.add_input()
+    for _ in range(num_nodes):
+        n = len(graph)
+        #Mostly recent operands to get deep trees
+        operands = [rng.randrange(max(0, n - 8), n) for _ in range(2)]
+        graph.add(rng.choice(("Add", "Sub", "Mul")), *operands)
+    graph.mark_output(len(graph) - 1)
+    return graph
+
+
+def _simulate_ir(graph, ir, inputs):
+    values = []
+    for node, op in enumerate(graph.ops):
+        if op is None:
+            values.append(inputs[graph.input_names[node]])
+        else:
+            values.append(ir.instructions[op].Py()(*(values[o] for o in graph.operands[node])))
+    return values
+
+
+def _simulate_arch(graph, selection, arch_fc, inputs):
+    arch = arch_fc.Py()
+    values = {node: inputs[name] for node, name in graph.input_names.items()}
+    for tile in selection.tiles:
+        instruction = tile.instruction()
+        kwargs = {}
+        for field, T in arch_fc.Py.input_t.field_dict.items():
+            kwargs[field] = instruction[field][1] if field in instruction else strip_modifiers(T)(0)
+        for (field,), node in tile.inputs().items():
+            kwargs[field] = values[node]
+        out = arch(**kwargs)
+        if isinstance(out, tuple):
+            out = out[list(arch_fc.Py.output_t.field_dict).index(tile.tile_rule.output[0])]
+        values[tile.root] = out
+    return values
+
+
+def test_fused_tile(rules):
+    graph = DataflowGraph()
+    a, b, c = (graph.add_input(name) for name in "abc")
+    m = graph.add("Mul", a, b)
+    out = graph.add("Add", c, m)
+    graph.mark_output(out)
+
+    selection = select_instructions(graph, _library(rules))
+    [tile] = selection.tiles
+    assert tile.name == "MulAdd"
+    assert tile.root == out
+    assert set(tile.nodes) == {m, out}
+    assert selection.node_tile == [-1, -1, -1, 0, 0]
+    assert selection.cost == 1
+    [(opcode, value)] = tile.instruction().values()
+    assert value == Op.muladd
+    assert set(tile.inputs().values()) == {a, b, c}
+
+    #A shared Mul is computed once
+    graph.mark_output(m)
+    selection = select_instructions(graph, _library(rules))
+    assert [tile.name for tile in selection.tiles] == ["Mul", "Add"]
+    assert selection.cost == 2
+
+
+def test_uncovered(rules):
+    graph = DataflowGraph()
+    a = graph.add_input()
+    graph.mark_output(graph.add("Not", a))
+    with pytest.raises(ValueError):
+        select_instructions(graph, _library(rules))
+    with pytest.raises(ValueError):
+        graph.add("Add", a, 7)
+
+
+@pytest.mark.parametrize("fused", [True, False])
+@pytest.mark.parametrize("seed", range(3))
+def test_random_graph(rules, fused, seed):
+    ir, _ = rules
+    graph = _random_graph(200, seed=seed)
+    selection = select_instructions(graph, _library(rules, fused))
+    covered = [node for node, op in enumerate(graph.ops) if op is not None]
+    assert all(selection.node_tile[node] >= 0 for node in covered)
+    assert sum(len(tile.nodes) for tile in selection.tiles) == len(covered)
+    if not fused:
+        assert len(selection.tiles) == len(covered)
+
+    rng = random.Random(seed)
+    for _ in range(4):
+        inputs = {name: Word(rng.randrange(256)) for name in graph.input_names.values()}
+        expected = _simulate_ir(graph, ir, inputs)
+        values = _simulate_arch(graph, selection, arch_fc, inputs)
+        for tile in selection.tiles:
+            assert values[tile.root] == expected[tile.root]
+
+
+def test_fused_cost(rules):
+    graph = _random_graph(1000)
+    fused = select_instructions(graph, _library(rules))
+    unfused = select_instructions(graph, _library(rules, fused=False))
+    assert any(tile.name == "MulAdd" for tile in fused.tiles)
+    assert fused.cost < unfused.cost == len(unfused.tiles)
+
+
+def test_large_graph(rules):
+    graph = _random_graph(100000)
+    selection = select_instructions(graph, _library(rules))
+    assert sum(len(tile.nodes) for tile in selection.tiles) == 100000
+    #Tiles come in topological order
+    roots = [tile.root for tile in selection.tiles]
+    assert roots == sorted(roots)
+
+
+@family_closure
+def imm_arch_fc(family):
+    @family.assemble(locals(), globals())
+    class Arch(Peak):
+        def __call__(self, imm: Const(Word), a: Word) -> Word:
+            return a + imm
+    return Arch
+
+@family_closure
+def add_imm_fc(family):
+    @family.assemble(locals(), globals())
+    class AddImm(Peak):
+        def __call__(self, a: Word, imm: Const(Word)) -> Word:
+            return a + imm
+    return AddImm
+
+
+#The opcode would depend on the IR immediate, which a graph can not carry
+def test_ir_const_input():
+    rr = ArchMapper(imm_arch_fc).process_ir_instruction(add_imm_fc).solve('z3', external_loop=True)
+    assert rr is not None
+    assert (("imm",), ("imm",)) in rr.ibinding
+    with pytest.raises(ValueError):
+        RuleLibrary.from_rules({"AddImm": rr})
+
+
+def test_from_database(tmp_path):
+    ir = gen_SmallIR(8)
+    am = ArchMapper(tagged_PE_fc)
+    with RuleDatabase(tmp_path / "db") as db:
+        for name in ("Add", "Sub"):
+            rr = am.process_ir_instruction(ir.instructions[name]).solve('z3', external_loop=True)
+            db.append(name, rr)
+        library = RuleLibrary.from_database(db, ir, tagged_PE_fc)
+    assert len(library) == 2
+
+    graph = DataflowGraph()
+    a, b = graph.add_input("a"), graph.add_input("b")
+    graph.mark_output(graph.add("Sub", graph.add("Add", a, b), b))
+    selection = select_instructions(graph, library)
+    assert [tile.name for tile in selection.tiles] == ["Add", "Sub"]
+    inputs = dict(a=Word(7), b=Word(3))
+    values = _simulate_arch(graph, selection, tagged_PE_fc, inputs)
+    assert values[len(graph) - 1] == Word(7)
@@ -0,0 +1,55 @@
+import pytest
+
+from peak.mapper import ArchMapper, map_ir
+
+from examples.smallir import gen_SmallIR
+from examples.sum_pe.sim import PE_fc as PE_fc_s
+from examples.tagged_pe.sim import PE_fc as PE_fc_t
+
+
+@pytest.mark.parametrize('arch_fc', [PE_fc_s, PE_fc_t])
+@pytest.mark.parametrize('workers', [1, 3])
+def test_map_ir(arch_fc, workers):
+    IR = gen_SmallIR(8)
+    expect_found = ('Add', 'Sub', 'And', 'Nand', 'Or', 'Nor')
+    rules, times, timed_out, unknown = map_ir(arch_fc, IR, workers=workers)
+    assert list(rules) == list(IR.instructions)
+    assert set(times) == set(IR.instructions)
+    assert len(timed_out) == 0
+    assert len(unknown) == 0
+    for ir_name, rr in rules.items():
+        assert (rr is not None) == (ir_name in expect_found)
+        if rr is not None:
+            assert rr.ir_fc is IR.instructions[ir_name]
+            assert rr.verify() is None
+
+
+def test_map_ir_matches_serial():
+    IR = gen_SmallIR(8)
+    arch_mapper = ArchMapper(PE_fc_t)
+    rules = map_ir(PE_fc_t, IR, workers=2).rules
+    for ir_name, ir_fc in IR.instructions.items():
+        ir_mapper = arch_mapper.process_ir_instruction(ir_fc)
+        rr = ir_mapper.solve('z3', external_loop=True)
+        assert (rr is None) == (rules[ir_name] is None)
+
+
+def test_map_ir_timeout():
+    IR = gen_SmallIR(8)
+    rules, times, timed_out, _ = map_ir(PE_fc_s, IR, workers=2, timeout=0)
+    assert timed_out == set(IR.instructions)
+    assert all(rr is None for rr in rules.values())
+
+
+#Instructions which hit the iteration limit do not stop the others
+def test_map_ir_unknown():
+    IR = gen_SmallIR(8)
+    rules, times, timed_out, unknown = map_ir(PE_fc_s, IR, workers=1, itr_limit=3)
+    assert list(rules) == list(IR.instructions)
+    assert len(timed_out) == 0
+    assert len(unknown) > 0
+    assert all(rules[name] is None for name in unknown)
+    found = [rr for rr in rules.values() if rr is not None]
+    assert len(found) > 0
+    for rr in found:
+        assert rr.verify() is None
@@ -0,0 +1,109 @@
+import pytest
+
+from hwtypes import Bit, BitVector
+from hwtypes.adt import Enum, Product
+
+from peak import Const, family_closure, Peak, name_outputs
+from peak import family
+from peak.assembler.assembler import Assembler
+from peak.assembler.assembled_adt import AssembledADT
+from peak.mapper import ArchMapper, RewriteRule
+from peak.mapper.stats import formula_dag_size
+
+from examples.smallir import gen_SmallIR
+from examples.sum_pe.sim import PE_fc as PE_fc_s
+from examples.tagged_pe.sim import PE_fc as PE_fc_t
+
+
+@pytest.mark.parametrize('simple_formula', [True, False])
+@pytest.mark.parametrize('external_loop', [True, False])
+@pytest.mark.parametrize('arch_fc', [PE_fc_s, PE_fc_t])
+def test_session(simple_formula, external_loop, arch_fc):
+    IR = gen_SmallIR(8)
+    arch_mapper = ArchMapper(arch_fc)
+    expect_found = ('Add', 'Sub', 'And', 'Nand', 'Or', 'Nor')
+    with arch_mapper.session('z3') as session:
+        assert arch_mapper.active_session is session
+        for ir_name, ir_fc in IR.instructions.items():
+            ir_mapper = arch_mapper.process_ir_instruction(ir_fc, simple_formula)
+            rewrite_rule = ir_mapper.solve('z3', external_loop=external_loop)
+            assert (rewrite_rule is not None) == (ir_name in expect_found)
+            if rewrite_rule is not None:
+                assert rewrite_rule.verify(session=session) is None
+    assert arch_mapper.active_session is None
+
+
+def test_session_verify():
+    @family_closure
+    def ir_fc(family):
+        Data = family.BitVector[16]
+        @family.assemble(locals(), globals())
+        class IR(Peak):
+            @name_outputs(out=Data)
+            def __call__(self, in0: Data, in1: Data):
+                return in0 + in1
+        return IR
+
+    @family_closure
+    def PE_fc(family):
+        Data = family.BitVector[16]
+        class Inst(Product):
+            class Op(Enum):
+                add = 1
+                sub = 2
+            sel=family.Bit
+        @family.assemble(locals(), globals())
+        class Arch(Peak):
+            def __call__(self, inst : Const(Inst), a: Data, b: Data) -> (Data, Data):
+                if inst.Op == Inst.Op.add:
+                    ret = a + b
+                else: #inst == Inst.sub
+                    ret = a - b
+                if inst.sel:
+                    return ret, ret
+                else:
+                    return ~ret, ~ret
+        return Arch, Inst
+
+    Inst_bv = PE_fc(family.PyFamily())[1]
+    Inst_adt = AssembledADT[Inst_bv, Assembler, BitVector]
+    arch_fc = family_closure(lambda f: PE_fc(f)[0])
+    output_binding = [(("out",), (0,))]
+    arch_mapper = ArchMapper(arch_fc)
+    with arch_mapper.session() as session:
+        input_binding = [
+            (("in0",), ("a",)),
+            (("in1",), ("b",)),
+            (Inst_adt.Op(Inst_bv.Op.add)._value_, ("inst", "Op",)),
+            (Bit(1), ("inst", "sel",)),
+        ]
+        rr = RewriteRule(input_binding, output_binding, ir_fc, arch_fc)
+        assert session.verify(rr) is None
+
+        input_binding = [
+            (("in0",), ("a",)),
+            (("in1",), ("b",)),
+            (Inst_adt.Op(Inst_bv.Op.sub)._value_, ("inst", "Op",)),
+            (Bit(1), ("inst", "sel",)),
+        ]
+        rr = RewriteRule(input_binding, output_binding, ir_fc, arch_fc)
+        counter_example = session.verify(rr)
+        assert counter_example is not None
+        ir_vals, arch_vals = counter_example
+        ir_inputs, arch_inputs = rr.build_inputs(ir_vals, arch_vals, family.PyFamily())
+        assert ir_fc.Py()(**ir_inputs) != PE_fc.Py[0]()(**arch_inputs)[0]
+
+
+@pytest.mark.parametrize('simple_formula', [True, False])
+@pytest.mark.parametrize('arch_fc', [PE_fc_s, PE_fc_t])
+def test_session_definitions(simple_formula, arch_fc):
+    arch_mapper = ArchMapper(arch_fc)
+    with arch_mapper.session('z3') as session:
+        ir_mapper = arch_mapper.process_ir_instruction(gen_SmallIR(8).instructions['Add'], simple_formula)
+        phi = ir_mapper.formula_wo_forall
+        phid = ir_mapper.formula_with_definitions(session)
+        assert phid is not phi
+        assert any(v.symbol_name().startswith('ArchOut') for v in phid.get_free_variables())
+        #The arch semantics are only in the definitions
+        assert formula_dag_size(phid) < formula_dag_size(phi)
+        assert ir_mapper.solve('z3', external_loop=True) is not None
@@ -0,0 +1,64 @@
+import json
+import tracemalloc
+
+import pytest
+
+import peak.mapper.stats
+
+from peak.mapper import ArchMapper, MapperStats, RuleCache
+from examples.sum_pe.sim import PE_fc
+from examples.smallir import gen_SmallIR
+
+
+def test_stats():
+    stats = MapperStats()
+    ir = gen_SmallIR(8)
+    arch_mapper = ArchMapper(PE_fc, stats=stats)
+    ir_mapper = arch_mapper.process_ir_instruction(ir.instructions["Add"], simple_formula=True, stats=stats)
+    rr = ir_mapper.solve('z3', external_loop=True)
+    assert rr is not None
+    assert rr.verify(stats=stats) is None
+
+    for name in ("peak_class", "forms", "symbolic_execution", "bindings", "formula", "solve", "synthesis", "verification", "verify"):
+        assert stats.phases[name].calls > 0
+        assert stats.phases[name].time > 0
+        assert stats.phases[name].peak_memory is None
+    counters = stats.counters
+    assert counters["num_input_forms"] == len(arch_mapper.input_forms)
+    assert counters["num_input_bindings"] > 0
+    assert counters["formula_dag_size"] > 0
+    assert counters["solver_iterations"] == len(ir_mapper.cegis_stats)
+
+    d = json.loads(stats.to_json())
+    assert set(d) == {"phases", "counters", "peak_rss"}
+    assert d["counters"] == counters
+
+
+def test_stats_cache_and_memory(tmp_path):
+    stats = MapperStats(trace_memory=True)
+    ir = gen_SmallIR(8)
+    arch_mapper = ArchMapper(PE_fc)
+    cache = RuleCache(tmp_path)
+    for _ in range(2):
+        ir_mapper = arch_mapper.process_ir_instruction(ir.instructions["And"], simple_formula=True, stats=stats)
+        assert ir_mapper.solve('z3', external_loop=True, cache=cache) is not None
+    assert stats.counters["cache_misses"] == 1
+    assert stats.counters["cache_hits"] == 1
+    assert stats.phases["solve"].calls == 1
+    assert stats.phases["bindings"].peak_memory > 0
+
+
+@pytest.mark.parametrize("can_reset_peak", [True, False])
+def test_stats_nested_memory(monkeypatch, can_reset_peak):
+    monkeypatch.setattr(peak.mapper.stats, "_can_reset_peak", can_reset_peak and hasattr(tracemalloc, "reset_peak"))
+    stats = MapperStats(trace_memory=True)
+    with stats.phase("outer"):
+        data = bytearray(10**7)
+        del data
+        with stats.phase("inner"):
+            data = bytearray(10**5)
+            del data
+    #The inner phase does not hide the peak of the outer phase
+    assert stats.phases["outer"].peak_memory >= 10**7
+    assert stats.phases["inner"].peak_memory < 10**7
+    assert not tracemalloc.is_tracing()
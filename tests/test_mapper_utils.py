@@ -1,4 +1,9 @@
-from peak.mapper.utils import _TAG, Match, SMTForms
+import itertools as it
+import types
+
+import pytest
+
+from peak.mapper.utils import _TAG, Match, SMTForms, Unbound, create_bindings
 from peak.assembler.assembler import Assembler
 from peak.assembler.assembled_adt import  AssembledADT
 from hwtypes import SMTBitVector as SBV, SMTBit as SBit
@@ -56,3 +61,85 @@ def test_SMTForms():
                 assert match_path in varmap
                 assert field in varmap[match_path]
 
+
+
+def _product_bindings(arch_flat, ir_flat):
+    #Reference implementation: filtered product over every arch path
+    by_t = {}
+    for path, T in arch_flat.items():
+        by_t.setdefault(T, []).append(path)
+    per_t = []
+    for T, arch_paths in by_t.items():
+        ir_paths = [p for p, t in ir_flat.items() if t == T]
+        per_t.append([
+            list(zip(m, arch_paths))
+            for m in it.product(*[ir_paths + [Unbound]]*len(arch_paths))
+            if all(m.count(p) == 1 for p in ir_paths)
+        ])
+    return [list(it.chain(*l)) for l in it.product(*per_t)]
+
+
+@pytest.mark.parametrize("num_arch, num_ir", [(1, 1), (3, 2), (4, 2), (5, 3), (2, 3)])
+def test_create_bindings(num_arch, num_ir):
+    arch_flat = {**{(f"d{i}",): SBV[8] for i in range(num_arch)}, ("b0",): SBit, ("b1",): SBit}
+    ir_flat = {**{(f"x{i}",): SBV[8] for i in range(num_ir)}, ("y",): SBit}
+    bindings = create_bindings(arch_flat, ir_flat)
+    assert isinstance(bindings, types.GeneratorType)
+    assert list(bindings) == _product_bindings(arch_flat, ir_flat)
+
+
+def test_create_bindings_interchangeable():
+    arch_flat = {(f"d{i}",): SBV[8] for i in range(4)}
+    ir_flat = {("x",): SBV[8], ("y",): SBV[8]}
+    group = tuple((f"d{i}",) for i in range(3))
+    full = _product_bindings(arch_flat, ir_flat)
+    reduced = list(create_bindings(arch_flat, ir_flat, [group]))
+    assert len(full) == 12
+    assert len(reduced) == 3
+
+    #Every binding is equivalent to exactly one reduced binding
+    def canonical(binding):
+        grouped = sorted((ir for ir, arch in binding if arch in group), key=repr)
+        rest = [(ir, arch) for ir, arch in binding if arch not in group]
+        return grouped, rest
+    assert sorted(map(repr, map(canonical, reduced))) == sorted(set(map(repr, map(canonical, full))))
+
+
+def test_SMTForms_factored():
+    class A(Product):
+        a=SBV[8]
+        b=SBit
+    S = Sum[A, SBV[8], SBit]
+    T = Tuple[S, S, S, S, S, S, A]
+    AT = AssembledADT[T, Assembler, SBV]
+    forms, varmap, _ = SMTForms()(AT)
+    assert len(forms) == 3**6
+
+    #Forms are in the same order as the product of the sum choices
+    choices = list(it.product(*[list(S.fields)]*6))
+    for idx in (0, 1, 17, 3**6 - 1, -1):
+        form = forms[idx]
+        assert form.path_dict == {(i,): choice for i, choice in enumerate(choices[idx])}
+        #varmap contains exactly the leaves of the form
+        for path, value in form.varmap.items():
+            assert varmap[path] is value
+        assert (6, 'a') in form.varmap
+        assert len(form.varmap) == 2 + sum(2 if c is A else 1 for c in choices[idx])
+
+    #Leaf varmaps are shared between forms
+    assert any(m0 is m1 for m0 in forms[0].varmap.maps for m1 in forms[1].varmap.maps)
+
+    with pytest.raises(IndexError):
+        forms[3**6]
+
+
+def test_forms_evaluated_lazily():
+    from peak.mapper import ArchMapper
+    from examples.sum_pe.sim import PE_fc
+    from examples.smallir import gen_SmallIR
+    arch_mapper = ArchMapper(PE_fc)
+    assert arch_mapper.num_output_forms == 1
+    #The peak object is not run to build the ArchMapper
+    assert not any(arch_mapper.evaluated_forms.is_computed(fi) for fi in range(arch_mapper.num_input_forms))
+    arch_mapper.process_ir_instruction(gen_SmallIR(8).instructions['Add'])
+    assert all(arch_mapper.evaluated_forms.is_computed(fi) for fi in range(arch_mapper.num_input_forms))
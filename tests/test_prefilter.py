@@ -0,0 +1,65 @@
+import pytest
+
+from hwtypes import BitVector
+from hwtypes.adt import Product
+
+from peak.ir import IR
+from peak.mapper import ArchMapper, MapperStats
+from peak.mapper.prefilter import prefilter_bindings
+from examples.PE_lut import gen_PE
+from examples.smallir import gen_SmallIR
+from examples.sum_pe.sim import PE_fc as sum_PE_fc
+
+
+def gen_ConstIR(width):
+    ir = IR()
+
+    class Input(Product):
+        in0 = BitVector[width]
+
+    class Output(Product):
+        out = BitVector[width]
+
+    ir.add_peak_instruction("AddC", Input, Output, lambda f, x: x + 13)
+    ir.add_peak_instruction("Msb", Input, Output, lambda f, x: (x ^ x) + (width - 1))
+    return ir
+
+
+@pytest.mark.parametrize("arch_fc", [gen_PE(8), sum_PE_fc])
+@pytest.mark.parametrize("simple_formula", [True, False])
+def test_prefilter_rules(arch_fc, simple_formula):
+    am = ArchMapper(arch_fc)
+    for name, ir_fc in gen_SmallIR(8).instructions.items():
+        rr = am.process_ir_instruction(ir_fc, simple_formula).solve('z3', external_loop=True)
+        stats = MapperStats()
+        irm = am.process_ir_instruction(ir_fc, simple_formula, stats=stats, prefilter=8)
+        pf_rr = irm.solve('z3', external_loop=True)
+        assert (rr is None) == (pf_rr is None), name
+        if pf_rr is not None:
+            assert pf_rr.verify() is None
+        counters = stats.to_dict()["counters"]
+        if "prefilter_candidates" in counters:
+            assert counters["prefilter_survivors"] <= counters["prefilter_candidates"]
+
+
+#Wide consts are not enumerated so rejections go through the solver
+@pytest.mark.parametrize("name", ["AddC", "Msb"])
+def test_prefilter_wide_consts(name):
+    am = ArchMapper(gen_PE(8))
+    ir_fc = gen_ConstIR(8).instructions[name]
+    rr = am.process_ir_instruction(ir_fc).solve('z3', external_loop=True)
+    pf_rr = am.process_ir_instruction(ir_fc, prefilter=4).solve('z3', external_loop=True)
+    assert (rr is None) == (pf_rr is None)
+    if pf_rr is not None:
+        assert pf_rr.verify() is None
+
+
+def test_prefilter_survivors():
+    am = ArchMapper(sum_PE_fc)
+    irm = am.process_ir_instruction(gen_SmallIR(8).instructions["Add"])
+    survivors = prefilter_bindings(irm, irm.input_bindings, irm.output_bindings)
+    num_candidates = sum(len(bs) for bs in irm.input_bindings) * len(irm.output_bindings)
+    assert 0 < len(survivors) < num_candidates
+    for fi, bi, bo in survivors:
+        assert bi < len(irm.input_bindings[fi])
+        assert bo < len(irm.output_bindings)
@@ -0,0 +1,73 @@
+from hwtypes import BitVector
+from hwtypes.adt import Product
+
+from peak.ir import IR
+from peak.mapper import MapperStats, map_reduced_width, lift_rule
+from peak.mapper import ArchMapper
+from examples.PE_lut import gen_PE
+from examples.smallir import gen_SmallIR
+
+
+def gen_ConstIR(width):
+    ir = IR()
+
+    class Input(Product):
+        in0 = BitVector[width]
+
+    class Output(Product):
+        out = BitVector[width]
+
+    ir.add_peak_instruction("Neg1", Input, Output, lambda f, x: (x ^ x) - 1)
+    ir.add_peak_instruction("Msb", Input, Output, lambda f, x: (x ^ x) + (width - 1))
+    return ir
+
+
+def _map(gen_ir, name, width, **kwargs):
+    stats = MapperStats()
+    rr = map_reduced_width(gen_PE, lambda w: gen_ir(w).instructions[name], width, stats=stats, **kwargs)
+    return rr, stats.to_dict()["counters"]
+
+
+def test_lift_add():
+    rr, counters = _map(gen_SmallIR, "Add", 16)
+    assert rr is not None
+    assert rr.verify() is None
+    assert counters["lifted_rules"] == 1
+    assert "full_width_solves" not in counters
+
+
+def test_lift_sign_extended_const():
+    rr, counters = _map(gen_ConstIR, "Neg1", 8)
+    assert rr is not None
+    assert rr.verify() is None
+    assert counters["lifted_rules"] == 1
+    assert "full_width_solves" not in counters
+    consts = [v for v, _ in rr.ibinding if isinstance(v, BitVector) and len(v) == 8]
+    assert BitVector[8](-1) in consts
+
+
+def test_full_width_fallback():
+    #The constant 3 found at 4 bits does not carry over to 8 bits
+    rr, counters = _map(gen_ConstIR, "Msb", 8)
+    assert rr is not None
+    assert rr.verify() is None
+    assert counters["lifted_candidates"] >= 1
+    assert "lifted_rules" not in counters
+    assert counters["full_width_solves"] == 1
+
+
+def test_no_rule():
+    rr, counters = _map(gen_SmallIR, "Sub", 8)
+    assert rr is None
+    assert counters["full_width_solves"] == 1
+    rr, counters = _map(gen_SmallIR, "Sub", 8, trust_small_unsat=True)
+    assert rr is None
+    assert "full_width_solves" not in counters
+
+
+def test_lift_rule_candidates():
+    small = ArchMapper(gen_PE(4)).process_ir_instruction(gen_ConstIR(4).instructions["Neg1"]).solve()
+    rules = list(lift_rule(small, gen_ConstIR(8).instructions["Neg1"], gen_PE(8), 4, 8))
+    #Zero and sign extension of 0xF
+    assert len(rules) == 2
+    assert [rr.verify() is None for rr in rules] == [False, True]
@@ -1,3 +1,5 @@
+import json
+
 import pytest
 
 from hwtypes import Bit, BitVector
@@ -27,3 +29,18 @@ def test_rr_serialization(arch_fc):
         assert rewrite_rule.ibinding == new_rewrite_rule.ibinding
         assert rewrite_rule.obinding == new_rewrite_rule.obinding
 
+
+
+@pytest.mark.parametrize('arch_fc', [PE_fc_s, PE_fc_t])
+def test_rr_serialization_portable(arch_fc):
+    IR = gen_SmallIR(8)
+    arch_mapper = ArchMapper(arch_fc)
+    for ir_name in ('Add', 'Nor'):
+        ir_fc = IR.instructions[ir_name]
+        ir_mapper = arch_mapper.process_ir_instruction(ir_fc)
+        rewrite_rule = ir_mapper.solve('z3', external_loop=True)
+        assert rewrite_rule is not None
+        serialized_bindings = json.loads(json.dumps(rewrite_rule.serialize_bindings(portable=True)))
+        new_rewrite_rule = read_serialized_bindings(serialized_bindings, ir_fc, arch_fc)
+        assert rewrite_rule.ibinding == new_rewrite_rule.ibinding
+        assert rewrite_rule.obinding == new_rewrite_rule.obinding
@@ -0,0 +1,117 @@
+import pytest
+
+import peak.mapper.cache
+
+from peak import family_closure, Peak, name_outputs
+from peak.mapper import ArchMapper, RuleCache, fingerprint
+from peak.mapper.cache import rule_key
+from peak.mapper.index_var import OneHot, Binary
+
+from examples.smallir import gen_SmallIR
+from examples.sum_pe.sim import PE_fc as PE_fc_s
+from examples.tagged_pe.sim import PE_fc as PE_fc_t
+
+
+def test_cache_hit(tmp_path):
+    IR = gen_SmallIR(8)
+    cache = RuleCache(tmp_path)
+    arch_mapper = ArchMapper(PE_fc_t)
+    rules = {}
+    for ir_name in ('Add', 'Mul'):
+        ir_fc = IR.instructions[ir_name]
+        ir_mapper = arch_mapper.process_ir_instruction(ir_fc)
+        rules[ir_name] = ir_mapper.solve('z3', external_loop=True, cache=cache)
+    assert cache.stats.misses == 2
+    assert cache.stats.stores == 2
+    assert rules['Mul'] is None
+
+    #A new cache object reading the same directory
+    cache = RuleCache(tmp_path)
+    arch_mapper = ArchMapper(PE_fc_t)
+    for ir_name, rr in rules.items():
+        ir_fc = IR.instructions[ir_name]
+        ir_mapper = arch_mapper.process_ir_instruction(ir_fc)
+        cached_rr = ir_mapper.solve('z3', external_loop=True, cache=cache)
+        if rr is None:
+            assert cached_rr is None
+        else:
+            assert cached_rr.ibinding == rr.ibinding
+            assert cached_rr.obinding == rr.obinding
+            assert cached_rr.verify() is None
+    assert cache.stats.hits == 2
+    assert cache.stats.misses == 0
+    assert cache.stats.stores == 0
+
+
+def test_key():
+    IR8 = gen_SmallIR(8)
+    IR16 = gen_SmallIR(16)
+    arch_mapper = ArchMapper(PE_fc_t)
+    def key(ir_fc, arch_mapper=arch_mapper, simple_formula=False, solver_name='z3'):
+        ir_mapper = arch_mapper.process_ir_instruction(ir_fc, simple_formula)
+        return rule_key(ir_mapper, solver_name)
+
+    add_key = key(IR8.instructions['Add'])
+    assert add_key == key(gen_SmallIR(8).instructions['Add'])
+    assert add_key != key(IR8.instructions['Sub'])
+    assert add_key != key(IR16.instructions['Add'])
+    assert add_key != key(IR8.instructions['Add'], simple_formula=True)
+    assert add_key != key(IR8.instructions['Add'], solver_name='cvc4')
+    assert add_key != key(IR8.instructions['Add'], arch_mapper=ArchMapper(PE_fc_t, IVar=Binary))
+    assert add_key != key(IR8.instructions['Add'], arch_mapper=ArchMapper(PE_fc_s))
+
+
+#Changes to the libraries are not hashed, their versions are
+def test_version_miss(tmp_path, monkeypatch):
+    ir_fc = gen_SmallIR(8).instructions['Add']
+    cache = RuleCache(tmp_path)
+    arch_mapper = ArchMapper(PE_fc_t)
+    def solve():
+        return arch_mapper.process_ir_instruction(ir_fc).solve('z3', external_loop=True, cache=cache)
+    assert solve() is not None
+    assert solve() is not None
+    assert (cache.stats.misses, cache.stats.hits) == (1, 1)
+
+    monkeypatch.setattr(peak.mapper.cache, "CACHE_FORMAT_VERSION", peak.mapper.cache.CACHE_FORMAT_VERSION + 1)
+    assert solve() is not None
+    assert (cache.stats.misses, cache.stats.hits) == (2, 1)
+
+    versions = dict(peak.mapper.cache.library_versions()[1])
+    versions["hwtypes"] = "0.0.0"
+    monkeypatch.setattr(peak.mapper.cache, "library_versions", lambda: (0, tuple(versions.items())))
+    assert solve() is not None
+    assert (cache.stats.misses, cache.stats.hits) == (3, 1)
+
+
+def test_fingerprint_closure():
+    def make(k):
+        @family_closure
+        def ir_fc(family):
+            Data = family.BitVector[8]
+            @family.assemble(locals(), globals())
+            class IR(Peak):
+                @name_outputs(out=Data)
+                def __call__(self, a: Data) -> Data:
+                    return a + k
+            return IR
+        return ir_fc
+    assert fingerprint(make(1)) == fingerprint(make(1))
+    assert fingerprint(make(1)) != fingerprint(make(2))
+
+
+def test_eviction(tmp_path):
+    IR = gen_SmallIR(8)
+    cache = RuleCache(tmp_path, max_entries=2)
+    arch_mapper = ArchMapper(PE_fc_t)
+    keys = []
+    for ir_name in ('Add', 'Sub', 'And'):
+        ir_mapper = arch_mapper.process_ir_instruction(IR.instructions[ir_name])
+        ir_mapper.solve('z3', external_loop=True, cache=cache)
+        keys.append(cache.key(ir_mapper, 'z3'))
+        #Touch the first entry so it is the most recently used
+        cache.get(keys[0], ir_mapper.peak_fc, PE_fc_t)
+    assert len(cache) == 2
+    assert cache.stats.evictions == 1
+    assert keys[0] in cache
+    assert keys[1] not in cache
+    assert keys[2] in cache
@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+from peak.mapper import ArchMapper, RuleDatabase, type_signature
+from examples.smallir import gen_SmallIR
+from examples.tagged_pe.sim import PE_fc
+
+
+@pytest.fixture(scope="module")
+def rules():
+    am = ArchMapper(PE_fc)
+    ir = gen_SmallIR(8)
+    rules = {}
+    for name in ("Add", "Sub", "And", "Or"):
+        rr = am.process_ir_instruction(ir.instructions[name]).solve('z3', external_loop=True)
+        assert rr is not None
+        rules[name] = rr
+    return rules
+
+
+def test_round_trip(rules, tmp_path):
+    ir = gen_SmallIR(8)
+    with RuleDatabase(tmp_path) as db:
+        for name, rr in rules.items():
+            db.append(name, rr)
+        assert len(db) == len(rules)
+
+    with RuleDatabase(tmp_path, readonly=True) as db:
+        assert sorted(db.names()) == sorted(rules)
+        #Every smallir binary op has the same signature
+        sig = type_signature(ir.instructions["Add"])
+        assert db.signatures() == [sig]
+        assert [e.name for e in db.entries(signature=sig)] == list(rules)
+        assert db.entries(name="Add", signature="()->()") == []
+        assert db.num_loaded == 0
+
+        [rr] = db.rules("Sub", ir.instructions["Sub"], PE_fc)
+        assert db.num_loaded == 1
+        assert rr.serialize_bindings() == rules["Sub"].serialize_bindings()
+        assert rr.verify() is None
+        with pytest.raises(ValueError):
+            db.append("Add", rules["Add"])
+
+
+def test_append_and_refresh(rules, tmp_path):
+    ir = gen_SmallIR(8)
+    writer = RuleDatabase(tmp_path)
+    reader = RuleDatabase(tmp_path, readonly=True)
+    writer.append("Add", rules["Add"])
+    assert len(reader) == 0
+    reader.refresh()
+    assert [e.name for e in reader.entries()] == ["Add"]
+    #Several rules for one instruction
+    writer.append("Add", rules["Add"])
+    writer.append("Or", rules["Or"])
+    reader.refresh()
+    assert len(reader.entries(name="Add")) == 2
+    rr = reader.load(reader.entries(name="Or")[0], ir.instructions["Or"], PE_fc)
+    assert rr.verify() is None
+    writer.close()
+    reader.close()
+
+    #A partial index entry (interrupted append) is ignored and overwritten
+    with open(os.path.join(tmp_path, "rules.idx"), "ab") as f:
+        f.write(b"\x01\x02\x03")
+    with RuleDatabase(tmp_path) as db:
+        assert len(db) == 3
+        db.append("And", rules["And"])
+    with RuleDatabase(tmp_path, readonly=True) as db:
+        assert [e.name for e in db.entries()] == ["Add", "Add", "Or", "And"]
+        rr = db.load(db.entries(name="And")[0], ir.instructions["And"], PE_fc)
+        assert rr.verify() is None
+
+
+def test_invalid(rules, tmp_path):
+    with pytest.raises(FileNotFoundError):
+        RuleDatabase(tmp_path / "missing", readonly=True)
+    with RuleDatabase(tmp_path) as db:
+        with pytest.raises(ValueError):
+            db.append_serialized("Add", "sig", rules["Add"].serialize_bindings())
+    with open(os.path.join(tmp_path, "rules.db"), "r+b") as f:
+        f.write(b"XXXX")
+    with pytest.raises(ValueError):
+        RuleDatabase(tmp_path)
@@ -0,0 +1,93 @@
+import shutil
+import subprocess
+
+import pytest
+import pysmt.shortcuts as smt
+from pysmt.smtlib.parser import SmtLibParser
+
+from peak.mapper import ArchMapper, export_query, import_model, read_model
+
+from examples.smallir import gen_SmallIR
+from examples.sum_pe.sim import PE_fc as PE_fc_s
+from examples.tagged_pe.sim import PE_fc as PE_fc_t
+from examples.PE_lut import gen_PE
+
+
+def test_read_model():
+    assert read_model("unsat\n(error \"model is not available\")") is None
+    #get-value output
+    assert read_model("sat\n((fi #b01)\n (|a.b c| #x0f)\n (b true))") == {"fi": 1, "a.b c": 15, "b": 1}
+    #get-model output of z3 and cvc5
+    z3_model = "sat\n(model\n  (define-fun fi () (_ BitVec 2)\n    #b10)\n)"
+    cvc5_model = "sat\n(\n(define-fun fi () (_ BitVec 2) (_ bv2 2))\n)"
+    assert read_model(z3_model) == read_model(cvc5_model) == {"fi": 2}
+    with pytest.raises(ValueError):
+        read_model("unknown")
+
+
+#Runs the exported script with a pysmt solver and writes its answer the way
+#a solver binary would
+def _solve_script(fname, out_fname):
+    with open(fname) as f:
+        script = SmtLibParser().get_script(f)
+    formula = script.get_last_formula()
+    values = script.filter_by_command_name("get-value")
+    with smt.Solver("z3") as solver:
+        solver.add_assertion(formula)
+        if not solver.solve():
+            text = "unsat\n"
+        else:
+            pairs = []
+            for cmd in values:
+                for v in cmd.args:
+                    pairs.append(f"(|{v.symbol_name()}| (_ bv{solver.get_value(v).constant_value()} {v.bv_width()}))")
+            text = "sat\n(" + "\n".join(pairs) + ")\n"
+    with open(out_fname, "w") as f:
+        f.write(text)
+
+
+@pytest.mark.parametrize('arch_fc', [PE_fc_s, PE_fc_t])
+@pytest.mark.parametrize('simple_formula', [False, True])
+def test_export_import(arch_fc, simple_formula, tmp_path):
+    IR = gen_SmallIR(8)
+    arch_mapper = ArchMapper(arch_fc)
+    for name in ("Add", "Mul", "Sub", "Not"):
+        ir_fc = IR.instructions[name]
+        ir_mapper = arch_mapper.process_ir_instruction(ir_fc, simple_formula=simple_formula)
+        expected = ir_mapper.solve('z3')
+        if not ir_mapper.has_bindings:
+            continue
+        fname = str(tmp_path / f"{name}.smt2")
+        export_query(ir_mapper, fname)
+        _solve_script(fname, fname + ".out")
+        rr = import_model(fname + ".out", fname + ".json", ir_fc, arch_fc)
+        assert (rr is None) == (expected is None)
+        if rr is not None:
+            assert rr.verify() is None
+
+
+def test_wrong_fc(tmp_path):
+    IR = gen_SmallIR(8)
+    ir_mapper = ArchMapper(PE_fc_t).process_ir_instruction(IR.instructions["Add"])
+    fname = str(tmp_path / "q.smt2")
+    export_query(ir_mapper, fname)
+    _solve_script(fname, fname + ".out")
+    with pytest.raises(ValueError):
+        import_model(fname + ".out", fname + ".json", IR.instructions["Sub"], PE_fc_t)
+
+
+@pytest.mark.skipif(shutil.which("z3") is None, reason="needs the z3 binary")
+@pytest.mark.parametrize('quantifier_free', [False, True])
+def test_z3_binary(quantifier_free, tmp_path):
+    IR = gen_SmallIR(2)
+    arch_fc = gen_PE(2)
+    ir_fc = IR.instructions["Add"]
+    ir_mapper = ArchMapper(arch_fc).process_ir_instruction(ir_fc)
+    fname = str(tmp_path / "q.smt2")
+    export_query(ir_mapper, fname, quantifier_free=quantifier_free)
+    out = subprocess.run(["z3", fname], capture_output=True, text=True, timeout=600).stdout
+    with open(fname + ".out", "w") as f:
+        f.write(out)
+    rr = import_model(fname + ".out", fname + ".json", ir_fc, arch_fc)
+    assert rr is not None
+    assert rr.verify() is None
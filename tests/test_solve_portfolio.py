@@ -0,0 +1,51 @@
+import pytest
+
+from peak.mapper import ArchMapper
+
+from examples.smallir import gen_SmallIR
+from examples.sum_pe.sim import PE_fc
+
+
+CONFIGS = [
+    dict(solver_name='z3', external_loop=True),
+    dict(solver_name='z3', external_loop=False),
+]
+
+@pytest.fixture(scope="module")
+def arch_mapper():
+    return ArchMapper(PE_fc)
+
+
+@pytest.mark.parametrize("ir_name, expect_found", [("Add", True), ("Nor", True), ("Mul", False)])
+def test_portfolio(arch_mapper, ir_name, expect_found):
+    IR = gen_SmallIR(8)
+    ir_mapper = arch_mapper.process_ir_instruction(IR.instructions[ir_name], simple_formula=True)
+    rr, config, times = ir_mapper.solve_portfolio(CONFIGS, timeout=60)
+    assert config in CONFIGS
+    assert times[CONFIGS.index(config)] is not None
+    assert (rr is not None) == expect_found
+    if rr is not None:
+        assert rr.verify() is None
+
+
+def test_portfolio_failures(arch_mapper):
+    IR = gen_SmallIR(8)
+    ir_mapper = arch_mapper.process_ir_instruction(IR.instructions["Add"], simple_formula=True)
+    bad = dict(solver_name='not_a_solver', external_loop=True)
+    rr, config, _ = ir_mapper.solve_portfolio([bad, CONFIGS[0]])
+    assert rr is not None
+    assert config == CONFIGS[0]
+
+    with pytest.raises(RuntimeError):
+        ir_mapper.solve_portfolio([bad])
+    with pytest.raises(ValueError):
+        ir_mapper.solve_portfolio([dict(solver='z3')])
+
+
+def test_portfolio_timeout(arch_mapper):
+    IR = gen_SmallIR(8)
+    ir_mapper = arch_mapper.process_ir_instruction(IR.instructions["Add"], simple_formula=True)
+    rr, config, times = ir_mapper.solve_portfolio(CONFIGS, timeout=0)
+    assert rr is None
+    assert config is None
+    assert times == [None, None]
@@ -0,0 +1,47 @@
+import pytest
+
+from peak.mapper import ArchMapper, RewriteRule, RuleVerifier, verify_all
+from examples.sum_pe.sim import PE_fc as sum_pe_fc
+from examples.tagged_pe.sim import PE_fc as tagged_pe_fc
+from examples.smallir import gen_SmallIR
+
+
+@pytest.fixture(scope="module")
+def rules():
+    ir = gen_SmallIR(8)
+    rules = []
+    for arch_fc in (sum_pe_fc, tagged_pe_fc):
+        arch_mapper = ArchMapper(arch_fc)
+        for name in ("Add", "Sub", "And", "Or"):
+            ir_mapper = arch_mapper.process_ir_instruction(ir.instructions[name], simple_formula=True)
+            rr = ir_mapper.solve('z3', external_loop=True)
+            assert rr is not None
+            rules.append(rr)
+    #Add is not Sub
+    add = rules[0]
+    rules.append(RewriteRule(add.ibinding, add.obinding, ir.instructions["Sub"], add.arch_fc))
+    return rules
+
+
+def _check(rules, ces):
+    assert len(ces) == len(rules)
+    assert all(ce is None for ce in ces[:-1])
+    ir_ce, arch_ce = ces[-1]
+    expected_ir, expected_arch = rules[-1].verify()
+    assert set(ir_ce) == set(expected_ir)
+    assert set(arch_ce) == set(expected_arch)
+    #The counterexample is one
+    in0, in1 = ir_ce[("in0",)], ir_ce[("in1",)]
+    assert in0 + in1 != in0 - in1
+
+
+def test_rule_verifier(rules):
+    with RuleVerifier() as verifier:
+        _check(rules, verifier.verify_all(rules))
+        #2 archs and 4 instructions
+        assert len(verifier._executed) == 6
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_verify_all(rules, workers):
+    _check(rules, verify_all(rules, workers=workers))